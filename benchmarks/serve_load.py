@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Load test for `main.py --serve`: concurrent uploads against a local server.
+
+Start the server first, e.g.:
+
+    ./main.py -c examples/config.yaml --serve
+
+then run:
+
+    benchmarks/serve_load.py --account BMO_Chequing --file examples/BMO_Chequing.csv
+
+Reports throughput and latency percentiles, exits with status 1 if any
+request fails.
+"""
+import argparse
+import concurrent.futures
+import pathlib
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+
+ROOT_DIR = pathlib.Path(__file__).absolute().parent.parent
+DEFAULT_URL = 'http://127.0.0.1:8765/aggregate'
+DEFAULT_ACCOUNT = 'BMO_Chequing'
+DEFAULT_FILE = ROOT_DIR / 'examples' / 'BMO_Chequing.csv'
+
+
+def build_multipart(files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for file in files:
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{file.name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'))
+        parts.append(file.read_bytes())
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+
+def send_request(url, content_type, body):
+    request = urllib.request.Request(
+        url, data=body, method='POST', headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        status = exc.code
+    return time.perf_counter() - start, status
+
+
+def percentile(sorted_values, pct):
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--account', default=DEFAULT_ACCOUNT)
+    parser.add_argument('--file', action='append', type=pathlib.Path,
+                        help=f'bill file to upload, repeatable (default: {DEFAULT_FILE})')
+    parser.add_argument('--format', default='json', choices=['json', 'xlsx', 'csv'])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    url = args.url + '?' + urllib.parse.urlencode({'account': args.account, 'format': args.format})
+    content_type, body = build_multipart(args.file or [DEFAULT_FILE])
+
+    send_request(url, content_type, body)    # warm up
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(send_request, url, content_type, body)
+                   for _ in range(args.requests)]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    failures = [status for _, status in results if status != 200]
+    print(f'{args.requests} requests, concurrency {args.concurrency}, {elapsed:.2f}s')
+    print(f'throughput: {args.requests / elapsed:.1f} req/s')
+    for pct in [50, 90, 99]:
+        print(f'p{pct}: {percentile(latencies, pct) * 1000:.1f}ms')
+    print(f'max: {latencies[-1] * 1000:.1f}ms')
+    if failures:
+        print(f'failed: {len(failures)} (status {sorted(set(failures))})')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Benchmark CLI startup with `main.py --validate`, and keep it under a budget.
+
+Checks that no extraction/export library is imported while validating,
+and that the best wall time of several runs stays within --budget-ms.
+Exits with status 1 if either check fails (usable in CI).
+"""
+import argparse
+import pathlib
+import re
+import subprocess
+import sys
+import time
+
+
+ROOT_DIR = pathlib.Path(__file__).absolute().parent.parent
+DEFAULT_CONFIG = ROOT_DIR / 'examples' / 'config.yaml'
+HEAVY_MODULES = [
+    'xlrd', 'xlsxwriter', 'dateutil', 'charset_normalizer', 'colorama', 'asyncio',
+]
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def run_validate(config, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += [str(ROOT_DIR / 'main.py'), '--validate', '-c', str(config)]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, proc.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--conf', default=DEFAULT_CONFIG)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=150)
+    args = parser.parse_args()
+
+    best = min(run_validate(args.conf)[0] for _ in range(args.runs))
+
+    _, stderr = run_validate(args.conf, importtime=True)
+    imported = set()
+    top_level = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        imported.add(name.split('.')[0])
+        if len(match.group(3)) == 1:    # top level imports only
+            top_level.append((int(match.group(2)), name))
+    heavy = [m for m in HEAVY_MODULES if m in imported]
+
+    print(f'main.py --validate: {best*1000:.1f}ms (best of {args.runs}, budget {args.budget_ms}ms)')
+    print('slowest top level imports:')
+    for cumulative, name in sorted(top_level, reverse=True)[:5]:
+        print(f'  {cumulative/1000:8.1f}ms  {name}')
+    if heavy:
+        print(f'heavy modules imported: {", ".join(heavy)}')
+
+    if heavy or best * 1000 > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Benchmark XLS loading on a wide bank export.
+
+Compares reading every cell with sheet.row() (the previous approach) against
+XlsExtractor.load_file(), which only reads the configured columns.
+
+Requires xlwt to generate the sample file: pip3 install xlwt
+"""
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).absolute().parent.parent))
+
+import xlrd    # pylint: disable=wrong-import-position
+
+from bill_aggregator.extractors import XlsExtractor    # pylint: disable=wrong-import-position
+
+
+def generate_xls(file, rows, cols):
+    import xlwt    # pylint: disable=import-outside-toplevel
+
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet('Sheet1')
+    headers = ['Date', 'Description', 'Amount'] + [f'Column {i}' for i in range(3, cols)]
+    for col, header in enumerate(headers):
+        sheet.write(0, col, header)
+    for row in range(1, rows + 1):
+        sheet.write(row, 0, f'2023-{row % 12 + 1:02d}-{row % 28 + 1:02d}')
+        sheet.write(row, 1, f'Transaction {row}')
+        sheet.write(row, 2, (row % 1000) / 10 - 50)
+        for col in range(3, cols):
+            sheet.write(row, col, f'value {row}-{col}')
+    workbook.save(str(file))
+
+
+def load_all_cells(file):
+    sheet = xlrd.open_workbook(file).sheet_by_index(0)
+    return [[str(cell.value) for cell in sheet.row(i)] for i in range(sheet.nrows)]
+
+
+def load_used_columns(file):
+    file_conf = {
+        'has_header': True,
+        'fields': {
+            'date': {'column': 'Date'},
+            'name': {'column': 'Description'},
+            'amount': {'format': 'OneColumnWithSign', 'column': 'Amount'},
+        },
+    }
+    extractor = XlsExtractor(file=file, file_conf=file_conf)
+    extractor.load_file()
+    return extractor.rows
+
+
+def timeit(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--cols', type=int, default=45)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file = pathlib.Path(tmpdir) / 'wide.xls'
+        generate_xls(file, rows=args.rows, cols=args.cols)
+
+        all_cells = timeit(load_all_cells, file)
+        used_columns = timeit(load_used_columns, file)
+
+    print(f'{args.rows} rows x {args.cols} columns')
+    print(f'sheet.row() for all cells:   {all_cells:.3f}s')
+    print(f'XlsExtractor.load_file():    {used_columns:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Compare xlsx exports for each `cell_formats` mode of `export_config`.
+
+Exports the same generated items with the columns of examples/config.yaml,
+once per mode, then reports the export time, the size of the sheet xml and
+the number and span (in cells) of its <conditionalFormatting> rules:
+
+    benchmarks/xlsx_cell_formats.py --rows 100000
+"""
+import argparse
+import datetime
+import pathlib
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from decimal import Decimal
+
+ROOT_DIR = pathlib.Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import yaml    # pylint: disable=wrong-import-position
+
+from bill_aggregator.consts import (    # pylint: disable=wrong-import-position
+    AmountType, CellFormats, ACCT, CUR, DATE, TIME, NAME, MEMO, AMT, AMT_TYPE,
+)
+from bill_aggregator.exporters import XlsxExporter    # pylint: disable=wrong-import-position
+
+
+SHEET_XML = re.compile(r'xl/worksheets/sheet\d+\.xml')
+CONDITIONAL_FORMATTING = re.compile(rb'<conditionalFormatting sqref="([^"]+)"')
+CELL_REF = re.compile(r'([A-Z]+)(\d+)')
+
+
+def generate_rows(rows):
+    start = datetime.date(2023, 1, 1)
+    amount_types = [AmountType.OUT] * 6 + [AmountType.IN] * 3 + [AmountType.UNKNOWN]
+    for i in range(rows):
+        amount_type = amount_types[i % len(amount_types)]
+        amount = Decimal(i % 100000).scaleb(-2)
+        yield {
+            DATE: start + datetime.timedelta(days=i % 730),
+            TIME: datetime.time(i % 24, i % 60) if i % 3 else datetime.time(0),
+            ACCT: f'Account {i % 5}', NAME: f'Transaction {i}', MEMO: f'Memo {i % 97}',
+            CUR: 'CAD', AMT: -amount if amount_type == AmountType.OUT else amount,
+            AMT_TYPE: amount_type,
+        }
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def count_cells(sqref):
+    cells = 0
+    for cell_range in sqref.split():
+        (col1, row1), (col2, row2) = (CELL_REF.match(ref).groups() for ref in
+                                      (cell_range.split(':') * 2)[:2])
+        cells += (column_number(col2) - column_number(col1) + 1) * (int(row2) - int(row1) + 1)
+    return cells
+
+
+def inspect_workbook(file):
+    xml_size, rules, cells = 0, 0, 0
+    with zipfile.ZipFile(file) as archive:
+        for name in archive.namelist():
+            if not SHEET_XML.fullmatch(name):
+                continue
+            xml = archive.read(name)
+            xml_size += len(xml)
+            for sqref in CONDITIONAL_FORMATTING.findall(xml):
+                rules += 1
+                cells += count_cells(sqref.decode('ascii'))
+    return xml_size, rules, cells
+
+
+def export(rows, export_conf, workdir):
+    exporter = XlsxExporter(
+        data=generate_rows(rows), aggregation='All', export_conf=export_conf, workdir=workdir)
+    start = time.perf_counter()
+    exporter.export_bills()
+    return time.perf_counter() - start, [file for file, _ in exporter.files]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument(
+        '--config', type=pathlib.Path, default=ROOT_DIR / 'examples' / 'config.yaml',
+        help='config whose export_config is used (default: examples/config.yaml)')
+    args = parser.parse_args()
+
+    with open(args.config, encoding='utf-8') as f:
+        export_conf = yaml.safe_load(f)['export_config']
+
+    print(f'{args.rows} rows')
+    print(f'{"cell_formats":<14}{"export":>10}{"sheet xml":>14}{"rules":>8}{"cells covered":>16}')
+    for cell_formats in CellFormats.ALL:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            elapsed, files = export(
+                args.rows, {**export_conf, 'cell_formats': cell_formats}, pathlib.Path(tmpdir))
+            xml_size, rules, cells = (sum(values) for values in
+                                      zip(*(inspect_workbook(file) for file in files)))
+        print(f'{cell_formats:<14}{elapsed:>9.2f}s{xml_size:>14,}{rules:>8}{cells:>16,}')
+
+
+if __name__ == '__main__':
+    main()
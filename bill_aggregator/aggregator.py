@@ -1,29 +1,81 @@
+import copy
+import csv
+import fnmatch
+from decimal import Decimal
+
 from bill_aggregator.consts import (
-    DEFAULT_CONFIG_FILE, DEFAULT_AGG, DEFAULT_SEP_CUR_AGG, FINAL_MEMO_SEPARATOR, FILE_EXTENSIONS,
-    ACCT, CUR, MEMO, DATE, TIME,
-    ExtractLoggerScope, ExtractLoggerField, LogLevel, Color,
+    DEFAULT_CONFIG_FILE, RESULTS_DIR, QUARANTINE_FILE, PROVENANCE_FILE, FILE_EXTENSIONS,
+    DEFAULT_AGG, DEFAULT_TRANSFER_MAX_DAYS, DEFAULT_SEP_CUR_AGG, FINAL_MEMO_SEPARATOR,
+    ACCT, CUR, MEMO, DATE, TIME, AMT, BASE_AMT, FX_RATE, TRANSFER_ID, SHARD_ORIGIN,
+    SOURCE_FILE, SOURCE_SHEET,
+    Engine, FileType, TransferAction,
+    ExtractLoggerScope, ExtractLoggerField, LogLevel,
 )
 from bill_aggregator.exceptions import BillAggConfigError
-from bill_aggregator.extractors import ExtractorClsMapping
+from bill_aggregator.extractors import ExtractorClsMapping, ColumnarExtractorClsMapping
 from bill_aggregator.exporters import ExporterClsMapping
+from bill_aggregator.shard import get_bill_group_shard
+from bill_aggregator.utils import amount_util
+from bill_aggregator.utils.archive_util import ArchivedFile, is_archive, list_archived_files
 from bill_aggregator.utils.config_util import ConfigValidator
-from bill_aggregator.utils.log_util import extract_logger, ExtractLoggerContextManager
-from bill_aggregator.utils.string_util import fit_string, Align
+from bill_aggregator.utils.detect_util import BillGroupIndex
+from bill_aggregator.utils.fx_util import FxRateTable
+from bill_aggregator.utils.transfer_util import match_transfers
+from bill_aggregator.utils.log_util import (
+    extract_logger, use_extract_logger, ExtractLogger, ExtractLoggerContextManager, ConsoleLogSink,
+)
+from bill_aggregator.utils.prefetch_util import FilePrefetcher
+from bill_aggregator.utils.provenance_util import ProvenanceIndex, add_fingerprints
+from bill_aggregator.utils.spill_util import SpilledRuns, estimate_rows_size
+
+
+def sort_key(row):
+    return (row[DATE], row[TIME])
 
 
 class BillAggregator:
 
-    def __init__(self, conf, workdir, conf_file=None):
+    def __init__(self, conf, workdir, conf_file=None, files=None, log_sink=None, prefetcher=None,
+                 shard=None):
         self.conf = conf
         self.workdir = workdir
         self.conf_file = conf_file
+        self.files = files    # bill files, instead of all files in workdir
+        self.archived_files = None    # bill files in compressed files and zip archives
+        self.log_sink = log_sink if log_sink is not None else ConsoleLogSink()
+        self.extract_logger = ExtractLogger(sink=self.log_sink)
         self.bill_group_confs = self.conf['bill_groups']
         self.separate_by_currency = self.conf.get('separate_by_currency', False)
         self.export_type = self.conf['export_to']
         self.export_conf = self.conf.get('export_config', None)
+        self.since = self.conf.get('since', None)
+        self.until = self.conf.get('until', None)
+        self.conversion_conf = self.conf.get('currency_conversion', None)
+        self.fx_rate_file = None
+        self.fx_rate_table = None
+        self.transfer_conf = self.conf.get('transfer_matching', None)
+        self.amount_scales = None    # CurrencyScales if amounts are int minor units, else Decimal
+        if self.conf.get('fixed_point_amounts', False):
+            base_scale = (self.conversion_conf or {}).get('decimal_places', 2)
+            self.amount_scales = amount_util.CurrencyScales(
+                overrides=self.conf.get('currency_scales', None), base=base_scale)
+
+        self.auto_detect = self.conf.get('auto_detect', False)
+        self.bill_group_index = None
+        self.prefetch = self.conf.get('prefetch', 0)
+        self.prefetcher = prefetcher    # anything with get(file) -> PrefetchedFile
+        self.memory_budget = self.conf.get('memory_budget', None)    # MB, for extracted rows
+        self.buffered_size = 0    # estimated size of self.extracted_results (bytes)
+        self.spilled_runs = None
+        self.shard = shard    # (index, count), only extract bill groups of this shard
+        self.provenance = self.conf.get('provenance', False)
+        self.provenance_index = None
+        self.source_files = []    # [[file, sheet], ...], rows refer to it by SOURCE_FILE
+        self.source_file_ids = {}    # {(file, sheet): index in self.source_files}
 
         self.handled_files = []
         self.extracted_results = []
+        self.quarantined_rows = []    # rows dropped for data errors (on_row_error: quarantine)
         self.aggregated_results = {}
 
     def _process_final_memo(self, results, final_memo_conf):
@@ -39,6 +91,41 @@ class BillAggregator:
             row[MEMO] = memo
         return results
 
+    def _convert_currency(self, results, currency):
+        decimal_places = self.conversion_conf.get('decimal_places', 2)
+        quantum = Decimal(1).scaleb(-decimal_places)
+        missing_rows = 0
+        for row in results:
+            rate = self.fx_rate_table.get_rate(currency, row[DATE]) if currency else None
+            row[FX_RATE] = rate
+            if rate is None:
+                row[BASE_AMT] = None
+                missing_rows += 1
+            elif self.amount_scales is not None:
+                row[BASE_AMT] = amount_util.convert_minor_units(
+                    row[AMT], self.amount_scales.get(currency), rate, decimal_places)
+            else:
+                row[BASE_AMT] = (row[AMT] * rate).quantize(quantum)
+
+        # logging
+        if missing_rows:
+            extract_logger.log(
+                ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
+                value=f'No FX rate for {currency or "unknown currency"}, '
+                      f'{missing_rows} rows not converted',
+                level=LogLevel.WARN)
+        return results
+
+    def _add_provenance(self, results, account, file_name, amount_scale):
+        """Add fingerprint and source file of rows (their source sheet goes into the file table)."""
+        add_fingerprints(account, results, amount_scale=amount_scale)
+        for row in results:
+            key = (file_name, row.pop(SOURCE_SHEET, None))
+            if key not in self.source_file_ids:
+                self.source_file_ids[key] = len(self.source_files)
+                self.source_files.append(list(key))
+            row[SOURCE_FILE] = self.source_file_ids[key]
+
     def postprocess_extracted_results(self, results, account, currency, final_memo_conf):
         # add account and currency column
         for row in results:
@@ -47,15 +134,94 @@ class BillAggregator:
         # final_memo
         if final_memo_conf is not None:
             results = self._process_final_memo(results, final_memo_conf)
+        # base currency
+        if self.fx_rate_table is not None:
+            results = self._convert_currency(results, currency)
         return results
 
-    def extract_file(self, file, file_type, file_conf):
-        ExtractorCls = ExtractorClsMapping[file_type]
-        extractor = ExtractorCls(file=file, file_conf=file_conf)
+    def extract_file(self, file, file_type, file_conf, bill_group_conf=None, amount_scale=None):
+        """Extract a bill file, return (results, quarantined rows)."""
+        if file_conf.get('engine', Engine.DEFAULT) == Engine.COLUMNAR:
+            ExtractorCls = ColumnarExtractorClsMapping[file_type]
+        else:
+            ExtractorCls = ExtractorClsMapping[file_type]
+        prefetched = None
+        if self.prefetcher is not None:
+            prefetched = self.prefetcher.get(file)
+        # columns are resolved per file, so different files never share a resolved config
+        extractor = ExtractorCls(
+            file=file, file_conf=copy.deepcopy(file_conf), prefetched=prefetched,
+            since=self.since, until=self.until, amount_scale=amount_scale,
+            provenance=self.provenance)
         extractor.extract_bills()
-        return extractor.results.copy()
 
-    def extract_bill_group(self, bill_group_conf):
+        if self.bill_group_index is not None and extractor.header_row and bill_group_conf:
+            self.bill_group_index.add_header(
+                file_type=file_type,
+                delimiter=getattr(extractor, 'delimiter', None),
+                column_count=extractor.column_count,
+                header_row=extractor.header_row,
+                bill_group_conf=bill_group_conf)
+        return extractor.results.copy(), extractor.quarantined
+
+    def _get_bill_group_files(self, bill_group_conf):
+        account = bill_group_conf[ACCT]
+        file_type = bill_group_conf['file_type']
+        default_file_pattern = f'{account}*'
+        file_pattern = bill_group_conf.get('file_pattern', default_file_pattern)
+        if self.files is not None:
+            files = sorted(f for f in self.files if fnmatch.fnmatchcase(f.name, file_pattern))
+        else:
+            files = sorted(self.workdir.glob(file_pattern))
+        # file_pattern is matched against names of the bill files inside archives
+        files.extend(
+            f for f in self._get_archived_files() if fnmatch.fnmatchcase(f.name, file_pattern))
+        return [file for file in files if file.suffix.lower() in FILE_EXTENSIONS[file_type]]
+
+    def _get_input_paths(self):
+        if self.files is not None:
+            return sorted(self.files)
+        return sorted(self.workdir.glob('[!.]*'))
+
+    def _get_archived_files(self):
+        """List bill files in compressed files and zip archives (once per run)."""
+        if self.archived_files is None:
+            self.archived_files = []
+            for path in self._get_input_paths():
+                if is_archive(path) and path.is_file():
+                    self.archived_files.extend(list_archived_files(path))
+        return self.archived_files
+
+    def _in_shard(self, bill_group_conf):
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return get_bill_group_shard(bill_group_conf, count) == index
+
+    def _skip_bill_group(self, bill_group_conf):
+        """Skip a bill group of another shard, its files are not reported as unmatched."""
+        ConfigValidator.validate_bill_group_config(bill_group_conf)
+        self.handled_files.extend(self._get_bill_group_files(bill_group_conf))
+
+    def _get_prefetch_jobs(self):
+        """List all bill files in extraction order, for FilePrefetcher."""
+        jobs = []
+        for bill_group_conf in self.bill_group_confs:
+            try:
+                ConfigValidator.validate_bill_group_config(bill_group_conf)
+            except BillAggConfigError:
+                continue    # will be reported while extracting this bill group
+            if not self._in_shard(bill_group_conf):
+                continue
+            file_conf = bill_group_conf['file_config']
+            detect_encoding = (bill_group_conf['file_type'] == FileType.CSV
+                               and not file_conf.get('encoding', None))
+            for file in self._get_bill_group_files(bill_group_conf):
+                jobs.append((file, detect_encoding))
+        return jobs
+
+    def extract_bill_group(self, bill_group_conf, files=None):
+        """Extract all files of a bill group (files are found by file_pattern, if not given)."""
         if ACCT not in bill_group_conf:
             raise BillAggConfigError('Config error, no account field')
         account = bill_group_conf[ACCT]
@@ -67,29 +233,61 @@ class BillAggregator:
             file_type = bill_group_conf['file_type']
             file_conf = bill_group_conf['file_config']
             final_memo_conf = bill_group_conf.get('final_memo', None)
+            amount_scale = None
+            if self.amount_scales is not None:
+                amount_scale = self.amount_scales.get(currency or '')
 
-            default_file_pattern = f'{account}*'
-            file_pattern = bill_group_conf.get('file_pattern', default_file_pattern)
-            files = sorted(self.workdir.glob(file_pattern))
-            files = [file for file in files if file.suffix.lower() in FILE_EXTENSIONS[file_type]]
+            detected = files is not None
+            if files is None:
+                files = self._get_bill_group_files(bill_group_conf)
+            elif currency is not None and self._is_template(bill_group_conf):
+                # a template can't know the currency of the account (e.g. Paypal)
+                extract_logger.log(
+                    ExtractLoggerScope.GROUP, ExtractLoggerField.MSG,
+                    value=f'Currency {currency} assumed by template, configure to change',
+                    level=LogLevel.WARN)
 
             if not files:
                 extract_logger.log(
                     ExtractLoggerScope.GROUP, ExtractLoggerField.MSG,
                     value='No bill file found', level=LogLevel.WARN)
 
+            if self.shard is not None:
+                # for merging shards in the same order as a single run, see shard.merge_partials()
+                group_idx = self._get_bill_group_origin(bill_group_conf)
+                row_number = 0
+
             for file in files:
-                with ExtractLoggerContextManager(scope=ExtractLoggerScope.FILE, file=file.name):
-                    results = self.extract_file(
+                file_name = file.label if isinstance(file, ArchivedFile) else file.name
+                with ExtractLoggerContextManager(scope=ExtractLoggerScope.FILE, file=file_name):
+                    if detected:
+                        extract_logger.log(
+                            ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
+                            value='Bill group auto-detected by header')
+                    results, quarantined = self.extract_file(
                         file=file,
                         file_type=file_type,
-                        file_conf=file_conf)
+                        file_conf=file_conf,
+                        bill_group_conf=bill_group_conf,
+                        amount_scale=amount_scale)
+                    if self.provenance:
+                        self._add_provenance(results, account, file_name, amount_scale)
                     results = self.postprocess_extracted_results(
                         results=results,
                         account=account,
                         currency=currency,
                         final_memo_conf=final_memo_conf)
+                    if self.shard is not None:
+                        for row in results:
+                            row[SHARD_ORIGIN] = [int(detected), group_idx, row_number]
+                            row_number += 1
+                    if self.provenance_index is not None:
+                        self.provenance_index.add(results, self.source_files)
                     self.extracted_results.extend(results)
+                    if self.memory_budget is not None:
+                        self._check_memory_budget(results)
+                    for record in quarantined:
+                        self.quarantined_rows.append(dict(record, account=account, file=file_name))
 
                     # logging
                     extract_logger.log(
@@ -102,50 +300,180 @@ class BillAggregator:
 
                 self.handled_files.append(file)
 
-    def extract_bills(self):
+    def _is_template(self, bill_group_conf):
+        return self.bill_group_index is not None and any(
+            conf is bill_group_conf for conf in self.bill_group_index.templates)
+
+    def _get_bill_group_origin(self, bill_group_conf):
+        """Stable index of a bill group: its position in bill_groups, then in the templates."""
+        for idx, conf in enumerate(self.bill_group_confs):
+            if conf is bill_group_conf:
+                return idx
+        templates = self.bill_group_index.templates
+        return len(self.bill_group_confs) + next(
+            idx for idx, conf in enumerate(templates) if conf is bill_group_conf)
+
+    def _build_bill_group_index(self):
+        self.bill_group_index = BillGroupIndex()
+        self.bill_group_index.add_templates()
         for bill_group_conf in self.bill_group_confs:
-            self.extract_bill_group(bill_group_conf)
+            try:
+                ConfigValidator.validate_bill_group_config(bill_group_conf)
+            except BillAggConfigError:
+                continue
+            self.bill_group_index.add_bill_group(bill_group_conf)
+
+    def _load_fx_rate_table(self):
+        self.fx_rate_file = self.workdir / self.conversion_conf['rate_file']
+        self.fx_rate_table = FxRateTable(base_currency=self.conversion_conf['base_currency'])
+        self.fx_rate_table.load(self.fx_rate_file)
+
+    def extract_bills(self):
+        # logs of this run go to self.log_sink only
+        with use_extract_logger(self.extract_logger):
+            if self.provenance:
+                index_file = self.workdir / RESULTS_DIR / PROVENANCE_FILE
+                with ProvenanceIndex(index_file) as provenance_index:
+                    self.provenance_index = provenance_index
+                    self._extract_bills()
+                self.provenance_index = None
+            else:
+                self._extract_bills()
+
+    def _extract_bills(self):
+        if self.conversion_conf is not None:
+            self._load_fx_rate_table()
+        if self.auto_detect:
+            self._build_bill_group_index()
 
-        for path in sorted(self.workdir.glob('[!.]*')):
+        if self.prefetch and self.prefetcher is None:
+            with FilePrefetcher(jobs=self._get_prefetch_jobs(), window=self.prefetch) as prefetcher:
+                self.prefetcher = prefetcher
+                self._extract_configured_bill_groups()
+            self.prefetcher = None
+        else:
+            self._extract_configured_bill_groups()
+
+        detected_files = {}    # {id(bill_group_conf): (bill_group_conf, [file, ...])}
+        archived_files = {}    # {archive: [file, ...]}
+        for file in self._get_archived_files():
+            archived_files.setdefault(file.archive, []).append(file)
+        paths = []
+        for path in self._get_input_paths():
+            paths.extend(archived_files.get(path, [path]))
+        for path in paths:
             if path.is_dir():
                 continue
             if path in self.handled_files:
                 continue
-            if path == self.conf_file:
+            if path in [self.conf_file, self.fx_rate_file]:
                 continue
             if path.name in [DEFAULT_CONFIG_FILE, 'Readme.md']:
                 continue
 
+            if self.bill_group_index is not None:
+                bill_group_conf = self.bill_group_index.lookup(path)
+                if bill_group_conf is not None:
+                    if self._in_shard(bill_group_conf):
+                        _, paths = detected_files.setdefault(
+                            id(bill_group_conf), (bill_group_conf, []))
+                        paths.append(path)
+                    continue
+            if self.shard is not None and self.shard[0] != 1:
+                continue    # unmatched files are only reported by shard 1
+
             extract_logger.log(
                 ExtractLoggerScope.GROUP, ExtractLoggerField.ACCT, value='N/A')
             extract_logger.log(
-                ExtractLoggerScope.FILE, ExtractLoggerField.FILE, value=path.name)
+                ExtractLoggerScope.FILE, ExtractLoggerField.FILE,
+                value=path.label if isinstance(path, ArchivedFile) else path.name)
             extract_logger.log(
                 ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
                 value='No matching bill group', level=LogLevel.WARN)
             extract_logger.bill_group_ends()
 
+        for bill_group_conf, files in detected_files.values():
+            self.extract_bill_group(bill_group_conf, files=files)
+
         extract_logger.complete()
 
+    def _extract_configured_bill_groups(self):
+        for bill_group_conf in self.bill_group_confs:
+            if self._in_shard(bill_group_conf):
+                self.extract_bill_group(bill_group_conf)
+            else:
+                self._skip_bill_group(bill_group_conf)
+
+    def _check_memory_budget(self, results):
+        self.buffered_size += estimate_rows_size(results)
+        if self.buffered_size > self.memory_budget * 1024 * 1024:
+            self.spill_extracted_results()
+
+    def spill_extracted_results(self):
+        """Sort self.extracted_results by aggregation, and spill them to disk as runs."""
+        if self.spilled_runs is None:
+            self.spilled_runs = SpilledRuns()
+        groups = {}
+        for row in self.extracted_results:
+            groups.setdefault(self._get_aggregation(row), []).append(row)
+        for aggregation, rows in groups.items():
+            rows.sort(key=sort_key)    # stable sort
+            self.spilled_runs.spill(aggregation, rows)
+            self.aggregated_results.setdefault(aggregation, [])    # keep order of aggregations
+        self.extracted_results = []
+        self.buffered_size = 0
+
+    def _get_aggregation(self, row):
+        if self.separate_by_currency:
+            return row[CUR] or DEFAULT_SEP_CUR_AGG
+        else:
+            return DEFAULT_AGG
+
+    def match_transfers(self):
+        """Tag (or collapse) transfers between accounts in self.extracted_results"""
+        max_days = self.transfer_conf.get('max_days', DEFAULT_TRANSFER_MAX_DAYS)
+        action = self.transfer_conf.get('action', TransferAction.DEFAULT)
+
+        results = self.extracted_results
+        pairs = match_transfers(results, max_days=max_days)
+        pairs.sort(key=lambda pair: (results[pair[0]][DATE], pair[0]))
+        for row in results:
+            row[TRANSFER_ID] = ''
+        for n, (out_idx, in_idx) in enumerate(pairs, start=1):
+            results[out_idx][TRANSFER_ID] = f'T{n}'
+            results[in_idx][TRANSFER_ID] = f'T{n}'
+
+        if action == TransferAction.COLLAPSE:
+            inbound_idcs = {in_idx for _, in_idx in pairs}
+            self.extracted_results = [
+                row for idx, row in enumerate(results) if idx not in inbound_idcs]
+
+        # logging
+        self.log_sink.transfers_matched(len(pairs))
+
     def aggregate_bills(self):
-        def _sort_key(row):
-            return (row[DATE], row[TIME])
+        """Aggregate rows into self.aggregated_results, {aggregation: rows sorted by datetime}.
 
-        def _get_agg(row):
-            if self.separate_by_currency:
-                return row[CUR] or DEFAULT_SEP_CUR_AGG
-            else:
-                return DEFAULT_AGG
+        If rows were spilled to disk (see memory_budget), rows of an aggregation
+        are an iterator merging the spilled runs instead, which can be consumed once.
+        """
+        if self.transfer_conf is not None and self.shard is None:
+            self.match_transfers()    # in shard mode, transfers are matched while merging
 
         # aggregate by row[AGG]
         for row in self.extracted_results:
-            agg = _get_agg(row)
+            agg = self._get_aggregation(row)
             if agg not in self.aggregated_results:
                 self.aggregated_results[agg] = []
             self.aggregated_results[agg].append(row)
+        self.extracted_results = []
         # sort every aggregation
         for l in self.aggregated_results.values():
-            l.sort(key=_sort_key)    # stable sort (if same key, order is preserved)
+            l.sort(key=sort_key)    # stable sort (if same key, order is preserved)
+
+        if self.spilled_runs is not None:
+            for agg, rows in self.aggregated_results.items():
+                self.aggregated_results[agg] = self.spilled_runs.merge(agg, rows, key=sort_key)
 
         # for key, results in self.aggregated_results.items():
         #     for row in results:
@@ -153,14 +481,10 @@ class BillAggregator:
         #     print(f'{key}: {len(results)} rows')
 
     def export_bills(self):
-        # logging
-        print()
         # check export config
         ConfigValidator.validate_export_config(conf=self.conf)
         # logging
-        dest_str = fit_string('Export destination', width=30)
-        rows_str = fit_string('Items', width=5, align=Align.RIGHT)
-        print(f'{Color.HEADER}{dest_str}   {rows_str}{Color.ENDC}')
+        self.log_sink.exporting_started()
 
         # exporting
         ExporterCls = ExporterClsMapping[self.export_type]
@@ -169,8 +493,35 @@ class BillAggregator:
                 data=results,
                 aggregation=aggregation,
                 export_conf=self.export_conf,
-                workdir=self.workdir)
+                workdir=self.workdir,
+                amount_scales=self.amount_scales,
+                source_files=self.source_files)
             exporter.export_bills()
+            # logging
+            for file, row_count in exporter.files:
+                self.log_sink.file_exported(file, row_count)
+
+        if self.spilled_runs is not None:
+            self.spilled_runs.cleanup()
+        if self.quarantined_rows:
+            file = self.export_quarantined_rows()
+            # logging
+            self.log_sink.file_exported(file, len(self.quarantined_rows))
 
         # logging
-        print('Exporting completed.')
+        self.log_sink.exporting_completed()
+
+    def export_quarantined_rows(self):
+        """Write quarantined rows into the results directory, return the file."""
+        results_dir = self.workdir / RESULTS_DIR
+        results_dir.mkdir(parents=True, exist_ok=True)
+        file = results_dir / QUARANTINE_FILE
+        with open(file, 'w', encoding='utf-8', newline='') as f:
+            csvwriter = csv.writer(f)
+            csvwriter.writerow(['account', 'file', 'sheet', 'line', 'stage', 'error', 'row'])
+            for record in self.quarantined_rows:
+                csvwriter.writerow([
+                    record['account'], record['file'], record['sheet'] or '',
+                    record['line'], record['stage'], record['error'], *record['row'],
+                ])
+        return file
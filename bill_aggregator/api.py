@@ -0,0 +1,45 @@
+import os
+import pathlib
+
+from bill_aggregator.aggregator import BillAggregator
+from bill_aggregator.utils.config_util import ConfigValidator
+from bill_aggregator.utils.log_util import (    # pylint: disable=unused-import
+    BaseLogSink, ConsoleLogSink,
+)
+
+
+def aggregate(conf, paths, log_sink=None):
+    """Extract and aggregate bills, return an iterator of (aggregation, transactions).
+
+    conf: config dict (same as config.yaml)
+    paths: a bills directory, or a list of bill files
+    log_sink: a BaseLogSink receiving the logs of this run (default: logs are dropped)
+
+    Transactions are dicts of fields (date, time, account, currency, name,
+    memo, amount, amount_type...), sorted by date and time. Amounts are
+    Decimal (also with fixed_point_amounts). Nothing is printed or exported.
+    Every call is independent, calls from different threads don't share any
+    log state.
+
+        for aggregation, transactions in aggregate(conf, 'bills/'):
+            ...
+    """
+    ConfigValidator.validate_general_config(conf=conf)
+    if isinstance(paths, (str, os.PathLike)):
+        workdir = pathlib.Path(paths).absolute()
+        files = None
+    else:
+        workdir = pathlib.Path.cwd()
+        files = [pathlib.Path(p).absolute() for p in paths]
+
+    aggregator = BillAggregator(
+        conf=conf, workdir=workdir, files=files,
+        log_sink=log_sink if log_sink is not None else BaseLogSink())
+    aggregator.extract_bills()
+    aggregator.aggregate_bills()
+    amount_scales = aggregator.amount_scales
+    if amount_scales is None:
+        return iter(aggregator.aggregated_results.items())
+    return (
+        (aggregation, (amount_scales.to_decimal_amounts(row) for row in rows))
+        for aggregation, rows in aggregator.aggregated_results.items())
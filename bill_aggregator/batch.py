@@ -0,0 +1,182 @@
+import concurrent.futures
+import copy
+import multiprocessing
+import os
+import time
+
+from bill_aggregator.consts import Color
+from bill_aggregator.exceptions import BillAggBaseException, BillAggConfigError
+from bill_aggregator.utils import config_util
+from bill_aggregator.utils.log_util import BaseLogSink
+from bill_aggregator.utils.string_util import fit_string, Align
+from bill_aggregator.utils.worker_util import warm_up_worker
+
+
+class BatchStatsSink(BaseLogSink):
+    """Count files, items, warnings and errors of one client."""
+
+    def __init__(self):
+        self.files = 0
+        self.rows = 0
+        self.warn_count = 0
+        self.error_count = 0
+        self.exported_files = 0
+
+    def bill_group_logged(self, group_data):
+        for file_data in group_data['files']:
+            if file_data['file']:
+                self.files += 1
+            if file_data['rows']:
+                self.rows += file_data['rows'].value
+
+    def extracting_completed(self, warn_count, error_count):
+        self.warn_count = warn_count
+        self.error_count = error_count
+
+    def file_exported(self, file, row_count):
+        self.exported_files += 1
+
+
+class ClientStats:
+
+    def __init__(self, name, files=0, rows=0, warn_count=0, error_count=0,
+                 exported_files=0, seconds=0.0, error=None):
+        self.name = name
+        self.files = files
+        self.rows = rows
+        self.warn_count = warn_count
+        self.error_count = error_count
+        self.exported_files = exported_files
+        self.seconds = seconds
+        self.error = error    # message, if the client could not be aggregated at all
+
+
+# Configs parsed and validated in this process: {config file: (mtime_ns, conf)}
+_config_cache = {}
+
+
+def load_client_config(config_file):
+    """Load and validate a config file, once per process (reloaded if modified)."""
+    mtime_ns = config_file.stat().st_mtime_ns
+    cached = _config_cache.get(config_file, None)
+    if cached is None or cached[0] != mtime_ns:
+        conf = config_util.load_yaml_config(file=config_file)
+        config_util.ConfigValidator.validate_general_config(conf=conf)
+        cached = (mtime_ns, conf)
+        _config_cache[config_file] = cached
+    return copy.deepcopy(cached[1])
+
+
+def run_client(name, config_file, workdir):
+    """Extract, aggregate and export one client, return ClientStats."""
+    # pylint: disable=import-outside-toplevel
+    from bill_aggregator.aggregator import BillAggregator
+
+    start = time.perf_counter()
+    sink = BatchStatsSink()
+    error = None
+    try:
+        if not config_file.is_file():
+            raise BillAggConfigError(f'No such file: {config_file}')
+        if not workdir.is_dir():
+            raise BillAggConfigError(f'No such directory: {workdir}')
+        conf = load_client_config(config_file)
+        aggregator = BillAggregator(
+            conf=conf, workdir=workdir, conf_file=config_file, log_sink=sink)
+        aggregator.extract_bills()
+        aggregator.aggregate_bills()
+        aggregator.export_bills()
+    except BillAggBaseException as exc:
+        error = exc.message
+    except Exception as exc:    # pylint: disable=broad-except
+        # e.g. OSError or a YAML error, only this client fails, the batch carries on
+        error = f'{type(exc).__name__}: {" ".join(str(exc).split())}'
+    return ClientStats(
+        name=name, files=sink.files, rows=sink.rows,
+        warn_count=sink.warn_count, error_count=sink.error_count,
+        exported_files=sink.exported_files, seconds=time.perf_counter() - start, error=error)
+
+
+def load_manifest(manifest_file):
+    """Get [(name, config file, workdir), ...] from a manifest file."""
+    manifest = config_util.load_yaml_config(file=manifest_file)
+    config_util.ConfigValidator.validate_manifest(manifest)
+    base_dir = manifest_file.parent
+    clients = []
+    for entry in manifest:
+        workdir = (base_dir / entry['dir']).absolute()
+        config_file = (base_dir / entry['config']).absolute()
+        clients.append((entry.get('name', workdir.name), config_file, workdir))
+    return clients
+
+
+class BatchReport:
+    NAME_WD = 20
+    NUM_WD = 6
+    TIME_WD = 7
+    LINE_FORMAT = '{name_str}   {files_str}   {rows_str}   {time_str}   {msg_str}'
+
+    def print_header(self):
+        print(Color.HEADER + self.LINE_FORMAT.format(
+            name_str=fit_string('Client', self.NAME_WD),
+            files_str=fit_string('Files', self.NUM_WD, align=Align.RIGHT),
+            rows_str=fit_string('Items', self.NUM_WD, align=Align.RIGHT),
+            time_str=fit_string('Time', self.TIME_WD, align=Align.RIGHT),
+            msg_str='Messages') + Color.ENDC)
+
+    def print_client(self, stats):
+        if stats.error:
+            color, message = Color.ERROR, stats.error
+        elif stats.error_count or stats.warn_count:
+            color = Color.ERROR if stats.error_count else Color.WARN
+            message = (f'{stats.warn_count} warning{"" if stats.warn_count == 1 else "s"}, '
+                       f'{stats.error_count} error{"" if stats.error_count == 1 else "s"}')
+        else:
+            color, message = Color.OKWHITE, ''
+        name_str = fit_string(stats.name, self.NAME_WD, placeholder_pos=-5)
+        files_str = fit_string(str(stats.files), self.NUM_WD, align=Align.RIGHT)
+        rows_str = fit_string(str(stats.rows), self.NUM_WD, align=Align.RIGHT)
+        time_str = fit_string(f'{stats.seconds:.2f}s', self.TIME_WD, align=Align.RIGHT)
+        print(self.LINE_FORMAT.format(
+            name_str=f'{Color.OKCYAN}{name_str}{Color.ENDC}',
+            files_str=f'{Color.OKGREEN}{files_str}{Color.ENDC}',
+            rows_str=f'{Color.OKGREEN}{rows_str}{Color.ENDC}',
+            time_str=time_str,
+            msg_str=f'{color}{message}{Color.ENDC}'))
+
+    def print_summary(self, all_stats, seconds):
+        failed = sum(1 for stats in all_stats if stats.error or stats.error_count)
+        rows = sum(stats.rows for stats in all_stats)
+        message = f'Batch completed: {len(all_stats)} clients, {rows} items in {seconds:.2f}s.'
+        if failed:
+            message += f' ({Color.ERROR}{failed} failed{Color.ENDC})'
+        print(message)
+
+
+def run_batch(manifest_file, workers=None):
+    """Run all clients of a manifest in one process pool, return [ClientStats, ...].
+
+    Worker processes are reused across clients, so imports, parsed configs,
+    templates and parsed dates are shared instead of paid per client.
+    """
+    clients = load_manifest(manifest_file)
+    workers = min(workers or os.cpu_count() or 1, max(len(clients), 1))
+    report = BatchReport()
+    report.print_header()
+
+    start = time.perf_counter()
+    all_stats = []
+    if workers == 1:
+        for client in clients:
+            stats = run_client(*client)
+            report.print_client(stats)
+            all_stats.append(stats)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=warm_up_worker) as executor:
+            for stats in executor.map(run_client, *zip(*clients)):
+                report.print_client(stats)
+                all_stats.append(stats)
+    report.print_summary(all_stats, time.perf_counter() - start)
+    return all_stats
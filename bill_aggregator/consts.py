@@ -1,4 +1,4 @@
-import colorama
+import sys
 
 
 # Default inputs
@@ -8,11 +8,16 @@ DEFAULT_WORKDIR = 'bills/'
 RESULTS_DIR = 'results/'
 DEFAULT_AGG = 'RESULT'
 DEFAULT_SEP_CUR_AGG = 'NO_CURRENCY'
+QUARANTINE_FILE = 'QUARANTINE.csv'    # report of quarantined rows
+PARTIAL_FILE = 'PARTIAL_{index}_of_{count}.zip'    # partial results of a shard
+SNAPSHOT_FILE = 'SNAPSHOT.bin'    # aggregated results of the last run, for --export-only
+PROVENANCE_FILE = 'PROVENANCE.db'    # fingerprint -> source index, kept across runs
 
 # Other configs
 MIN_BILL_COLUMNS = 3
 WARN_TRIM_ROW_COUNT = 10
 FINAL_MEMO_SEPARATOR = '; '
+DEFAULT_TRANSFER_MAX_DAYS = 3
 
 
 # Common macros used across the project
@@ -29,6 +34,14 @@ NAME = 'name'
 MEMO = 'memo'
 AMT = 'amount'
 AMT_TYPE = 'amount_type'
+BASE_AMT = 'base_amount'    # amount converted into base currency
+FX_RATE = 'fx_rate'    # rate used for the conversion
+TRANSFER_ID = 'transfer_id'    # same id on both sides of an inter-account transfer
+SHARD_ORIGIN = '_shard_origin'    # [phase, bill group index, row number] of a row, in shard mode
+FINGERPRINT = 'fingerprint'    # stable id of a transaction, with provenance
+SOURCE_FILE = 'source_file'    # bill file (and sheet) of a row, as an id in the source file table
+SOURCE_SHEET = 'source_sheet'    # sheet of a row, only until it is put in the source file table
+SOURCE_LINE = 'source_line'    # line (row number for xls files) of a row in its bill file
 
 
 class FileType:
@@ -38,11 +51,63 @@ class FileType:
     ALL = [CSV, XLS]
 
 
+class Engine:
+    ROW = 'row'
+    COLUMNAR = 'columnar'
+
+    ALL = [ROW, COLUMNAR]
+    DEFAULT = ROW
+
+
+class DateLocale:
+    FR = 'fr'
+    DE = 'de'
+    ES = 'es'
+    IT = 'it'
+    NL = 'nl'
+    PT = 'pt'
+
+    ALL = [FR, DE, ES, IT, NL, PT]
+
+
+class RowErrorAction:
+    FAIL = 'fail'    # the whole file is dropped
+    QUARANTINE = 'quarantine'    # only bad rows are dropped, and reported
+
+    ALL = [FAIL, QUARANTINE]
+    DEFAULT = FAIL
+
+
+class RowErrorStage:
+    DATE = 'date'
+    AMOUNT = 'amount'
+
+
+class CsvReader:
+    TEXT = 'text'
+    MMAP = 'mmap'
+
+    ALL = [TEXT, MMAP]
+    DEFAULT = TEXT
+
+
 FILE_EXTENSIONS = {
     # lower case only
     FileType.CSV: ['.csv'],
     FileType.XLS: ['.xls'],
 }
+# bill files are read from these as streams, never unpacked to disk
+# decimal places of minor units (fixed_point_amounts), by ISO 4217 code
+DEFAULT_CURRENCY_SCALE = 2
+CURRENCY_SCALES = {
+    **dict.fromkeys(['BIF', 'CLP', 'DJF', 'GNF', 'ISK', 'JPY', 'KMF', 'KRW', 'PYG', 'RWF',
+                     'UGX', 'VND', 'VUV', 'XAF', 'XOF', 'XPF'], 0),
+    **dict.fromkeys(['BHD', 'IQD', 'JOD', 'KWD', 'LYD', 'OMR', 'TND'], 3),
+    **dict.fromkeys(['CLF', 'UYW'], 4),
+}
+
+COMPRESSED_EXTENSIONS = ['.gz']
+ARCHIVE_EXTENSIONS = ['.zip']
 
 
 class AmountFormat:
@@ -63,25 +128,60 @@ class AmountType:
     UNKNOWN = 'unknown'
 
 
+class TransferAction:
+    TAG = 'tag'    # keep both sides, with the same transfer_id
+    COLLAPSE = 'collapse'    # only keep the outbound side
+
+    ALL = [TAG, COLLAPSE]
+    DEFAULT = TAG
+
+
 class ExportType:
     XLSX = 'xlsx'
+    CSV = 'csv'
+
+    ALL = [XLSX, CSV]
+
+
+class SplitBy:
+    ROWS = 'rows'
+    YEAR = 'year'
+
+    ALL = [ROWS, YEAR]
+
+
+class SplitTo:
+    SHEETS = 'sheets'
+    FILES = 'files'
+
+    ALL = [SHEETS, FILES]
+
+
+class CellFormats:
+    CONDITIONAL = 'conditional'    # conditional formats over whole columns (also rows added later)
+    BOUNDED = 'bounded'    # conditional formats over data rows only
+    STATIC = 'static'    # formats written into cells, no conditional formats
 
-    ALL = [XLSX]
+    ALL = [CONDITIONAL, BOUNDED, STATIC]
+    DEFAULT = CONDITIONAL
 
 
 # Output and logs
-colorama.just_fix_windows_console()
+if sys.platform == 'win32':    # ANSI codes only need translating on Windows consoles
+    import colorama
+    colorama.just_fix_windows_console()
 
 
 class Color:
-    BOLD = colorama.Style.BRIGHT
-    HEADER = BOLD + colorama.Fore.MAGENTA
-    OKCYAN = colorama.Fore.CYAN
-    OKGREEN = colorama.Fore.GREEN
-    OKWHITE = colorama.Fore.WHITE
-    WARN = colorama.Fore.YELLOW
-    ERROR = colorama.Fore.RED
-    ENDC = colorama.Style.RESET_ALL
+    # ANSI codes (same as colorama.Style / colorama.Fore)
+    BOLD = '\033[1m'
+    HEADER = BOLD + '\033[35m'
+    OKCYAN = '\033[36m'
+    OKGREEN = '\033[32m'
+    OKWHITE = '\033[37m'
+    WARN = '\033[33m'
+    ERROR = '\033[31m'
+    ENDC = '\033[0m'
 
     def disable(self):
         self.BOLD = ''
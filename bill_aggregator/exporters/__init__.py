@@ -1,7 +1,9 @@
 from .xlsx_exporter import XlsxExporter
+from .csv_exporter import CsvExporter
 from bill_aggregator import consts
 
 
 ExporterClsMapping = {
     consts.ExportType.XLSX: XlsxExporter,
+    consts.ExportType.CSV: CsvExporter,
 }
@@ -0,0 +1,266 @@
+from abc import ABC, abstractmethod
+import csv
+import datetime
+import gzip
+
+from bill_aggregator.consts import (
+    AmountType, RESULTS_DIR,
+    ACCT, CUR, DATE, TIME, NAME, MEMO, AMT, AMT_TYPE, BASE_AMT, FX_RATE, TRANSFER_ID,
+    FINGERPRINT, SOURCE_FILE, SOURCE_SHEET, SOURCE_LINE,
+)
+from bill_aggregator.exceptions import BillAggConfigError
+from bill_aggregator.utils.format_util import excel_format_to_strftime
+
+
+DEFAULT_ENCODING = 'utf-8'
+DEFAULT_DELIMITER = ','
+WRITE_BUFFER_SIZE = 1024 * 1024
+DEFAULT_DATE_FORMAT = '%Y-%m-%d'
+DEFAULT_TIME_FORMAT = '%H:%M:%S'
+
+
+class BaseColumn(ABC):
+    """Abstract base class for all types of columns"""
+
+    def __init__(self, column_conf, amount_scales=None, source_files=None):
+        self.column_conf = column_conf
+        self.amount_scales = amount_scales    # CurrencyScales, if amounts are int minor units
+        self.source_files = source_files    # [[file, sheet], ...], by SOURCE_FILE of rows
+
+    @abstractmethod
+    def get_value(self, row_data):
+        pass
+
+
+class DatetimeColumn(BaseColumn):
+
+    default_format = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        style_conf = self.column_conf.get('style', {})
+        self.strftime_format = self.default_format
+        if 'number_format' in style_conf:
+            self.strftime_format = excel_format_to_strftime(style_conf['number_format'])
+
+
+class DateColumn(DatetimeColumn):
+
+    default_format = DEFAULT_DATE_FORMAT
+
+    def get_value(self, row_data):
+        return row_data[DATE].strftime(self.strftime_format)
+
+
+class TimeColumn(DatetimeColumn):
+
+    default_format = DEFAULT_TIME_FORMAT
+
+    def get_value(self, row_data):
+        if row_data[TIME] == datetime.time(0):
+            return ''
+        return row_data[TIME].strftime(self.strftime_format)
+
+
+class AccountColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return row_data[ACCT] or ''
+
+
+class NameColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return row_data[NAME] or ''
+
+
+class MemoColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return row_data[MEMO] or ''
+
+
+class CurrencyColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return row_data[CUR] or ''
+
+
+class AmountColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        if self.amount_scales is not None:
+            return self.amount_scales.format_amount(row_data)
+        return str(row_data[AMT])
+
+
+class BaseAmountColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        if row_data[BASE_AMT] is None:
+            return ''
+        if self.amount_scales is not None:
+            return self.amount_scales.format_base_amount(row_data)
+        return str(row_data[BASE_AMT])
+
+
+class FxRateColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        if row_data[FX_RATE] is None:
+            return ''
+        return str(row_data[FX_RATE])
+
+
+class AmountTypeColumn(BaseColumn):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {
+            AmountType.IN: self.column_conf['data']['inbound_value'],
+            AmountType.OUT: self.column_conf['data']['outbound_value'],
+            AmountType.UNKNOWN: self.column_conf['data']['unknown_value'],
+        }
+
+    def get_value(self, row_data):
+        return self.values.get(row_data[AMT_TYPE], '')
+
+
+class TransferIdColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return row_data[TRANSFER_ID] or ''
+
+
+class FingerprintColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return row_data.get(FINGERPRINT, None) or ''
+
+
+class SourceFileColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        file_id = row_data.get(SOURCE_FILE, None)
+        if file_id is None:
+            return ''
+        return self.source_files[file_id][0]
+
+
+class SourceSheetColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        file_id = row_data.get(SOURCE_FILE, None)
+        if file_id is None:
+            return ''
+        return self.source_files[file_id][1] or ''
+
+
+class SourceLineColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        line = row_data.get(SOURCE_LINE, None)
+        return '' if line is None else str(line)
+
+
+class EmptyColumn(BaseColumn):
+
+    def get_value(self, row_data):
+        return ''
+
+
+class CustomColumn(BaseColumn):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = self.column_conf['data']['value'] or ''
+
+    def get_value(self, row_data):
+        return self.value
+
+
+field_to_column_map = {
+    DATE: DateColumn,
+    TIME: TimeColumn,
+    ACCT: AccountColumn,
+    NAME: NameColumn,
+    MEMO: MemoColumn,
+    CUR: CurrencyColumn,
+    AMT: AmountColumn,
+    AMT_TYPE: AmountTypeColumn,
+    BASE_AMT: BaseAmountColumn,
+    FX_RATE: FxRateColumn,
+    TRANSFER_ID: TransferIdColumn,
+    FINGERPRINT: FingerprintColumn,
+    SOURCE_FILE: SourceFileColumn,
+    SOURCE_SHEET: SourceSheetColumn,
+    SOURCE_LINE: SourceLineColumn,
+}
+
+
+class CsvExporter:
+
+    def __init__(self, data, aggregation, export_conf, workdir, amount_scales=None,
+                 source_files=None):
+        self.data = data
+        self.aggregation = aggregation
+        self.export_conf = export_conf
+        self.workdir = workdir
+        self.amount_scales = amount_scales
+        self.source_files = source_files
+
+        self.compress = self.export_conf.get('gzip', False)
+        self.encoding = self.export_conf.get('encoding', DEFAULT_ENCODING)
+        self.delimiter = self.export_conf.get('delimiter', DEFAULT_DELIMITER)
+
+        self.file = None
+        self.files = []    # [(file, row_count), ...]
+        self.columns = []
+        self.row_count = 0
+
+    def _get_column_cls(self, column_conf):
+        data_conf = column_conf['data']
+        data_type = data_conf['type']
+        if data_type == 'data':
+            return field_to_column_map[data_conf['field']]
+        elif data_type == 'empty':
+            return EmptyColumn
+        elif data_type == 'custom':
+            return CustomColumn
+        else:
+            raise BillAggConfigError(f'Config error, invalid column data type: {data_type}')
+
+    def init_columns(self):
+        self.columns = []
+        for column_conf in self.export_conf['columns']:
+            ColumnCls = self._get_column_cls(column_conf)
+            self.columns.append(ColumnCls(column_conf=column_conf, amount_scales=self.amount_scales,
+                                          source_files=self.source_files))
+
+    def _open_file(self):
+        # create results_dir if not exists
+        results_dir = self.workdir / RESULTS_DIR
+        results_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.compress:
+            self.file = results_dir / f'{self.aggregation}.csv.gz'
+            return gzip.open(self.file, 'wt', encoding=self.encoding, newline='')
+        self.file = results_dir / f'{self.aggregation}.csv'
+        return open(self.file, 'w', encoding=self.encoding, newline='',
+                    buffering=WRITE_BUFFER_SIZE)
+
+    def write_data(self):
+        """Stream rows into the csv file, one row at a time."""
+        with self._open_file() as f:
+            csvwriter = csv.writer(f, delimiter=self.delimiter)
+            csvwriter.writerow([cc['header'] for cc in self.export_conf['columns']])
+
+            get_value_funcs = [column.get_value for column in self.columns]
+            for row_data in self.data:
+                csvwriter.writerow([func(row_data) for func in get_value_funcs])
+                self.row_count += 1
+        self.files.append((self.file, self.row_count))
+
+    def export_bills(self):
+        self.init_columns()
+        self.write_data()
@@ -1,18 +1,18 @@
 from abc import ABC, abstractmethod
 import datetime
 
-import xlsxwriter
-from xlsxwriter.utility import xl_rowcol_to_cell
-
 from bill_aggregator.consts import (
-    AmountType, RESULTS_DIR,
-    ACCT, CUR, DATE, TIME, NAME, MEMO, AMT, AMT_TYPE,
-    Color)
+    AmountType, SplitBy, SplitTo, CellFormats, RESULTS_DIR,
+    ACCT, CUR, DATE, TIME, NAME, MEMO, AMT, AMT_TYPE, BASE_AMT, FX_RATE, TRANSFER_ID,
+    FINGERPRINT, SOURCE_FILE, SOURCE_SHEET, SOURCE_LINE,
+)
 from bill_aggregator.exceptions import BillAggConfigError
-from bill_aggregator.utils.string_util import fit_string, Align
+from bill_aggregator.utils.lazy_import import lazy_import
+
 
+xlsxwriter = lazy_import('xlsxwriter')
 
-FONT_SIZE = 11  # This global value may be changed
+DEFAULT_FONT_SIZE = 11
 DEFAULT_TABLE_STYLE = 'Table Style Medium 2'
 LIGHT_GREEN = '#BFECC7'
 DARK_GREEN = '#005600'
@@ -21,16 +21,23 @@ DARK_RED = '#910007'
 
 HEADER_ROWS = 1
 MAX_ROW_IDX = 1048575
+MAX_DATA_ROWS = MAX_ROW_IDX + 1 - HEADER_ROWS
+MAX_SHEET_NAME_LEN = 31
 
 
 class BaseColumn(ABC):
     """Abstract base class for all types of columns"""
 
-    def __init__(self, workbook, worksheet, col_idx, column_conf):
+    def __init__(self, workbook, worksheet, col_idx, column_conf, font_size=DEFAULT_FONT_SIZE,
+                 amount_scales=None, static_formats=False, source_files=None):
         self.workbook = workbook
         self.worksheet = worksheet
         self.col_idx = col_idx
         self.column_conf = column_conf
+        self.font_size = font_size
+        self.amount_scales = amount_scales    # CurrencyScales, if amounts are int minor units
+        self.static_formats = static_formats    # formats written into cells, see CellFormats.STATIC
+        self.source_files = source_files    # [[file, sheet], ...], by SOURCE_FILE of rows
 
         self.width = None
         self.format_props = {}    # save format props for additional formats
@@ -52,7 +59,7 @@ class BaseColumn(ABC):
             self.format_props['text_wrap'] = style_conf['wrap_text']
 
         if self.format_props:
-            self.format_props['font_size'] = FONT_SIZE    # font_size may be changed
+            self.format_props['font_size'] = self.font_size
             self.format = self.workbook.add_format(self.format_props)
 
         self.worksheet.set_column(
@@ -64,7 +71,7 @@ class BaseColumn(ABC):
     def write_cell(self, row_idx, row_data):
         pass
 
-    def apply_conditional_format(self):
+    def apply_conditional_format(self, last_row_idx=MAX_ROW_IDX):
         pass
 
 
@@ -116,6 +123,7 @@ class AmountColumn(BaseColumn):
 
         self.inbound_format = None
         self.unknown_format = None
+        self.amount_type_column = None
 
     def init_style(self):
         super().init_style()
@@ -124,12 +132,41 @@ class AmountColumn(BaseColumn):
         self.inbound_format.set_bg_color(self.inbound_bg_color)
         self.inbound_format.set_font_color(self.inbound_font_color)
 
+    def init_static_formats(self, amount_type_column):
+        """Highlight unknown amount types in this column too, same as the conditional formula."""
+        self.amount_type_column = amount_type_column
+        self.unknown_format = self.workbook.add_format(self.format_props)
+        self.unknown_format.set_pattern(1)
+        self.unknown_format.set_bg_color(amount_type_column.unknown_bg_color)
+        self.unknown_format.set_font_color(amount_type_column.unknown_font_color)
+
+    def get_number(self, row_data):
+        if self.amount_scales is not None:
+            return row_data[AMT] / 10 ** self.amount_scales.get(row_data[CUR])
+        return row_data[AMT]
+
+    def get_static_format(self, row_data, number):
+        """Format of a cell, by the same rules (and precedence) as conditional formats."""
+        if self.amount_type_column is not None and self.amount_type_column.is_unknown(row_data):
+            return self.unknown_format
+        if number is not None and number > 0:
+            return self.inbound_format
+        return None
+
     def write_cell(self, row_idx, row_data):
-        self.worksheet.write_number(row_idx, self.col_idx, row_data[AMT])
+        number = self.get_number(row_data)
+        cell_format = None
+        if self.static_formats:
+            cell_format = self.get_static_format(row_data, number)
+        if number is None:
+            if cell_format is not None:
+                self.worksheet.write_blank(row_idx, self.col_idx, None, cell_format)
+            return
+        self.worksheet.write_number(row_idx, self.col_idx, number, cell_format)
 
-    def apply_conditional_format(self):
+    def apply_conditional_format(self, last_row_idx=MAX_ROW_IDX):
         self.worksheet.conditional_format(
-            HEADER_ROWS, self.col_idx, MAX_ROW_IDX, self.col_idx,
+            HEADER_ROWS, self.col_idx, last_row_idx, self.col_idx,
             options={
                 'type':     'cell',
                 'criteria': 'greater than',
@@ -138,6 +175,25 @@ class AmountColumn(BaseColumn):
             })
 
 
+class BaseAmountColumn(AmountColumn):
+    """Amount converted into base currency (empty if no FX rate)"""
+
+    def get_number(self, row_data):
+        if row_data[BASE_AMT] is None:
+            return None
+        if self.amount_scales is not None:
+            return row_data[BASE_AMT] / 10 ** self.amount_scales.base
+        return row_data[BASE_AMT]
+
+
+class FxRateColumn(BaseColumn):
+
+    def write_cell(self, row_idx, row_data):
+        if row_data[FX_RATE] is None:
+            return
+        self.worksheet.write_number(row_idx, self.col_idx, row_data[FX_RATE])
+
+
 class AmountTypeColumn(BaseColumn):
 
     def __init__(self, *args, **kwargs):
@@ -158,17 +214,30 @@ class AmountTypeColumn(BaseColumn):
         self.unknown_format.set_bg_color(self.unknown_bg_color)
         self.unknown_format.set_font_color(self.unknown_font_color)
 
-    def write_cell(self, row_idx, row_data):
+    def get_value(self, row_data):
         if row_data[AMT_TYPE] == AmountType.IN:
-            self.worksheet.write(row_idx, self.col_idx, self.inbound_value)
+            return self.inbound_value
         elif row_data[AMT_TYPE] == AmountType.OUT:
-            self.worksheet.write(row_idx, self.col_idx, self.outbound_value)
+            return self.outbound_value
         elif row_data[AMT_TYPE] == AmountType.UNKNOWN:
-            self.worksheet.write(row_idx, self.col_idx, self.unknown_value)
+            return self.unknown_value
+        return None
 
-    def apply_conditional_format(self):
+    def is_unknown(self, row_data):
+        return self.get_value(row_data) == self.unknown_value
+
+    def write_cell(self, row_idx, row_data):
+        value = self.get_value(row_data)
+        if value is None:
+            return
+        cell_format = None
+        if self.static_formats and value == self.unknown_value:
+            cell_format = self.unknown_format
+        self.worksheet.write(row_idx, self.col_idx, value, cell_format)
+
+    def apply_conditional_format(self, last_row_idx=MAX_ROW_IDX):
         self.worksheet.conditional_format(
-            HEADER_ROWS, self.col_idx, MAX_ROW_IDX, self.col_idx,
+            HEADER_ROWS, self.col_idx, last_row_idx, self.col_idx,
             options={
                 'type':     'cell',
                 'criteria': 'equal to',
@@ -178,6 +247,42 @@ class AmountTypeColumn(BaseColumn):
 
 
 
+class TransferIdColumn(BaseColumn):
+
+    def write_cell(self, row_idx, row_data):
+        self.worksheet.write(row_idx, self.col_idx, row_data[TRANSFER_ID] or '')
+
+
+class FingerprintColumn(BaseColumn):
+
+    def write_cell(self, row_idx, row_data):
+        self.worksheet.write(row_idx, self.col_idx, row_data.get(FINGERPRINT, None) or '')
+
+
+class SourceFileColumn(BaseColumn):
+
+    def write_cell(self, row_idx, row_data):
+        file_id = row_data.get(SOURCE_FILE, None)
+        if file_id is not None:
+            self.worksheet.write(row_idx, self.col_idx, self.source_files[file_id][0])
+
+
+class SourceSheetColumn(BaseColumn):
+
+    def write_cell(self, row_idx, row_data):
+        file_id = row_data.get(SOURCE_FILE, None)
+        if file_id is not None:
+            self.worksheet.write(row_idx, self.col_idx, self.source_files[file_id][1] or '')
+
+
+class SourceLineColumn(BaseColumn):
+
+    def write_cell(self, row_idx, row_data):
+        line = row_data.get(SOURCE_LINE, None)
+        if line is not None:
+            self.worksheet.write_number(row_idx, self.col_idx, line)
+
+
 class EmptyColumn(BaseColumn):
 
     def write_cell(self, row_idx, row_data):
@@ -203,22 +308,44 @@ field_to_column_map = {
     CUR: CurrencyColumn,
     AMT: AmountColumn,
     AMT_TYPE: AmountTypeColumn,
+    BASE_AMT: BaseAmountColumn,
+    FX_RATE: FxRateColumn,
+    TRANSFER_ID: TransferIdColumn,
+    FINGERPRINT: FingerprintColumn,
+    SOURCE_FILE: SourceFileColumn,
+    SOURCE_SHEET: SourceSheetColumn,
+    SOURCE_LINE: SourceLineColumn,
 }
 
 
 class XlsxExporter:
 
-    def __init__(self, data, aggregation, export_conf, workdir):
+    def __init__(self, data, aggregation, export_conf, workdir, amount_scales=None,
+                 source_files=None):
         self.data = data
         self.aggregation = aggregation
         self.export_conf = export_conf
         self.workdir = workdir
+        self.amount_scales = amount_scales
+        self.source_files = source_files
 
+        self.split_by = self.export_conf.get('split_by', SplitBy.ROWS)
+        self.split_to = self.export_conf.get('split_to', SplitTo.SHEETS)
+        self.max_rows = min(self.export_conf.get('max_rows', MAX_DATA_ROWS), MAX_DATA_ROWS)
+        self.font_size = self.export_conf.get('font_size', DEFAULT_FONT_SIZE)
+        self.cell_formats = self.export_conf.get('cell_formats', CellFormats.DEFAULT)
+
+        self.results_dir = None
         self.file = None
+        self.files = []    # [(file, row_count), ...]
         self.workbook = None
         self.worksheet = None
         self.columns = []
 
+        self.partition_key = None
+        self.partition_rows = 0
+        self.workbook_rows = 0
+
     def _get_column_cls(self, column_conf):
         data_conf = column_conf['data']
         data_type = data_conf['type']
@@ -231,24 +358,35 @@ class XlsxExporter:
         else:
             raise BillAggConfigError(f'Config error, invalid column data type: {data_type}')
 
-    def init_workbook(self):
-        nrows = len(self.data) + HEADER_ROWS
-        ncols = len(self.export_conf['columns'])
-
+    def _get_partition_suffix(self, partition_key):
+        """Suffix for sheet/file names, e.g. "", "_2", "_2023", "_2023_2"."""
+        year, chunk = partition_key
+        suffix = ''
+        if year is not None:
+            suffix += f'_{year}'
+        if chunk > 0:
+            suffix += f'_{chunk+1}'
+        return suffix
+
+    def init_workbook(self, suffix=''):
         # create results_dir if not exists
-        results_dir = self.workdir / RESULTS_DIR
-        results_dir.mkdir(parents=True, exist_ok=True)
+        self.results_dir = self.workdir / RESULTS_DIR
+        self.results_dir.mkdir(parents=True, exist_ok=True)
 
-        # create excel file
-        self.file = results_dir / f'{self.aggregation}.xlsx'
+        # create excel file, not in constant_memory mode since it doesn't support tables,
+        # the workbook is held in memory until saved (see split_to)
+        self.file = self.results_dir / f'{self.aggregation}{suffix}.xlsx'
         self.workbook = xlsxwriter.Workbook(self.file)
-        self.worksheet = self.workbook.add_worksheet(name=self.aggregation)
+        self.workbook_rows = 0
 
         # set default font size
         if 'font_size' in self.export_conf:
-            global FONT_SIZE
-            FONT_SIZE = self.export_conf['font_size']
-            self.workbook.formats[0].set_font_size(FONT_SIZE)
+            self.workbook.formats[0].set_font_size(self.font_size)
+
+    def init_worksheet(self, suffix=''):
+        sheet_name = self.aggregation[:MAX_SHEET_NAME_LEN-len(suffix)] + suffix
+        self.worksheet = self.workbook.add_worksheet(name=sheet_name)
+        self.partition_rows = 0
 
         # set row height
         if 'row_height' in self.export_conf:
@@ -261,11 +399,22 @@ class XlsxExporter:
             ColumnCls = self._get_column_cls(column_conf)
             column = ColumnCls(
                 workbook=self.workbook, worksheet=self.worksheet,
-                col_idx=col_idx, column_conf=column_conf)
+                col_idx=col_idx, column_conf=column_conf, font_size=self.font_size,
+                amount_scales=self.amount_scales,
+                static_formats=self.cell_formats == CellFormats.STATIC,
+                source_files=self.source_files)
             self.columns.append(column)
         # set all column styles
         for column in self.columns:
             column.init_style()
+        if self.cell_formats == CellFormats.STATIC:
+            amount_columns, amount_type_column = self._get_amount_columns()
+            for amount_column in amount_columns:
+                amount_column.init_static_formats(amount_type_column)
+
+    def add_table(self):
+        nrows = self.partition_rows + HEADER_ROWS
+        ncols = len(self.export_conf['columns'])
 
         # create table
         table_style = self.export_conf.get('table_style', DEFAULT_TABLE_STYLE)
@@ -278,51 +427,98 @@ class XlsxExporter:
                 'columns': [{'header': cc['header']} for cc in self.export_conf['columns']],
             })
 
+    def open_partition(self, partition_key):
+        suffix = self._get_partition_suffix(partition_key)
+        if self.workbook is None:
+            self.init_workbook(suffix=suffix if self.split_to == SplitTo.FILES else '')
+        self.init_worksheet(suffix=suffix)
+        self.partition_key = partition_key
+
+    def close_partition(self):
+        self.add_table()
+        self.apply_conditional_format()
+        self.workbook_rows += self.partition_rows
+        if self.split_to == SplitTo.FILES:
+            self.save_workbook()
+
     def write_data(self):
-        for i, row_data in enumerate(self.data):
-            row_idx = i + HEADER_ROWS
+        """Stream rows into worksheets, opening a new partition when needed.
+
+        Partitions are split by year (if configured) and by the row cap,
+        each one gets its own table and conditional formats.
+        """
+        chunk = 0
+        for row_data in self.data:
+            year = row_data[DATE].year if self.split_by == SplitBy.YEAR else None
+            if self.partition_key is None:
+                self.open_partition((year, 0))
+            elif year != self.partition_key[0]:
+                chunk = 0
+                self.close_partition()
+                self.open_partition((year, chunk))
+            elif self.partition_rows >= self.max_rows:
+                chunk += 1
+                self.close_partition()
+                self.open_partition((year, chunk))
+
+            row_idx = self.partition_rows + HEADER_ROWS
             for column in self.columns:
                 column.write_cell(row_idx, row_data)
+            self.partition_rows += 1
 
-    def apply_conditional_format(self):
-        # first apply multi-column formats, so they will take precedence
-        amount_column = None
+        if self.partition_key is None:
+            self.open_partition((None, 0))    # no data, export an empty table
+        self.close_partition()
+        if self.split_to == SplitTo.SHEETS:
+            self.save_workbook()
+
+    def _get_amount_columns(self):
+        """Get (amount columns, amount type column)."""
+        amount_columns = []
         amount_type_column = None
         for column in self.columns:
             if isinstance(column, AmountColumn):
-                amount_column = column
+                amount_columns.append(column)
             elif isinstance(column, AmountTypeColumn):
                 amount_type_column = column
-        if (amount_column is not None) and (amount_type_column is None):
+        if amount_columns and (amount_type_column is None):
             raise BillAggConfigError(
                 'Config error, you must export "amount_type" with "amount" together '
                 '(since amount_type is sometimes unknown)'
             )
-        cell_string = xl_rowcol_to_cell(HEADER_ROWS, amount_type_column.col_idx)
-        self.worksheet.conditional_format(
-            HEADER_ROWS, amount_column.col_idx, MAX_ROW_IDX, amount_column.col_idx,
-            options={
-                'type':     'formula',
-                'criteria': f'=${cell_string}="{amount_type_column.unknown_value}"',
-                'format':   amount_type_column.unknown_format,
-            })
+        return amount_columns, amount_type_column
+
+    def apply_conditional_format(self):
+        """Apply conditional formats, over whole columns or only data rows (see CellFormats)."""
+        amount_columns, amount_type_column = self._get_amount_columns()
+        if self.cell_formats == CellFormats.STATIC:
+            return    # already written into cells
+        last_row_idx = MAX_ROW_IDX
+        if self.cell_formats == CellFormats.BOUNDED:
+            if not self.partition_rows:
+                return
+            last_row_idx = HEADER_ROWS + self.partition_rows - 1
+
+        # first apply multi-column formats, so they will take precedence
+        for amount_column in amount_columns:
+            cell_string = xlsxwriter.utility.xl_rowcol_to_cell(
+                HEADER_ROWS, amount_type_column.col_idx)
+            self.worksheet.conditional_format(
+                HEADER_ROWS, amount_column.col_idx, last_row_idx, amount_column.col_idx,
+                options={
+                    'type':     'formula',
+                    'criteria': f'=${cell_string}="{amount_type_column.unknown_value}"',
+                    'format':   amount_type_column.unknown_format,
+                })
 
         # then apply single-column formats
         for column in self.columns:
-            column.apply_conditional_format()
+            column.apply_conditional_format(last_row_idx)
 
     def save_workbook(self):
         self.workbook.close()
+        self.files.append((self.file, self.workbook_rows))
+        self.workbook = None
 
     def export_bills(self):
-        self.init_workbook()
         self.write_data()
-        self.apply_conditional_format()
-        self.save_workbook()
-
-        # logging
-        dest_str = '<bill_dir>/' + RESULTS_DIR + self.file.name
-        rows_str = str(len(self.data))
-        dest_str = fit_string(dest_str, width=30)
-        rows_str = fit_string(rows_str, width=5, align=Align.RIGHT)
-        print(f'{Color.OKCYAN}{dest_str}{Color.ENDC}   {Color.OKGREEN}{rows_str}{Color.ENDC}')
@@ -1,4 +1,5 @@
 from .tabular_extractor import CsvExtractor, XlsExtractor
+from .columnar_extractor import ColumnarCsvExtractor, ColumnarXlsExtractor
 from bill_aggregator import consts
 
 
@@ -6,3 +7,8 @@ ExtractorClsMapping = {
     consts.FileType.CSV: CsvExtractor,
     consts.FileType.XLS: XlsExtractor,
 }
+
+ColumnarExtractorClsMapping = {
+    consts.FileType.CSV: ColumnarCsvExtractor,
+    consts.FileType.XLS: ColumnarXlsExtractor,
+}
@@ -4,9 +4,15 @@ from abc import ABC, abstractmethod
 class BaseExtractor(ABC):
     """Abstract base class for all file types."""
 
-    def __init__(self, file, file_conf=None):
+    def __init__(self, file, file_conf=None, prefetched=None, since=None, until=None,
+                 amount_scale=None, provenance=False):
         self.file = file
         self.file_conf = file_conf
+        self.prefetched = prefetched    # PrefetchedFile, if content is read ahead
+        self.since = since    # datetime.date, only keep bills on or after it
+        self.until = until    # datetime.date, only keep bills on or before it
+        self.amount_scale = amount_scale    # amounts as int minor units of this scale, or Decimal
+        self.provenance = provenance    # add the source line of every row (SOURCE_LINE)
 
         self.results = []
 
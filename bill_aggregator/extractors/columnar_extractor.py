@@ -0,0 +1,359 @@
+import datetime
+
+from bill_aggregator.consts import (
+    AmountFormat, AmountType, RowErrorStage,
+    FIELDS, EXT_FIELDS, COL, FORMAT, DATE, TIME, NAME, MEMO, AMT, AMT_TYPE, SOURCE_LINE,
+    ExtractLoggerScope, ExtractLoggerField,
+)
+from bill_aggregator.exceptions import BillAggException, BillAggConfigError
+from bill_aggregator.utils import date_util
+from bill_aggregator.utils.log_util import extract_logger
+from .tabular_extractor import CsvExtractor, XlsExtractor, parse_datetime, ROW_ERRORS
+
+
+# Candidate formats for date inference, only used after being verified against dateutil
+# (no 2-digit years, the century of strptime differs from dateutil, e.g. 1970 vs 2070 for "70")
+DATETIME_FORMATS = [
+    '%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d',
+    '%m/%d/%Y', '%d/%m/%Y', '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y',
+    '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y', '%d-%b-%Y',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M',
+    '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+]
+FORMAT_VERIFY_SAMPLES = 20
+
+
+def map_column(func, column):
+    """Apply func to a column, evaluating it only once per distinct value."""
+    cache = {}
+    for value in column:
+        if value not in cache:
+            cache[value] = func(value)
+    return [cache[value] for value in column]
+
+
+class RowError:
+    """Placeholder for a value that failed to convert (with quarantine)."""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class ColumnarExtractorMixin:
+    """Column oriented processing for TabularExtractor.
+
+    Instead of looping over rows once per field, data rows are transposed into
+    column arrays, only the columns referenced by the config are stripped and
+    converted (each distinct value once), sorting works on an index
+    permutation, and result records are materialized at the very end.
+    Output is identical to the row engine.
+    """
+
+    def prepare_data(self):
+        """Get the data in self.rows prepared for further processing"""
+        self._seperate_header_row()
+        if self.header_row:
+            self.header_row = [f.strip() for f in self.header_row]
+        self._check_and_update_config()
+
+        self.columns = [list(col) for col in zip(*self.rows)] if self.rows else []
+        self.row_count = len(self.rows)
+        self.rows = []
+        self._stripped_columns = {}
+        self._selected_rows = None    # row numbers kept by the date filter (or quarantine)
+        self._dropped_rows = set()    # rows quarantined after sorting, skipped when materializing
+
+    def _column(self, col):
+        """Get a stripped column by index (stripped lazily, once)."""
+        if col not in self._stripped_columns:
+            column = self.columns[col]
+            if self._selected_rows is not None:
+                column = [column[i] for i in self._selected_rows]
+            self._stripped_columns[col] = [f.strip() for f in column]
+        return self._stripped_columns[col]
+
+    def _select_rows(self, rows):
+        """Keep only rows (numbers of current rows), remaining columns are then
+        only stripped and converted for them."""
+        if self._selected_rows is not None:
+            rows = [self._selected_rows[i] for i in rows]
+        self._selected_rows = rows
+        self._stripped_columns = {}
+        self.row_count = len(rows)
+
+    def _map_rows(self, func, column, stage):
+        """map_column, with quarantine failing values become RowError (rows are quarantined)."""
+        if not self.quarantine:
+            return map_column(func, column)
+
+        def _func(value):
+            try:
+                return func(value)
+            except ROW_ERRORS as exc:
+                return RowError(exc)
+
+        values = map_column(_func, column)
+        for i, value in enumerate(values):
+            if isinstance(value, RowError):
+                self._quarantine_column_row(i, stage, value.exc)
+        return values
+
+    def _quarantine_column_row(self, i, stage, exc):
+        if i in self._dropped_rows:
+            return    # already quarantined (e.g. both amount columns failed)
+        row_number = self._selected_rows[i] if self._selected_rows is not None else i
+        line = self.line_numbers[row_number] if self.line_numbers is not None else None
+        fields = [column[row_number].strip() for column in self.columns]
+        self._quarantine_row(line, stage, exc, fields)
+        self._dropped_rows.add(i)
+
+    def _infer_datetime_format(self, dt_strs, parse):
+        """Find a strptime format that agrees with dateutil on sample values."""
+        samples = list(dict.fromkeys(dt_strs))[:FORMAT_VERIFY_SAMPLES]
+        try:
+            expected = [parse(s) for s in samples]
+        except ValueError:
+            return None    # leave the error to the per-value parsing
+        if not samples:
+            return None
+        # day and month are only told apart by samples with a day <= 12 (and != month),
+        # otherwise dateutil may read later values (e.g. "01/02") the other way round
+        day_month_known = any(e.day <= 12 and e.day != e.month for e in expected)
+        for fmt in DATETIME_FORMATS:
+            if '%d' in fmt and '%m' in fmt and not day_month_known:
+                continue
+            try:
+                if all(datetime.datetime.strptime(s, fmt) == e
+                       for s, e in zip(samples, expected)):
+                    return fmt
+            except ValueError:
+                continue
+        return None
+
+    def _process_date_time_columns(self):
+        date_conf = self.file_conf[FIELDS][DATE]
+        date_cols = date_conf[COL]
+        time_col = None
+        if TIME in self.file_conf[FIELDS]:
+            time_col = self.file_conf[FIELDS][TIME][COL]
+
+        dayfirst = date_conf.get('dayfirst', None)
+        yearfirst = date_conf.get('yearfirst', None)
+        locale = date_conf.get('locale', None)
+
+        # date column
+        if isinstance(date_cols, list):
+            candidates = [self._column(col) for col in date_cols]
+            date_strs = []
+            for i in range(self.row_count):
+                value = next((c[i] for c in candidates if c[i]), None)
+                if value is None:
+                    row = [self._column(col)[i] for col in range(len(self.columns))]
+                    if not self.quarantine:
+                        raise BillAggException(f'No valid date for row: {row}')
+                    value = RowError(BillAggException(f'No valid date for row: {row}'))
+                date_strs.append(value)
+        else:
+            date_strs = self._column(date_cols)
+
+        # datetime strings
+        if time_col is None:
+            dt_strs = date_strs
+        else:
+            time_strs = self._column(time_col)
+            dt_strs = [d if isinstance(d, RowError) else f'{d} {t}'
+                       for d, t in zip(date_strs, time_strs)]
+        if locale is not None:
+            # month names into English, for both the inferred format and dateutil
+            dt_strs = [d if isinstance(d, RowError) else date_util.normalize_date(d, locale)
+                       for d in dt_strs]
+
+        def _parse(dt_str):
+            return parse_datetime(dt_str, dayfirst=dayfirst, yearfirst=yearfirst)
+
+        fmt = self._infer_datetime_format(
+            [dt_str for dt_str in dt_strs if not isinstance(dt_str, RowError)], _parse)
+
+        def _parse_with_format(dt_str):
+            if isinstance(dt_str, RowError):
+                raise dt_str.exc
+            if fmt is not None:
+                try:
+                    return datetime.datetime.strptime(dt_str, fmt)
+                except ValueError:
+                    pass
+            return _parse(dt_str)
+
+        dts = self._map_rows(_parse_with_format, dt_strs, RowErrorStage.DATE)
+        if self._dropped_rows:
+            # quarantined rows are removed before sorting
+            rows = [i for i in range(self.row_count) if i not in self._dropped_rows]
+            dts = [dts[i] for i in rows]
+            self._select_rows(rows)
+            self._dropped_rows = set()
+        self.result_columns[DATE] = map_column(datetime.datetime.date, dts)
+        self.result_columns[TIME] = map_column(datetime.datetime.time, dts)
+
+    def _sort_index_by_datetime(self):
+        keys = list(zip(self.result_columns[DATE], self.result_columns[TIME]))
+        index = list(range(self.row_count))
+
+        if not keys:
+            return index
+        if keys[0] > keys[-1]:
+            index.reverse()
+        if not all(keys[index[i]] <= keys[index[i+1]] for i in range(len(index) - 1)):
+            index.sort(key=keys.__getitem__)    # stable sort (if same key, order is preserved)
+            # logging
+            extract_logger.log(
+                ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
+                value='Re-sorted by transaction date')
+        return index
+
+    def _filter_index_by_date(self, index):
+        """Keep only rows within since/until, return the new (sorted) index.
+
+        Remaining columns are then only stripped and converted for kept rows.
+        """
+        if self.since is None and self.until is None:
+            return index
+        dates = self.result_columns[DATE]
+        start, end = self._get_date_window([dates[i] for i in index])
+        index = index[start:end]
+
+        self._select_rows(index)
+        for field in [DATE, TIME]:
+            column = self.result_columns[field]
+            self.result_columns[field] = [column[i] for i in index]
+        return list(range(self.row_count))
+
+    def _process_name_column(self):
+        self.result_columns[NAME] = self._column(self.file_conf[FIELDS][NAME][COL])
+
+    def _process_memo_column(self):
+        if MEMO in self.file_conf[FIELDS]:
+            self.result_columns[MEMO] = self._column(self.file_conf[FIELDS][MEMO][COL])
+        else:
+            self.result_columns[MEMO] = [''] * self.row_count
+
+    def _process_one_col_with_idcs_amt_columns(self):
+        amt_conf = self.file_conf[FIELDS][AMT]
+        parsed = self._map_rows(
+            self.amounts.parse, self._column(amt_conf[COL]), RowErrorStage.AMOUNT)
+
+        amount_types = [AmountType.UNKNOWN] * self.row_count
+        for idc_conf in amt_conf['indicators']:
+            lookup = {idc_conf['outbound_value']: AmountType.OUT}
+            lookup[idc_conf['inbound_value']] = AmountType.IN    # inbound takes precedence
+            idc_values = self._column(idc_conf[COL])
+            for i in range(self.row_count):
+                if amount_types[i] == AmountType.UNKNOWN:
+                    amount_types[i] = lookup.get(idc_values[i], AmountType.UNKNOWN)
+
+        signs = {AmountType.IN: False, AmountType.OUT: True}
+        self.result_columns[AMT] = [
+            p if isinstance(p, RowError)
+            else self.amounts.signed(p[1], signs.get(amount_type, p[0]))
+            for p, amount_type in zip(parsed, amount_types)]
+        self.result_columns[AMT_TYPE] = amount_types
+
+    def _process_one_col_with_sign_amt_columns(self):
+        amt_conf = self.file_conf[FIELDS][AMT]
+        reverse_sign = bool(amt_conf.get('is_outbound_positive', False))
+
+        amounts = self.amounts
+
+        def _convert(value):
+            negative, amount = amounts.parse(value)
+            if negative ^ reverse_sign:
+                return amounts.signed(amount, True), AmountType.OUT
+            return amount, AmountType.IN
+
+        converted = self._map_rows(_convert, self._column(amt_conf[COL]), RowErrorStage.AMOUNT)
+        converted = [(c, None) if isinstance(c, RowError) else c for c in converted]
+        self.result_columns[AMT] = [c[0] for c in converted]
+        self.result_columns[AMT_TYPE] = [c[1] for c in converted]
+
+    def _process_two_cols_amt_columns(self):
+        amt_conf = self.file_conf[FIELDS][AMT]
+
+        amounts = self.amounts
+
+        def _convert_in(value):
+            if not value:
+                return amounts.ZERO
+            return amounts.parse(value)[1]
+
+        def _convert_out(value):
+            if not value:
+                return amounts.signed(amounts.ZERO, True)
+            return amounts.signed(amounts.parse(value)[1], True)
+
+        amt_out_strs = self._column(amt_conf['outbound'][COL])
+        amounts_in = self._map_rows(
+            _convert_in, self._column(amt_conf['inbound'][COL]), RowErrorStage.AMOUNT)
+        amounts_out = self._map_rows(_convert_out, amt_out_strs, RowErrorStage.AMOUNT)
+
+        result_amounts = []
+        result_types = []
+        for amount_in, amount_out, amt_out_str in zip(amounts_in, amounts_out, amt_out_strs):
+            if isinstance(amount_in, RowError) or isinstance(amount_out, RowError):
+                result_amounts.append(None)    # quarantined
+                result_types.append(None)
+                continue
+            amount = amount_in + amount_out
+            amount_type = AmountType.OUT if amounts.is_negative(amount) else AmountType.IN
+            if amount == 0 and amt_out_str:
+                # if outbound field exist, treat 0 as OUT (0 default to IN)
+                amount_type = AmountType.OUT
+                amount = amounts.signed(amount, True)
+            result_amounts.append(amount)
+            result_types.append(amount_type)
+        self.result_columns[AMT] = result_amounts
+        self.result_columns[AMT_TYPE] = result_types
+
+    def _process_amount_columns(self):
+        amt_format = self.file_conf[FIELDS][AMT][FORMAT]
+        if amt_format == AmountFormat.ONE_COLUMN_WITH_INDICATORS:
+            self._process_one_col_with_idcs_amt_columns()
+        elif amt_format == AmountFormat.ONE_COLUMN_WITH_SIGN:
+            self._process_one_col_with_sign_amt_columns()
+        elif amt_format == AmountFormat.TWO_COLUMNS:
+            self._process_two_cols_amt_columns()
+        else:
+            raise BillAggConfigError(f'Config Error, invalid amount format: {amt_format}')
+
+    def _process_extra_columns(self):
+        if EXT_FIELDS not in self.file_conf:
+            return
+        for field_name, field_conf in self.file_conf[EXT_FIELDS].items():
+            self.result_columns[field_name] = self._column(field_conf[COL])
+
+    def process_data(self):
+        """Process column arrays, then materialize records into self.results"""
+        self.result_columns = {}
+        self._process_date_time_columns()
+        index = self._sort_index_by_datetime()
+        index = self._filter_index_by_date(index)
+        self._process_name_column()
+        self._process_memo_column()
+        self._process_amount_columns()
+        self._process_extra_columns()
+        if self.provenance:
+            rows = self._selected_rows if self._selected_rows is not None else range(self.row_count)
+            self.result_columns[SOURCE_LINE] = [self.line_numbers[r] for r in rows]
+
+        fields = list(self.result_columns.keys())
+        columns = [self.result_columns[f] for f in fields]
+        if self._dropped_rows:
+            index = [i for i in index if i not in self._dropped_rows]
+        for i in index:
+            self.results.append({f: c[i] for f, c in zip(fields, columns)})
+
+
+class ColumnarCsvExtractor(ColumnarExtractorMixin, CsvExtractor):
+    pass
+
+
+class ColumnarXlsExtractor(ColumnarExtractorMixin, XlsExtractor):
+    pass
@@ -1,36 +1,64 @@
+import bisect
+import copy
 import csv
-from io import StringIO
+import fnmatch
+import heapq
+import mmap
+import os
+import concurrent.futures
+from io import StringIO, BytesIO, TextIOWrapper
 from abc import abstractmethod
-from functools import partial
+from functools import partial, lru_cache
 
-import xlrd
-import dateutil.parser
-import charset_normalizer
+from bill_aggregator.utils.lazy_import import lazy_import
 
 from bill_aggregator.consts import (
-    MIN_BILL_COLUMNS, AmountFormat, AmountType,
-    FIELDS, EXT_FIELDS, COL, FORMAT, DATE, TIME, NAME, MEMO, AMT, AMT_TYPE,
-    ExtractLoggerScope, ExtractLoggerField,
+    MIN_BILL_COLUMNS, AmountFormat, CsvReader, RowErrorAction, RowErrorStage,
+    FIELDS, EXT_FIELDS, COL, FORMAT, DATE, TIME, NAME, MEMO, AMT, SOURCE_SHEET, SOURCE_LINE,
+    ExtractLoggerScope, ExtractLoggerField, LogLevel,
 )
-from bill_aggregator.exceptions import BillAggException, BillAggConfigError
-from bill_aggregator.utils import amount_util
+from bill_aggregator.exceptions import BillAggBaseException, BillAggException, BillAggConfigError
+from bill_aggregator.utils import amount_util, converter_util, date_util, mmap_csv_util
+from bill_aggregator.utils.archive_util import ArchivedFile, read_bytes
 from bill_aggregator.utils.log_util import extract_logger
 from .base_extractor import BaseExtractor
 
 
+xlrd = lazy_import('xlrd')
+dateutil_parser = lazy_import('dateutil.parser')
+charset_normalizer = lazy_import('charset_normalizer')
+
 RES_COL = -1    # Column for storing temporary results
+SHEETS_ALL = 'all'
+DATETIME_CACHE_SIZE = 65536
+ROW_ERRORS = (BillAggException, ValueError, ArithmeticError)    # errors of a single row's data
+
+
+@lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def parse_datetime(dt_str, dayfirst=None, yearfirst=None):
+    """Parse datetime string with dateutil, cached across files (and runs) in this process."""
+    return dateutil_parser.parse(dt_str, dayfirst=dayfirst, yearfirst=yearfirst)
 
 
 class TabularExtractor(BaseExtractor):
     """Abstract base class for tabular file types (e.g. csv, xls...)"""
 
-    def __init__(self, file, file_conf):
-        super().__init__(file=file, file_conf=file_conf)
+    def __init__(self, file, file_conf, prefetched=None, since=None, until=None, amount_scale=None,
+                 provenance=False):
+        super().__init__(file=file, file_conf=file_conf, prefetched=prefetched,
+                         since=since, until=until, amount_scale=amount_scale, provenance=provenance)
         self.has_header = self.file_conf['has_header']
+        self.amounts = amount_util.get_amounts(self.amount_scale)
+        self.quarantine = (self.file_conf.get('on_row_error', RowErrorAction.DEFAULT)
+                           == RowErrorAction.QUARANTINE)
+        self.track_lines = self.quarantine or self.provenance
 
         self.column_count = 0
         self.header_row = None
         self.rows = []
+        self.line_numbers = None    # source line of each row in self.rows, only if track_lines
+        self.row_lines = {}    # {id(row): line number}
+        self.quarantined = []    # [{'sheet':, 'line':, 'stage':, 'error':, 'row': [...]}, ...]
 
     @abstractmethod
     def load_file(self):
@@ -45,6 +73,8 @@ class TabularExtractor(BaseExtractor):
             raise BillAggException('Cannot find header: no valid rows')
         self.header_row = self.rows[0]
         self.rows = self.rows[1:]
+        if self.line_numbers is not None:
+            self.line_numbers = self.line_numbers[1:]
 
     def _strip_all_fields(self):
         """Trim all fields, in both header and data rows."""
@@ -105,6 +135,67 @@ class TabularExtractor(BaseExtractor):
             for field_c in self.file_conf[EXT_FIELDS].values():
                 field_c[COL] = self._check_column(field_c[COL])
 
+    def _get_used_columns(self):
+        """Get all column numbers referenced by the (checked) config, sorted."""
+        fields_c = self.file_conf[FIELDS]
+        cols = []
+        for field in [DATE, TIME, NAME, MEMO]:
+            if field in fields_c:
+                col = fields_c[field][COL]
+                cols.extend(col if isinstance(col, list) else [col])
+        amount_c = fields_c[AMT]
+        if amount_c[FORMAT] == AmountFormat.TWO_COLUMNS:
+            cols.extend([amount_c['inbound'][COL], amount_c['outbound'][COL]])
+        else:
+            cols.append(amount_c[COL])
+            for indicator_c in amount_c.get('indicators', []):
+                cols.append(indicator_c[COL])
+        for field_c in self.file_conf.get(EXT_FIELDS, {}).values():
+            cols.append(field_c[COL])
+        return sorted(set(cols))
+
+    def _quarantine_row(self, line, stage, exc, fields):
+        if isinstance(exc, BillAggBaseException):
+            message = exc.message
+        else:
+            message = f'{type(exc).__name__}: {str(exc)}'
+        self.quarantined.append(
+            {'sheet': None, 'line': line, 'stage': stage, 'error': message, 'row': fields})
+
+    def _process_rows(self, func, stage):
+        """Call func(row) for every row.
+
+        With quarantine, rows failing with a data error are moved into
+        self.quarantined, instead of failing the whole file.
+        """
+        if not self.quarantine:
+            for row in self.rows:
+                func(row)
+            return
+
+        rows = []
+        for row in self.rows:
+            try:
+                func(row)
+            except ROW_ERRORS as exc:
+                self._quarantine_row(self.row_lines.get(id(row)), stage, exc, row[:RES_COL])
+            else:
+                rows.append(row)
+        self.rows = rows
+
+    def _log_quarantined_rows(self):
+        if not self.quarantined:
+            return
+        counts = {}
+        for record in self.quarantined:
+            counts[record['stage']] = counts.get(record['stage'], 0) + 1
+        count = len(self.quarantined)
+        details = ', '.join(f'{stage}: {n}' for stage, n in counts.items())
+        extract_logger.log(
+            ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
+            value=f'Quarantined {count} row{"" if count == 1 else "s"} with errors ({details})',
+            level=LogLevel.WARN)
+
     def _process_date_time_fields(self):
         date_conf = self.file_conf[FIELDS][DATE]
         date_cols = date_conf[COL]
@@ -118,8 +209,9 @@ class TabularExtractor(BaseExtractor):
             dayfirst = date_conf['dayfirst']
         if 'yearfirst' in date_conf:
             yearfirst = date_conf['yearfirst']
+        locale = date_conf.get('locale', None)
 
-        for row in self.rows:
+        def _process(row):
             if isinstance(date_cols, list):
                 date_col = next((col for col in date_cols if row[col]), None)
                 if date_col is None:
@@ -131,14 +223,20 @@ class TabularExtractor(BaseExtractor):
                 dt_str = f'{row[date_col]}'
             else:
                 dt_str = f'{row[date_col]} {row[time_col]}'
-            dt = dateutil.parser.parse(dt_str, dayfirst=dayfirst, yearfirst=yearfirst)
+            if locale is not None:
+                dt_str = date_util.normalize_date(dt_str, locale)
+            dt = parse_datetime(dt_str, dayfirst=dayfirst, yearfirst=yearfirst)
             row[RES_COL][DATE] = dt.date()
             row[RES_COL][TIME] = dt.time()
 
+        self._process_rows(_process, RowErrorStage.DATE)
+
     def _sort_data_by_datetime(self):
         def _sort_key(row):
             return (row[RES_COL][DATE], row[RES_COL][TIME])
 
+        if not self.rows:
+            return
         if _sort_key(self.rows[0]) > _sort_key(self.rows[-1]):
             self.rows.reverse()
         if not all(_sort_key(self.rows[i]) <= _sort_key(self.rows[i+1])
@@ -149,108 +247,37 @@ class TabularExtractor(BaseExtractor):
                 ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
                 value='Re-sorted by transaction date')
 
-    def _process_name_field(self):
-        name_col = self.file_conf[FIELDS][NAME][COL]
-        for row in self.rows:
-            row[RES_COL][NAME] = row[name_col]
-
-    def _process_memo_field(self):
-        if MEMO in self.file_conf[FIELDS]:
-            memo_col = self.file_conf[FIELDS][MEMO][COL]
-            for row in self.rows:
-                row[RES_COL][MEMO] = row[memo_col]
-        else:
-            for row in self.rows:
-                row[RES_COL][MEMO] = ''
-
-    def _process_one_col_with_idcs_amt_fields(self):
-        amt_conf = self.file_conf[FIELDS][AMT]
-        amt_col = amt_conf[COL]
-        idc_confs = amt_conf['indicators']
-
-        for row in self.rows:
-            amount = amount_util.convert_amount_to_decimal(row[amt_col])
-            amount_type = AmountType.UNKNOWN
-            for idc_conf in idc_confs:
-                idc_col = idc_conf[COL]
-                if row[idc_col] == idc_conf['inbound_value']:
-                    amount_type = AmountType.IN
-                    break
-                elif row[idc_col] == idc_conf['outbound_value']:
-                    amount_type = AmountType.OUT
-                    break
-
-            if amount_type == AmountType.IN:
-                amount = amount.copy_sign(amount_util.POS)
-            elif amount_type == AmountType.OUT:
-                amount = amount.copy_sign(amount_util.NEG)
-            row[RES_COL][AMT] = amount
-            row[RES_COL][AMT_TYPE] = amount_type
-
-    def _process_one_col_with_sign_amt_fields(self):
-        amt_conf = self.file_conf[FIELDS][AMT]
-        amt_col = amt_conf[COL]
-
-        reverse_sign = False
-        if 'is_outbound_positive' in amt_conf:
-            reverse_sign = amt_conf['is_outbound_positive']
+    def _get_date_window(self, dates):
+        """Get (start, end) of rows within since/until, dates must be sorted."""
+        start = 0
+        end = len(dates)
+        if self.since is not None:
+            start = bisect.bisect_left(dates, self.since)
+        if self.until is not None:
+            end = bisect.bisect_right(dates, self.until, lo=start)
+        if end - start < len(dates):
+            # logging
+            extract_logger.log(
+                ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
+                value=f'Filtered out {len(dates) - (end - start)} rows outside date range')
+        return start, end
 
-        for row in self.rows:
-            amount = amount_util.convert_amount_to_decimal(row[amt_col])
-            if bool(amount.is_signed()) ^ bool(reverse_sign):
-                amount_type = AmountType.OUT
-                amount = amount.copy_sign(amount_util.NEG)
-            else:
-                amount_type = AmountType.IN
-                amount = amount.copy_sign(amount_util.POS)
-            row[RES_COL][AMT] = amount
-            row[RES_COL][AMT_TYPE] = amount_type
+    def _filter_data_by_date(self):
+        """Drop rows outside since/until (rows are already sorted by date)."""
+        if self.since is None and self.until is None:
+            return
+        start, end = self._get_date_window([row[RES_COL][DATE] for row in self.rows])
+        self.rows = self.rows[start:end]
 
-    def _process_two_cols_amt_fields(self):
-        amt_conf = self.file_conf[FIELDS][AMT]
-        amt_in_col = amt_conf['inbound'][COL]
-        amt_out_col = amt_conf['outbound'][COL]
+    def _process_row_fields(self):
+        """Process name, memo, amount and extra fields, in one pass with a generated converter."""
+        convert = converter_util.get_row_converter(
+            self.file_conf[FIELDS], self.file_conf.get(EXT_FIELDS, None), self.amount_scale)
 
-        for row in self.rows:
-            amount_in = amount_util.POS_ZERO
-            amount_out = amount_util.NEG_ZERO
-            if row[amt_in_col]:
-                amount_in = amount_util.convert_amount_to_decimal(row[amt_in_col])
-                amount_in = amount_in.copy_sign(amount_util.POS)
-            if row[amt_out_col]:
-                amount_out = amount_util.convert_amount_to_decimal(row[amt_out_col])
-                amount_out = amount_out.copy_sign(amount_util.NEG)
-
-            amount = amount_in + amount_out
-            if amount.is_signed():
-                amount_type = AmountType.OUT
-            else:
-                amount_type = AmountType.IN
-            if amount == 0 and row[amt_out_col]:
-                # if outbound field exist, treat 0 as OUT (0 default to IN)
-                amount_type = AmountType.OUT
-                amount = amount.copy_sign(amount_util.NEG)
-            row[RES_COL][AMT] = amount
-            row[RES_COL][AMT_TYPE] = amount_type
-
-    def _process_amount_fields(self):
-        amt_format = self.file_conf[FIELDS][AMT][FORMAT]
-        if amt_format == AmountFormat.ONE_COLUMN_WITH_INDICATORS:
-            self._process_one_col_with_idcs_amt_fields()
-        elif amt_format == AmountFormat.ONE_COLUMN_WITH_SIGN:
-            self._process_one_col_with_sign_amt_fields()
-        elif amt_format == AmountFormat.TWO_COLUMNS:
-            self._process_two_cols_amt_fields()
-        else:
-            raise BillAggConfigError(f'Config Error, invalid amount format: {amt_format}')
+        def _process(row):
+            convert(row, row[RES_COL])
 
-    def _process_extra_fields(self):
-        if EXT_FIELDS not in self.file_conf:
-            return
-        for row in self.rows:
-            for field_name, field_conf in self.file_conf[EXT_FIELDS].items():
-                field_value = row[field_conf[COL]]
-                row[RES_COL][field_name] = field_value
+        self._process_rows(_process, RowErrorStage.AMOUNT)
 
     def prepare_data(self):
         """Get the data in self.rows prepared for further processing"""
@@ -260,16 +287,19 @@ class TabularExtractor(BaseExtractor):
 
         for row in self.rows:
             row.append({})    # append result column
+        if self.line_numbers is not None:
+            self.row_lines = {id(row): line for row, line in zip(self.rows, self.line_numbers)}
 
     def process_data(self):
         """Process data in self.rows, then put them in self.results"""
         self._process_date_time_fields()
         self._sort_data_by_datetime()
-        self._process_name_field()
-        self._process_memo_field()
-        self._process_amount_fields()
-        self._process_extra_fields()
+        self._filter_data_by_date()    # other fields are only processed within date range
+        self._process_row_fields()
 
+        if self.provenance:
+            for row in self.rows:
+                row[RES_COL][SOURCE_LINE] = self.row_lines.get(id(row))
         for row in self.rows:
             self.results.append(row[RES_COL])
 
@@ -278,21 +308,34 @@ class TabularExtractor(BaseExtractor):
         self.load_file()
         self.prepare_data()
         self.process_data()
+        self._log_quarantined_rows()
 
 
 class CsvExtractor(TabularExtractor):
 
-    def __init__(self, file, file_conf):
-        super().__init__(file=file, file_conf=file_conf)
+    def __init__(self, file, file_conf, prefetched=None, since=None, until=None, amount_scale=None,
+                 provenance=False):
+        super().__init__(file=file, file_conf=file_conf, prefetched=prefetched,
+                         since=since, until=until, amount_scale=amount_scale, provenance=provenance)
         self.encoding = self.file_conf.get('encoding', None)
         self.delimiter = self.file_conf.get('delimiter', ',')
+        self.reader = self.file_conf.get('reader', CsvReader.DEFAULT)
 
     def _read_csv_file(self):
         """Read original csv file into self.rows"""
-        if self.encoding:
-            file_func = partial(open, self.file, 'r', encoding=self.encoding)
+        if self.encoding and self.prefetched:
+            file_func = partial(
+                TextIOWrapper, BytesIO(self.prefetched.content), encoding=self.encoding)
+        elif self.encoding:
+            file_func = partial(self.file.open, 'r', encoding=self.encoding)
         else:
-            result = charset_normalizer.from_path(self.file).best()
+            if self.prefetched and self.prefetched.charset_match is not None:
+                result = self.prefetched.charset_match
+            elif self.prefetched:
+                result = charset_normalizer.from_bytes(self.prefetched.content).best()
+            else:
+                with self.file.open('rb') as f:
+                    result = charset_normalizer.from_fp(f).best()
             if not result:
                 raise BillAggException('Cannot detect encoding')
 
@@ -304,7 +347,17 @@ class CsvExtractor(TabularExtractor):
 
         with file_func() as f:
             csvreader = csv.reader(f, delimiter=self.delimiter)
-            self.rows = list(csvreader)
+            if not self.track_lines:
+                self.rows = list(csvreader)
+                return
+
+            self.rows = []
+            self.line_numbers = []
+            line = 1
+            for row in csvreader:
+                self.rows.append(row)
+                self.line_numbers.append(line)
+                line = csvreader.line_num + 1    # records may span lines
 
     def _update_column_count_and_trim_rows(self):
         """Update column_count, and trim rows"""
@@ -315,9 +368,13 @@ class CsvExtractor(TabularExtractor):
         column_count = max(len(row) for row in self.rows)
         if column_count < MIN_BILL_COLUMNS:
             self.rows = []
+            self.line_numbers = None
             return
 
         self.column_count = column_count
+        if self.line_numbers is not None:
+            self.line_numbers = [line for row, line in zip(self.rows, self.line_numbers)
+                                 if len(row) == self.column_count]
         self.rows = [row for row in self.rows if len(row) == self.column_count]
 
         # logging
@@ -326,21 +383,137 @@ class CsvExtractor(TabularExtractor):
         extract_logger.log(
             ExtractLoggerScope.FILE, ExtractLoggerField.SKIP_ROWS, value=diff_row_count)
 
+    def _read_mmap_csv_file(self):
+        """Read csv file through mmap into self.rows, decoding only used columns.
+
+        Record boundaries are located in the raw bytes, the header is decoded
+        to resolve the config, then only the columns referenced by the config
+        are decoded for data rows (other fields are left empty, and rows are
+        truncated after the last used column).
+        """
+        if not self.encoding:
+            raise BillAggConfigError('Config Error, reader "mmap" requires encoding')
+        encoding, bom = mmap_csv_util.get_byte_level_encoding(self.encoding)
+        if encoding is None:
+            raise BillAggConfigError(
+                f'Config Error, reader "mmap" does not support encoding: {self.encoding}')
+        if len(self.delimiter.encode(encoding)) != 1:
+            raise BillAggConfigError(
+                f'Config Error, reader "mmap" does not support delimiter: {self.delimiter}')
+        for char in ['\n', '"', self.delimiter]:
+            if mmap_csv_util.is_trail_byte(encoding, char):
+                raise BillAggConfigError(
+                    f'Config Error, reader "mmap" does not support encoding {self.encoding} '
+                    f'with {char!r} (it can be a byte of a multi-byte character), '
+                    f'use reader "text"')
+
+        self.rows = []
+        if self.prefetched:
+            self._read_csv_buffer(self.prefetched.content, encoding, bom)
+            return
+        if isinstance(self.file, ArchivedFile):
+            # decompressed content can't be mapped
+            self._read_csv_buffer(read_bytes(self.file), encoding, bom)
+            return
+        with open(self.file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                self._read_csv_buffer(buf, encoding, bom)
+
+    def _read_csv_buffer(self, buf, encoding, bom):
+        """Split a bytes-like buffer into self.rows (see _read_mmap_csv_file)"""
+        start = len(bom) if bom and buf[:len(bom)] == bom else 0
+        records = []    # [(start, end, parsed fields or None), ...]
+        counts = []
+        delimiter = self.delimiter.encode(encoding)
+        for s, e in mmap_csv_util.iter_record_offsets(buf, delimiter, start=start):
+            count, fields = mmap_csv_util.scan_record(buf[s:e], self.delimiter, encoding)
+            records.append((s, e, fields))
+            counts.append(count)
+        if not counts:
+            return
+
+        column_count = max(counts)
+        if column_count < MIN_BILL_COLUMNS:
+            return
+        self.column_count = column_count
+        if self.track_lines:
+            # line numbers include the header, like self.rows
+            lines = []
+            line = 1
+            pos = 0
+            for (s, _, _), c in zip(records, counts):
+                line += buf[pos:s].count(b'\n')
+                pos = s
+                if c == column_count:
+                    lines.append(line)
+            self.line_numbers = lines
+        records = [r for r, c in zip(records, counts) if c == column_count]
+
+        # logging
+        extract_logger.log(
+            ExtractLoggerScope.FILE, ExtractLoggerField.SKIP_ROWS,
+            value=len(counts) - len(records))
+
+        # resolve config against header, to find out used columns
+        if self.has_header and records:
+            s, e, fields = records.pop(0)
+            if fields is None:
+                fields = buf[s:e].decode(encoding).split(self.delimiter)
+            self.header_row = [f.strip() for f in fields]
+            self.rows.append(fields)
+        self._check_and_update_config()
+        self.header_row = None
+        used_columns = self._get_used_columns()
+        width = used_columns[-1] + 1
+
+        for s, e, fields in records:
+            if fields is not None:
+                self.rows.append(fields[:width])
+            else:
+                self.rows.append(mmap_csv_util.split_record(
+                    buf[s:e], self.delimiter, encoding, used_columns, width))
+
     def load_file(self):
+        if self.reader == CsvReader.MMAP:
+            self._read_mmap_csv_file()
+            return
         self._read_csv_file()
         self._update_column_count_and_trim_rows()
 
 
+def extract_xls_sheet(extractor_cls, file, file_conf, prefetched, since, until, amount_scale,
+                      provenance, sheet_index):
+    """Extract one sheet in a worker process, return (results, skip_rows, messages, quarantined)."""
+    extract_logger.reset()    # forked workers may inherit the parent's log data
+    extractor = extractor_cls(
+        file=file, file_conf=file_conf, prefetched=prefetched, since=since, until=until,
+        amount_scale=amount_scale, provenance=provenance)
+    extractor.sheet_index = sheet_index
+    extractor.extract_bills()
+    skip_rows, messages = extract_logger.pop_file_logs()
+    return extractor.results, skip_rows, messages, extractor.quarantined
+
+
 class XlsExtractor(TabularExtractor):
 
-    def __init__(self, file, file_conf):
-        super().__init__(file=file, file_conf=file_conf)
+    def __init__(self, file, file_conf, prefetched=None, since=None, until=None, amount_scale=None,
+                 provenance=False):
+        super().__init__(file=file, file_conf=file_conf, prefetched=prefetched,
+                         since=since, until=until, amount_scale=amount_scale, provenance=provenance)
         self.skiprows = self.file_conf.get('skiprows', 0)
         self.skipfooters = self.file_conf.get('skipfooters', 0)
+        self.sheets = self.file_conf.get('sheets', None)
+        self.sheet_index = 0
 
-    def load_file(self):
-        """Read original csv file into self.rows"""
-        sheet = xlrd.open_workbook(self.file).sheet_by_index(0)
+    def _read_sheet(self, sheet):
+        """Read used columns of sheet into self.rows.
+
+        The header row is read in full to resolve the config, then only the
+        columns referenced by the config are read (column by column), other
+        fields are left empty and rows are truncated after the last used column.
+        """
         start = 0 + self.skiprows
         end = (sheet.nrows - 1) - self.skipfooters
         total_skiprows = self.skiprows + self.skipfooters
@@ -349,13 +522,143 @@ class XlsExtractor(TabularExtractor):
             raise BillAggConfigError(f'Config Error, need to skip {total_skiprows} rows, ' \
                                      f'only {sheet.nrows} rows found')
 
-        results = []
-        for i in range(start, end+1):
-            row = [str(cell.value) for cell in sheet.row(i)]
-            results.append(row)
+        self.column_count = sheet.ncols
+        header_row = None
+        if self.has_header:
+            header_row = [str(value) for value in sheet.row_values(start)]
+            self.header_row = [f.strip() for f in header_row]
+        self._check_and_update_config()
+        self.header_row = None
+        used_columns = self._get_used_columns()
+        width = used_columns[-1] + 1
+
+        results = [[''] * width for _ in range(start, end+1)]
+        for col in used_columns:
+            values = sheet.col_values(col, start_rowx=start, end_rowx=end+1)
+            for row, value in zip(results, values):
+                row[col] = str(value)
+        if header_row is not None:
+            results[0] = header_row
         self.rows = results
-        self.column_count = len(self.rows[0])
+        if self.track_lines:
+            self.line_numbers = list(range(start + 1, end + 2))    # sheet row numbers
 
         # logging
         extract_logger.log(
             ExtractLoggerScope.FILE, ExtractLoggerField.SKIP_ROWS, value=total_skiprows)
+
+    def _open_workbook(self):
+        if self.prefetched:
+            return xlrd.open_workbook(file_contents=self.prefetched.content, on_demand=True)
+        if isinstance(self.file, ArchivedFile):
+            # xlrd needs random access, the decompressed workbook is kept in memory
+            return xlrd.open_workbook(file_contents=read_bytes(self.file), on_demand=True)
+        return xlrd.open_workbook(self.file, on_demand=True)
+
+    def load_file(self):
+        """Read original xls file into self.rows"""
+        workbook = self._open_workbook()
+        try:
+            self._read_sheet(workbook.sheet_by_index(self.sheet_index))
+        finally:
+            workbook.release_resources()
+
+    def _select_sheets(self):
+        """Get [(index, name), ...] of sheets selected by the "sheets" config."""
+        workbook = self._open_workbook()
+        try:
+            sheet_names = workbook.sheet_names()
+        finally:
+            workbook.release_resources()
+
+        selectors = self.sheets
+        if selectors == SHEETS_ALL:
+            return list(enumerate(sheet_names))
+        if not isinstance(selectors, list):
+            selectors = [selectors]
+
+        selected = []
+        for selector in selectors:
+            if isinstance(selector, int):
+                if selector >= len(sheet_names):
+                    raise BillAggConfigError(f'Config Error, no such sheet: {selector}, ' \
+                                             f'available sheets: 0-{len(sheet_names)-1}')
+                matches = [selector]
+            else:
+                matches = [idx for idx, name in enumerate(sheet_names)
+                           if fnmatch.fnmatchcase(name, selector)]
+                if not matches:
+                    raise BillAggConfigError(f'Config Error, no such sheet: "{selector}", ' \
+                                             f'available sheets: {sheet_names}')
+            selected.extend(idx for idx in matches if idx not in selected)
+        return [(idx, sheet_names[idx]) for idx in selected]
+
+    def _extract_sheets_in_process(self, sheets, sheet_conf):
+        """Extract sheets one by one, return [(results, skip_rows, messages, quarantined), ...]."""
+        outputs = []
+        file_data = extract_logger.current_file_data()
+        for idx, sheet_name in sheets:
+            msg_count = len(file_data['messages'])
+            extractor = type(self)(
+                file=self.file, file_conf=copy.deepcopy(sheet_conf), prefetched=self.prefetched,
+                since=self.since, until=self.until, amount_scale=self.amount_scale,
+                provenance=self.provenance)
+            extractor.sheet_index = idx
+            extractor.extract_bills()
+
+            messages = file_data['messages'][msg_count:]
+            for message in messages:
+                message.value = f'[{sheet_name}] {message.value}'
+            outputs.append((extractor.results, file_data['skip_rows'].value, messages,
+                            extractor.quarantined))
+        return outputs
+
+    def extract_bills(self):
+        """Main entry point for Extractor
+
+        If "sheets" is configured, every selected sheet is extracted as its own
+        run (config is resolved per sheet) in worker processes, then the sorted
+        results are merged.
+        """
+        if self.sheets is None:
+            super().extract_bills()
+            return
+
+        sheets = self._select_sheets()
+        sheet_conf = copy.deepcopy(self.file_conf)
+        del sheet_conf['sheets']
+
+        max_workers = min(len(sheets), os.cpu_count() or 1)
+        if max_workers == 1:
+            outputs = self._extract_sheets_in_process(sheets, sheet_conf)
+        else:
+            args = [(type(self), self.file, copy.deepcopy(sheet_conf), self.prefetched,
+                     self.since, self.until, self.amount_scale, self.provenance, idx)
+                    for idx, _ in sheets]
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                outputs = list(executor.map(extract_xls_sheet, *zip(*args)))
+
+            for (_, sheet_name), (_, _, messages, _) in zip(sheets, outputs):
+                for message in messages:
+                    extract_logger.log(
+                        ExtractLoggerScope.FILE, ExtractLoggerField.MSG,
+                        value=f'[{sheet_name}] {message.value}', level=message.level)
+
+        total_skip_rows = sum(skip_rows or 0 for _, skip_rows, _, _ in outputs)
+        extract_logger.log(
+            ExtractLoggerScope.FILE, ExtractLoggerField.SKIP_ROWS, value=total_skip_rows)
+
+        if self.provenance:
+            for (_, sheet_name), (results, _, _, _) in zip(sheets, outputs):
+                for row in results:
+                    row[SOURCE_SHEET] = sheet_name
+
+        def _sort_key(row):
+            return (row[DATE], row[TIME])
+
+        # stable merge: on same key, earlier sheets come first
+        self.results = list(heapq.merge(*[results for results, _, _, _ in outputs], key=_sort_key))
+        for (_, sheet_name), (_, _, _, quarantined) in zip(sheets, outputs):
+            for record in quarantined:
+                record['sheet'] = sheet_name
+            self.quarantined.extend(quarantined)
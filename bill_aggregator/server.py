@@ -0,0 +1,293 @@
+import concurrent.futures
+import copy
+import datetime
+import email.parser
+import email.policy
+import io
+import json
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import zipfile
+from decimal import Decimal
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from bill_aggregator.consts import RESULTS_DIR, PROVENANCE_FILE, ACCT, ExportType, LogLevel
+from bill_aggregator.exceptions import BillAggBaseException
+from bill_aggregator.utils.log_util import BaseLogSink
+from bill_aggregator.utils.worker_util import warm_up_worker
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+FORMAT_JSON = 'json'
+FORMATS = [FORMAT_JSON, *ExportType.ALL]
+CONTENT_TYPES = {
+    FORMAT_JSON: 'application/json',
+    ExportType.XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    ExportType.CSV: 'text/csv',
+    'zip': 'application/zip',
+}
+LEVEL_NAMES = {LogLevel.INFO: 'info', LogLevel.WARN: 'warning', LogLevel.ERROR: 'error'}
+
+
+class MessageCollector(BaseLogSink):
+    """Collect extract messages of one request, as JSON-friendly dicts."""
+
+    def __init__(self):
+        self.messages = []
+        self.error_count = 0
+
+    def bill_group_logged(self, group_data):
+        for file_data in group_data['files']:
+            for message in file_data['messages']:
+                self.messages.append({
+                    'file': file_data['file'].value,
+                    'level': LEVEL_NAMES.get(message.level, 'info'),
+                    'message': message.value,
+                })
+        for message in group_data['messages']:
+            self.messages.append({
+                'file': None,
+                'level': LEVEL_NAMES.get(message.level, 'info'),
+                'message': message.value,
+            })
+
+    def extracting_completed(self, warn_count, error_count):
+        self.error_count = error_count
+
+
+def to_json_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def to_json_row(row, amount_scales=None):
+    """Row as a JSON object, amounts in display form (also with fixed_point_amounts)."""
+    if amount_scales is not None:
+        row = amount_scales.to_decimal_amounts(row)
+    return {k: to_json_value(v) for k, v in row.items()}
+
+
+# Worker process state: the config is parsed and validated once per worker
+_worker_conf = None
+
+
+def init_worker(conf):
+    global _worker_conf    # pylint: disable=global-statement
+    _worker_conf = conf
+    warm_up_worker()
+
+
+def handle_upload(account, uploads, output_format):
+    """Extract uploaded files of a bill group, in a worker process.
+
+    uploads: [(filename, content), ...]
+    Return (status, content_type, body).
+    """
+    # pylint: disable=import-outside-toplevel
+    from bill_aggregator.aggregator import BillAggregator
+    from bill_aggregator.utils.prefetch_util import InMemoryFiles
+
+    bill_group_conf = next(
+        (bgc for bgc in _worker_conf['bill_groups'] if bgc.get(ACCT, None) == account), None)
+    if bill_group_conf is None:
+        return error_response(HTTPStatus.NOT_FOUND, f'No such bill group: {account}')
+    bill_group_conf = copy.deepcopy(bill_group_conf)
+    bill_group_conf['file_pattern'] = '*'    # the bill group is given, take every uploaded file
+
+    conf = dict(_worker_conf, bill_groups=[bill_group_conf], auto_detect=False, prefetch=0)
+    if output_format != FORMAT_JSON:
+        conf['export_to'] = output_format
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = pathlib.Path(workdir)
+        contents = {}
+        for filename, content in uploads:
+            file = workdir / pathlib.Path(filename).name
+            if file in contents:
+                return error_response(HTTPStatus.BAD_REQUEST, f'Duplicate file name: {file.name}')
+            contents[file] = content
+        collector = MessageCollector()
+        try:
+            aggregator = BillAggregator(
+                conf=conf, workdir=workdir, files=list(contents), log_sink=collector,
+                prefetcher=InMemoryFiles(contents))
+            aggregator.extract_bills()
+            aggregator.aggregate_bills()
+        except BillAggBaseException as exc:
+            return error_response(HTTPStatus.BAD_REQUEST, exc.message)
+        except Exception as exc:    # pylint: disable=broad-except
+            # e.g. an unparseable date or a corrupt file, raised by dateutil, xlrd or csv
+            return error_response(HTTPStatus.UNPROCESSABLE_ENTITY, describe_exception(exc),
+                                  messages=collector.messages)
+        if collector.error_count:
+            return error_response(HTTPStatus.UNPROCESSABLE_ENTITY, 'Extracting failed',
+                                  messages=collector.messages)
+
+        if output_format == FORMAT_JSON:
+            amount_scales = aggregator.amount_scales
+            body = {
+                'aggregations': {
+                    aggregation: [to_json_row(row, amount_scales) for row in rows]
+                    for aggregation, rows in aggregator.aggregated_results.items()
+                },
+                'messages': collector.messages,
+                'quarantined': aggregator.quarantined_rows,
+            }
+            if aggregator.provenance:
+                body['source_files'] = aggregator.source_files
+            return HTTPStatus.OK, CONTENT_TYPES[FORMAT_JSON], json.dumps(body).encode('utf-8')
+
+        try:
+            aggregator.export_bills()
+        except BillAggBaseException as exc:
+            return error_response(HTTPStatus.BAD_REQUEST, exc.message)
+        except Exception as exc:    # pylint: disable=broad-except
+            return error_response(HTTPStatus.INTERNAL_SERVER_ERROR, describe_exception(exc))
+        # the provenance index of a temporary directory is not sent back
+        files = sorted(f for f in (workdir / RESULTS_DIR).iterdir() if f.name != PROVENANCE_FILE)
+        if len(files) == 1:
+            return HTTPStatus.OK, CONTENT_TYPES[output_format], files[0].read_bytes()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for file in files:
+                zf.write(file, arcname=file.name)
+        return HTTPStatus.OK, CONTENT_TYPES['zip'], buffer.getvalue()
+
+
+def describe_exception(exc):
+    """One line message of an unexpected exception, e.g. "ParserError: Unknown string format"."""
+    return f'{type(exc).__name__}: {" ".join(str(exc).split())}'
+
+
+def error_response(status, message, messages=None):
+    body = {'error': message, 'messages': messages or []}
+    return status, CONTENT_TYPES[FORMAT_JSON], json.dumps(body).encode('utf-8')
+
+
+def parse_uploads(content_type, body, query):
+    """Get [(filename, content), ...] from a multipart/form-data or a raw body."""
+    if content_type.startswith('multipart/form-data'):
+        header = f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1')
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+        return [(part.get_filename(), part.get_payload(decode=True))
+                for part in message.iter_parts() if part.get_filename()]
+    filename = query.get('filename', [None])[0]
+    if not filename:
+        return []
+    return [(filename, body)]
+
+
+class AggregationRequestHandler(BaseHTTPRequestHandler):
+    """POST /aggregate?account=<bill group>&format=json|xlsx|csv, GET /health"""
+
+    server_version = 'BillAggregator'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):    # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):    # pylint: disable=invalid-name
+        if urlsplit(self.path).path != '/health':
+            self.send_body(*error_response(HTTPStatus.NOT_FOUND, 'Not found'))
+            return
+        self.send_body(HTTPStatus.OK, 'text/plain', b'ok')
+
+    def do_POST(self):    # pylint: disable=invalid-name
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path != '/aggregate':
+            self.send_body(*error_response(HTTPStatus.NOT_FOUND, 'Not found'))
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self.send_body(*error_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Upload too large'))
+            return
+        body = self.rfile.read(length)
+
+        account = query.get('account', [None])[0]
+        output_format = query.get('format', [FORMAT_JSON])[0]
+        if not account:
+            self.send_body(*error_response(HTTPStatus.BAD_REQUEST, 'Missing parameter: account'))
+            return
+        if output_format not in FORMATS:
+            self.send_body(*error_response(
+                HTTPStatus.BAD_REQUEST, f'Invalid format: {output_format}, use one of {FORMATS}'))
+            return
+        uploads = parse_uploads(self.headers.get('Content-Type', ''), body, query)
+        if not uploads:
+            self.send_body(*error_response(HTTPStatus.BAD_REQUEST, 'No bill file uploaded'))
+            return
+
+        future = self.server.executor.submit(handle_upload, account, uploads, output_format)
+        try:
+            response = future.result()
+        except Exception as exc:    # pylint: disable=broad-except
+            # e.g. a worker process died, the client still gets a response
+            response = error_response(HTTPStatus.INTERNAL_SERVER_ERROR, describe_exception(exc))
+        self.send_body(*response)
+
+
+class AggregationServer(ThreadingHTTPServer):
+    """HTTP server, requests are handled in threads and extracted in a warm process pool."""
+
+    daemon_threads = True
+
+    def __init__(self, conf, address, workers=None, verbose=False):
+        super().__init__(address, AggregationRequestHandler)
+        self.verbose = verbose
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker, initargs=(conf,))
+
+    def warm_up(self):
+        """Start all worker processes now, so the first requests don't pay for it."""
+        futures = [self.executor.submit(os.getpid) for _ in range(self.workers * 2)]
+        concurrent.futures.wait(futures)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+def prepare_serve_config(conf, workdir):
+    """Resolve paths in conf, which would otherwise be relative to the bills directory."""
+    conf = copy.deepcopy(conf)
+    if 'currency_conversion' in conf:
+        rate_file = workdir / conf['currency_conversion']['rate_file']
+        conf['currency_conversion']['rate_file'] = str(rate_file)
+    return conf
+
+
+def serve(conf, workdir, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, verbose=False):
+    conf = prepare_serve_config(conf, workdir)
+    server = AggregationServer(conf, (host, port), workers=workers, verbose=verbose)
+    try:
+        server.warm_up()
+        print(f'Serving on http://{host}:{server.server_port}/aggregate '
+              f'({server.workers} workers), press Ctrl+C to stop.')
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,230 @@
+import argparse
+import datetime
+import heapq
+import io
+import json
+import zipfile
+import zlib
+from decimal import Decimal
+from operator import itemgetter
+
+from bill_aggregator.consts import (
+    ACCT, DATE, TIME, AMT, BASE_AMT, FX_RATE, SHARD_ORIGIN, SOURCE_FILE,
+)
+from bill_aggregator.exceptions import BillAggException
+from bill_aggregator.utils.config_util import get_extract_config_digest
+
+
+PARTIAL_FORMAT = 'bill_aggregator.partial'
+PARTIAL_VERSION = 1
+MANIFEST_MEMBER = 'partial.json'
+
+def _encode_decimal(d):
+    return d if isinstance(d, int) else str(d)    # int: minor units (fixed_point_amounts)
+
+
+def _decode_decimal(s):
+    return Decimal(s) if isinstance(s, str) else s
+
+
+# non-JSON fields of result rows, other fields are str (or None)
+FIELD_CODECS = {
+    DATE: (datetime.date.isoformat, datetime.date.fromisoformat),
+    TIME: (datetime.time.isoformat, datetime.time.fromisoformat),
+    AMT: (_encode_decimal, _decode_decimal),
+    BASE_AMT: (_encode_decimal, _decode_decimal),
+    FX_RATE: (_encode_decimal, _decode_decimal),
+}
+
+
+def parse_shard(value):
+    """Parse "I/N" (shard I of N, 1-based) into (index, count), for argparse."""
+    try:
+        index, count = (int(n) for n in value.split('/'))
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f'invalid shard: {value}, use I/N (e.g. 2/4)') from exc
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f'invalid shard: {value}, I must be within 1-N')
+    return index, count
+
+
+def get_bill_group_shard(bill_group_conf, count):
+    """Get the shard (1-based) of a bill group, by its "shard" config or by account hash.
+
+    crc32 is used since it is stable across processes and machines (unlike hash()).
+    """
+    if 'shard' in bill_group_conf:
+        return (bill_group_conf['shard'] - 1) % count + 1
+    account = bill_group_conf.get(ACCT, '')
+    return zlib.crc32(account.encode('utf-8')) % count + 1
+
+
+def _encode_row(row):
+    return {
+        field: (value if field not in FIELD_CODECS or value is None
+                else FIELD_CODECS[field][0](value))
+        for field, value in row.items() if field != SHARD_ORIGIN
+    }
+
+
+def _decode_row(row):
+    for field, (_, decode) in FIELD_CODECS.items():
+        value = row.get(field, None)
+        if value is not None:
+            row[field] = decode(value)
+    return row
+
+
+def write_partial(aggregator, file):
+    """Write sorted aggregated results of a shard run into a partial file.
+
+    A partial is a zip file: a manifest (partial.json), and one JSON lines
+    member per aggregation, each line is [*origin, row] (origin: see SHARD_ORIGIN).
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    aggregations = []
+    with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for n, (aggregation, rows) in enumerate(aggregator.aggregated_results.items()):
+            member = f'aggregations/{n}.jsonl'
+            row_count = 0
+            first_origin = None
+            with zf.open(member, 'w') as f, io.TextIOWrapper(f, encoding='utf-8') as tf:
+                for row in rows:
+                    origin = row[SHARD_ORIGIN]
+                    if first_origin is None or origin < first_origin:
+                        first_origin = origin
+                    tf.write(json.dumps([*origin, _encode_row(row)], separators=(',', ':')))
+                    tf.write('\n')
+                    row_count += 1
+            aggregations.append({
+                'name': aggregation, 'member': member, 'rows': row_count,
+                'first_origin': first_origin,
+            })
+
+        manifest = {
+            'format': PARTIAL_FORMAT,
+            'version': PARTIAL_VERSION,
+            'shard': list(aggregator.shard),
+            'config_digest': get_extract_config_digest(aggregator.conf),
+            'aggregations': aggregations,
+            'warn_count': aggregator.extract_logger.warn_count,
+            'error_count': aggregator.extract_logger.error_count,
+            'quarantined': aggregator.quarantined_rows,
+            'source_files': aggregator.source_files,
+        }
+        zf.writestr(MANIFEST_MEMBER, json.dumps(manifest, default=str))
+
+
+class Partial:
+    """Partial results of one shard, rows are read lazily (one aggregation at a time)."""
+
+    def __init__(self, file):
+        self.file = file
+        try:
+            with zipfile.ZipFile(file) as zf:
+                manifest = json.loads(zf.read(MANIFEST_MEMBER))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as exc:
+            raise BillAggException(f'Not a partial file: {file}') from exc
+        if manifest.get('format', None) != PARTIAL_FORMAT:
+            raise BillAggException(f'Not a partial file: {file}')
+        if manifest['version'] != PARTIAL_VERSION:
+            raise BillAggException(
+                f'Unsupported partial version {manifest["version"]}: {file}')
+        self.shard = tuple(manifest['shard'])
+        self.config_digest = manifest['config_digest']
+        self.aggregations = {a['name']: a for a in manifest['aggregations']}
+        self.warn_count = manifest['warn_count']
+        self.error_count = manifest['error_count']
+        self.quarantined = manifest['quarantined']
+        self.source_files = manifest.get('source_files', [])
+        self.source_offset = 0    # of source file ids, in the source file table of the merged run
+
+    def iter_rows(self, aggregation):
+        """Yield (sort key, row) of an aggregation, in sorted order."""
+        if aggregation not in self.aggregations:
+            return
+        with zipfile.ZipFile(self.file) as zf:
+            with zf.open(self.aggregations[aggregation]['member']) as f:
+                for line in io.TextIOWrapper(f, encoding='utf-8'):
+                    *origin, row = json.loads(line)
+                    row = _decode_row(row)
+                    if SOURCE_FILE in row:
+                        row[SOURCE_FILE] += self.source_offset
+                    yield (row[DATE], row[TIME], *origin), row
+
+
+def check_partials(partials, conf):
+    """Check that partials are exactly the shards of one run, with the same config."""
+    counts = {p.shard[1] for p in partials}
+    if len(counts) != 1:
+        raise BillAggException(
+            f'Partials are from runs with different shard counts: {sorted(counts)}')
+    count = counts.pop()
+    indices = sorted(p.shard[0] for p in partials)
+    duplicates = sorted({i for i in indices if indices.count(i) > 1})
+    if duplicates:
+        raise BillAggException(f'Duplicate partials for shards: {duplicates}')
+    missing = sorted(set(range(1, count + 1)) - set(indices))
+    if missing:
+        raise BillAggException(f'Missing partials for shards: {missing} (of {count})')
+    digest = get_extract_config_digest(conf)
+    for partial in partials:
+        if partial.config_digest != digest:
+            raise BillAggException(
+                f'Partial {partial.file.name} was made with a different config '
+                f'(only export_to and export_config may differ)')
+
+
+def merge_partials(conf, workdir, files, log_sink=None):
+    """Merge partials of all shards of a run, then export (same as a single run).
+
+    Rows of every aggregation are merged with a k-way merge on (date, time,
+    origin), so they come in the same order as in a single run (for ties
+    between bill groups that are both auto-detected, only by bill group order).
+    Transfers can only be matched here (they may cross shards), which needs
+    all rows in memory.
+    """
+    # pylint: disable=import-outside-toplevel
+    from bill_aggregator.aggregator import BillAggregator
+
+    partials = sorted((Partial(file) for file in files), key=lambda p: p.shard)
+    check_partials(partials, conf)
+
+    aggregator = BillAggregator(conf=conf, workdir=workdir, log_sink=log_sink)
+    for partial in partials:
+        partial.source_offset = len(aggregator.source_files)
+        aggregator.source_files.extend(partial.source_files)
+    first_origins = {}
+    for partial in partials:
+        for name, aggregation in partial.aggregations.items():
+            if aggregation['first_origin'] is None:
+                continue
+            first_origin = tuple(aggregation['first_origin'])
+            first_origins[name] = min(first_origins.get(name, first_origin), first_origin)
+    aggregations = sorted(first_origins, key=first_origins.get)
+
+    def _merge(aggregation):
+        streams = [partial.iter_rows(aggregation) for partial in partials]
+        return (row for _, row in heapq.merge(*streams, key=itemgetter(0)))
+
+    if aggregator.transfer_conf is not None:
+        # back into extraction order
+        items = [item for aggregation in aggregations for partial in partials
+                 for item in partial.iter_rows(aggregation)]
+        items.sort(key=lambda item: item[0][2:])
+        aggregator.extracted_results = [row for _, row in items]
+        aggregator.aggregate_bills()
+    else:
+        aggregator.aggregated_results = {
+            aggregation: _merge(aggregation) for aggregation in aggregations}
+    for partial in partials:
+        aggregator.quarantined_rows.extend(partial.quarantined)
+
+    aggregator.log_sink.shards_merged(
+        shard_count=len(partials),
+        row_count=sum(a['rows'] for p in partials for a in p.aggregations.values()),
+        warn_count=sum(p.warn_count for p in partials),
+        error_count=sum(p.error_count for p in partials))
+
+    aggregator.export_bills()
+    return aggregator
@@ -0,0 +1,263 @@
+import array
+import datetime
+import marshal
+import struct
+import sys
+from decimal import Decimal
+
+from bill_aggregator.consts import DATE, TIME, AMT, BASE_AMT, FX_RATE
+from bill_aggregator.exceptions import BillAggException
+from bill_aggregator.utils.config_util import get_extract_config_digest
+
+
+SNAPSHOT_MAGIC = b'BILLAGG-SNAPSHOT'
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct('<16sHQ')    # magic, version, offset of the footer
+CHUNK_ROWS = 4096
+
+# column types of a chunk
+OBJECT_COLUMN = 'o'    # list of str (or None), as is
+DATE_COLUMN = 'd'    # int32 ordinals, 0 for None
+TIME_COLUMN = 't'    # int64 microseconds since midnight, -1 for None
+DECIMAL_COLUMN = 'n'    # scaled integers: int16 exponents and int64 coefficients
+DECIMAL_STR_COLUMN = 's'    # decimals which don't fit in DECIMAL_COLUMN, as str
+INT_COLUMN = 'i'    # int64, for amounts in minor units (fixed_point_amounts)
+
+FIELD_COLUMN_TYPES = {
+    DATE: DATE_COLUMN,
+    TIME: TIME_COLUMN,
+    AMT: DECIMAL_COLUMN,
+    BASE_AMT: DECIMAL_COLUMN,
+    FX_RATE: DECIMAL_COLUMN,
+}
+NULL_EXPONENT = -32768
+
+
+def _to_bytes(values):
+    if sys.byteorder == 'big':
+        values.byteswap()    # always little-endian on disk
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _encode_time(t):
+    if t is None:
+        return -1
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 1000000 + t.microsecond
+
+
+def _decode_time(n):
+    if n == -1:
+        return None
+    n, microsecond = divmod(n, 1000000)
+    n, second = divmod(n, 60)
+    hour, minute = divmod(n, 60)
+    return datetime.time(hour, minute, second, microsecond)
+
+
+def _encode_decimals(values):
+    """Encode decimals as (exponents, coefficients), None if any of them doesn't fit.
+
+    The exponent of every value is kept (str() of 1.5 and 1.50 differ), so is
+    the sign of zero, which a scaled integer can't hold.
+    """
+    exponents = array.array('h')
+    coefficients = array.array('q')
+    try:
+        for value in values:
+            if value is None:
+                exponents.append(NULL_EXPONENT)
+                coefficients.append(0)
+                continue
+            sign, _, exponent = value.as_tuple()
+            coefficient = int(value.scaleb(-exponent))    # TypeError for NaN / Infinity
+            if sign and not coefficient:
+                return None    # -0
+            exponents.append(exponent)
+            coefficients.append(coefficient)
+    except (OverflowError, TypeError):
+        return None
+    return _to_bytes(exponents), _to_bytes(coefficients)
+
+
+def _decode_decimals(data):
+    exponents, coefficients = data
+    pairs = zip(_from_bytes('h', exponents), _from_bytes('q', coefficients))
+    return [
+        None if exponent == NULL_EXPONENT else Decimal(coefficient).scaleb(exponent)
+        for exponent, coefficient in pairs
+    ]
+
+
+def _encode_column(field, values):
+    """Return (column type, data) of values of a field."""
+    column_type = FIELD_COLUMN_TYPES.get(field, OBJECT_COLUMN)
+    if column_type == DATE_COLUMN:
+        ordinals = (0 if d is None else d.toordinal() for d in values)
+        return column_type, _to_bytes(array.array('i', ordinals))
+    if column_type == TIME_COLUMN:
+        return column_type, _to_bytes(array.array('q', (_encode_time(t) for t in values)))
+    if column_type == DECIMAL_COLUMN:
+        if any(isinstance(value, int) for value in values):    # minor units (fixed_point_amounts)
+            try:
+                return INT_COLUMN, _to_bytes(array.array('q', values))
+            except (OverflowError, TypeError):    # None or too large
+                return OBJECT_COLUMN, values
+        data = _encode_decimals(values)
+        if data is not None:
+            return column_type, data
+        return DECIMAL_STR_COLUMN, [None if d is None else str(d) for d in values]
+    return column_type, values
+
+
+def _decode_column(column_type, data):
+    if column_type == DATE_COLUMN:
+        return [None if n == 0 else datetime.date.fromordinal(n) for n in _from_bytes('i', data)]
+    if column_type == TIME_COLUMN:
+        return [_decode_time(n) for n in _from_bytes('q', data)]
+    if column_type == DECIMAL_COLUMN:
+        return _decode_decimals(data)
+    if column_type == DECIMAL_STR_COLUMN:
+        return [None if s is None else Decimal(s) for s in data]
+    if column_type == INT_COLUMN:
+        return _from_bytes('q', data).tolist()
+    return data
+
+
+def _encode_chunk(rows):
+    """Encode rows column by column.
+
+    Rows of different bill groups may have different fields (e.g. extra
+    fields), every row refers to its schema (field names, in order), and
+    columns hold the union of fields (None where a row doesn't have it).
+    """
+    schemas = {}    # {schema: id}
+    schema_ids = array.array('H')
+    fields = {}
+    for row in rows:
+        schema = tuple(row)
+        if schema not in schemas:
+            schemas[schema] = len(schemas)
+            fields.update(dict.fromkeys(schema))
+        schema_ids.append(schemas[schema])
+    columns = [(field, *_encode_column(field, [row.get(field, None) for row in rows]))
+               for field in fields]
+    return list(schemas), _to_bytes(schema_ids), columns
+
+
+def _decode_chunk(chunk):
+    schemas, schema_ids, columns = chunk
+    values = {field: _decode_column(column_type, data) for field, column_type, data in columns}
+    return [
+        {field: values[field][idx] for field in schemas[schema_id]}
+        for idx, schema_id in enumerate(_from_bytes('H', schema_ids))
+    ]
+
+
+def write_snapshot(aggregator, file):
+    """Write aggregated results (and quarantined rows) of aggregator into a snapshot file.
+
+    Layout: header (magic, version, footer offset), then chunks of rows of
+    every aggregation (marshal records, typed columns), then a footer
+    (marshal) with the config digest and the chunks of every aggregation.
+    Results which can only be consumed once (spilled to disk) are replaced
+    with rows read back from the snapshot.
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    aggregations = []
+    with open(file, 'wb') as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0))
+        for aggregation, rows in aggregator.aggregated_results.items():
+            offset = f.tell()
+            chunk_count = 0
+            row_count = 0
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == CHUNK_ROWS:
+                    marshal.dump(_encode_chunk(chunk), f)
+                    chunk_count += 1
+                    row_count += len(chunk)
+                    chunk = []
+            if chunk:
+                marshal.dump(_encode_chunk(chunk), f)
+                chunk_count += 1
+                row_count += len(chunk)
+            aggregations.append((aggregation, offset, chunk_count, row_count))
+
+        footer_offset = f.tell()
+        marshal.dump({
+            'config_digest': get_extract_config_digest(aggregator.conf),
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'aggregations': aggregations,
+            'quarantined': aggregator.quarantined_rows,
+            'source_files': aggregator.source_files,
+        }, f)
+        f.seek(0)
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, footer_offset))
+
+    snapshot = None
+    for aggregation, rows in aggregator.aggregated_results.items():
+        if not isinstance(rows, list):
+            snapshot = snapshot or Snapshot(file)
+            aggregator.aggregated_results[aggregation] = snapshot.iter_rows(aggregation)
+
+
+class Snapshot:
+    """Aggregated results of a run, rows are read lazily (one chunk at a time)."""
+
+    def __init__(self, file):
+        self.file = file
+        try:
+            with open(file, 'rb') as f:
+                magic, version, footer_offset = HEADER.unpack(f.read(HEADER.size))
+                if magic != SNAPSHOT_MAGIC:
+                    raise BillAggException(f'Not a snapshot file: {file}')
+                if version != SNAPSHOT_VERSION:
+                    raise BillAggException(f'Unsupported snapshot version {version}: {file}')
+                f.seek(footer_offset)
+                footer = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError, struct.error) as exc:
+            raise BillAggException(f'Not a snapshot file: {file}') from exc
+        self.config_digest = footer['config_digest']
+        self.created = footer['created']
+        self.aggregations = {name: (offset, chunk_count, row_count)
+                             for name, offset, chunk_count, row_count in footer['aggregations']}
+        self.quarantined = footer['quarantined']
+        self.source_files = footer.get('source_files', [])
+
+    @property
+    def row_count(self):
+        return sum(row_count for _, _, row_count in self.aggregations.values())
+
+    def iter_rows(self, aggregation):
+        """Yield rows of an aggregation, in sorted order."""
+        offset, chunk_count, _ = self.aggregations[aggregation]
+        with open(self.file, 'rb') as f:
+            f.seek(offset)
+            for _ in range(chunk_count):
+                yield from _decode_chunk(marshal.load(f))
+
+
+def load_snapshot(aggregator, file):
+    """Load a snapshot as aggregated results of aggregator (instead of extracting/aggregating)."""
+    if not file.is_file():
+        raise BillAggException(f'No snapshot found: {file}, run without --export-only first')
+    snapshot = Snapshot(file)
+    if snapshot.config_digest != get_extract_config_digest(aggregator.conf):
+        raise BillAggException(
+            'Config changed (other than export_to / export_config) since the snapshot was made, '
+            'run without --export-only')
+    aggregator.aggregated_results = {
+        aggregation: snapshot.iter_rows(aggregation) for aggregation in snapshot.aggregations}
+    aggregator.quarantined_rows = snapshot.quarantined
+    aggregator.source_files = snapshot.source_files
+    aggregator.log_sink.snapshot_loaded(snapshot.created, snapshot.row_count)
+    return snapshot
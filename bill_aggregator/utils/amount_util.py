@@ -1,6 +1,9 @@
 import re
 from decimal import Decimal
 
+from bill_aggregator.consts import (
+    CURRENCY_SCALES, DEFAULT_CURRENCY_SCALE, AmountType, CUR, AMT, AMT_TYPE, BASE_AMT,
+)
 from bill_aggregator.exceptions import BillAggException
 
 
@@ -29,6 +32,14 @@ def convert_amount_to_decimal(amount, decimal_separator=None):
     All inputs above should return:
         Decimal('-6150593.22')
     """
+    negative, digits = normalize_amount(amount, decimal_separator)
+    if negative:
+        digits = '-' + digits
+    return Decimal(digits)
+
+
+def normalize_amount(amount, decimal_separator=None):
+    """Split currency amount into (negative, digits), e.g. '-$6,150.22' -> (True, '6150.22')"""
     assert isinstance(amount, str)
 
     # extract negative sign, turn into absolute value
@@ -62,11 +73,129 @@ def convert_amount_to_decimal(amount, decimal_separator=None):
             result.append('.')
     result = ''.join(result)
 
-    # add the negative sign if needed
-    if negative:
-        result = '-' + result
+    return negative, result
+
+
+def convert_digits_to_minor_units(digits, scale):
+    """Convert digits (as normalize_amount) into an int of minor units, e.g. ('12.3', 2) -> 1230.
+
+    Never rounds: digits with more (non-zero) fraction digits than scale are an error.
+    """
+    int_part, _, fraction = digits.partition('.')
+    if len(fraction) > scale:
+        if fraction[scale:].strip('0'):
+            raise BillAggException(f'Amount {digits} has more than {scale} decimal places')
+        fraction = fraction[:scale]
+    return int(int_part + fraction.ljust(scale, '0'))
+
+
+def convert_minor_units(units, scale, rate, to_scale):
+    """Convert minor units of scale at rate (Decimal) into minor units of to_scale.
+
+    Rounded half to even, same as Decimal.quantize() with the default context.
+    """
+    numerator, denominator = rate.as_integer_ratio()
+    numerator *= abs(units) * 10 ** to_scale
+    denominator *= 10 ** scale
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return -quotient if units < 0 else quotient
+
+
+def format_minor_units(units, scale, negative=False):
+    """Display form of minor units, e.g. (-12345, 2) -> '-123.45' (negative: for "-0.00")"""
+    sign = '-' if units < 0 or negative else ''
+    digits = str(abs(units))
+    if not scale:
+        return sign + digits
+    digits = digits.rjust(scale + 1, '0')
+    return f'{sign}{digits[:-scale]}.{digits[-scale:]}'
+
+
+class DecimalAmounts:
+    """Amounts as Decimal, as written in bill files (exponent and sign of zero are kept)."""
+
+    ZERO = POS_ZERO
+
+    @staticmethod
+    def parse(amount, decimal_separator=None):
+        """Return (negative, absolute value) of a currency amount string."""
+        negative, digits = normalize_amount(amount, decimal_separator)
+        return negative, Decimal(digits)
+
+    @staticmethod
+    def signed(value, negative):
+        return value.copy_sign(NEG if negative else POS)
+
+    @staticmethod
+    def is_negative(value):
+        return value.is_signed()
+
+
+class FixedPointAmounts:
+    """Amounts as int minor units of a currency (e.g. cents), see fixed_point_amounts."""
+
+    ZERO = 0
+
+    def __init__(self, scale):
+        self.scale = scale
+
+    def parse(self, amount, decimal_separator=None):
+        """Return (negative, absolute value) of a currency amount string."""
+        negative, digits = normalize_amount(amount, decimal_separator)
+        return negative, convert_digits_to_minor_units(digits, self.scale)
+
+    @staticmethod
+    def signed(value, negative):
+        return -value if negative else value
+
+    @staticmethod
+    def is_negative(value):
+        return value < 0
+
+
+def get_amounts(amount_scale=None):
+    """Amount representation of extractors: Decimal, or minor units if amount_scale is given."""
+    if amount_scale is None:
+        return DecimalAmounts()
+    return FixedPointAmounts(amount_scale)
+
+
+class CurrencyScales:
+    """Scales (decimal places) of minor units by currency, see fixed_point_amounts.
+
+    base: scale of amounts converted into base currency (currency_conversion.decimal_places)
+    """
 
-    return Decimal(result)
+    def __init__(self, overrides=None, base=DEFAULT_CURRENCY_SCALE):
+        self.scales = dict(CURRENCY_SCALES, **(overrides or {}))
+        self.base = base
+
+    def get(self, currency):
+        return self.scales.get(currency, DEFAULT_CURRENCY_SCALE)
+
+    def format_amount(self, row):
+        """Display form of the amount of a row, e.g. '-2000.00' ('-0.00' for outbound zero)."""
+        return format_minor_units(
+            row[AMT], self.get(row[CUR]), negative=row[AMT_TYPE] == AmountType.OUT)
+
+    def format_base_amount(self, row):
+        """Display form of the base amount of a row, None if there is none."""
+        if row.get(BASE_AMT, None) is None:
+            return None
+        return format_minor_units(
+            row[BASE_AMT], self.base,
+            negative=row[AMT] < 0 or row[AMT_TYPE] == AmountType.OUT)
+
+    def to_decimal_amounts(self, row):
+        """Copy of a row with amounts as Decimal (display form), for outputs other than exports."""
+        row = dict(row)
+        row[AMT] = Decimal(self.format_amount(row))
+        base_amount = self.format_base_amount(row)
+        if base_amount is not None:
+            row[BASE_AMT] = Decimal(base_amount)
+        return row
 
 
 def detect_decimal_separator(amount):
@@ -0,0 +1,85 @@
+import gzip
+import io
+import pathlib
+import zipfile
+
+from bill_aggregator.consts import COMPRESSED_EXTENSIONS, ARCHIVE_EXTENSIONS
+
+
+class ArchivedFile:
+    """Bill file inside a gzip compressed file or a zip archive.
+
+    It is never unpacked to disk, open() returns a stream which decompresses
+    incrementally. name and suffix are those of the bill file itself
+    (e.g. "a.csv" for "a.csv.gz", or for member "2024/a.csv" of "b.zip"), so
+    that file_pattern and file type are matched as for plain files.
+    """
+
+    def __init__(self, archive, member=None):
+        self.archive = archive    # pathlib.Path of the file on disk
+        self.member = member    # member name in zip archive, None for gzip
+        self.name = pathlib.PurePosixPath(member).name if member else archive.stem
+        self.suffix = pathlib.PurePosixPath(self.name).suffix
+        # for logging
+        self.label = f'{archive.name}/{member}' if member else archive.name
+
+    def _key(self):
+        return (self.archive, self.member or '')
+
+    def __eq__(self, other):
+        return isinstance(other, ArchivedFile) and self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        return f'{self.archive}:{self.member}' if self.member else str(self.archive)
+
+    def __repr__(self):
+        return f'ArchivedFile({str(self)!r})'
+
+    def is_dir(self):
+        return False
+
+    def open(self, mode='r', encoding=None):
+        """Open as a stream, same as pathlib.Path.open ("r" or "rb" only)."""
+        if mode not in ('r', 'rb'):
+            raise ValueError(f'Invalid mode for archived file: {mode}')
+        if self.member is None:
+            f = gzip.open(self.archive, 'rb')
+        else:
+            # the member stream keeps the archive open until it is closed
+            with zipfile.ZipFile(self.archive) as zf:
+                f = zf.open(self.member)
+        if mode == 'r':
+            return io.TextIOWrapper(f, encoding=encoding)
+        return f
+
+
+def is_archive(path):
+    suffix = path.suffix.lower()
+    return suffix in COMPRESSED_EXTENSIONS or suffix in ARCHIVE_EXTENSIONS
+
+
+def list_archived_files(path):
+    """List bill files in a compressed file or zip archive, [] if it is not one."""
+    suffix = path.suffix.lower()
+    if suffix in COMPRESSED_EXTENSIONS:
+        return [ArchivedFile(path)]
+    if suffix in ARCHIVE_EXTENSIONS:
+        try:
+            with zipfile.ZipFile(path) as zf:
+                members = [info.filename for info in zf.infolist() if not info.is_dir()]
+        except zipfile.BadZipFile:
+            return []
+        return [ArchivedFile(path, member) for member in sorted(members)]
+    return []
+
+
+def read_bytes(file):
+    """Read whole content of a bill file (plain or archived)."""
+    with file.open('rb') as f:
+        return f.read()
@@ -1,37 +1,75 @@
+import datetime
+import hashlib
+import json
 from functools import wraps
 
 import yaml
-from schema import Schema, Or, Optional, SchemaError
+from schema import Schema, And, Or, Optional, SchemaError
 
 from bill_aggregator.consts import (
-    DEFAULT_CONFIG_FILE, FileType, AmountFormat, ExportType,
-    FIELDS, EXT_FIELDS, COL, FORMAT, ACCT, CUR, DATE, TIME, NAME, MEMO, AMT,
+    DEFAULT_CONFIG_FILE, FileType, Engine, CsvReader, AmountFormat, ExportType, SplitBy, SplitTo,
+    CellFormats, TransferAction, RowErrorAction, DateLocale,
+    FIELDS, EXT_FIELDS, COL, FORMAT, ACCT, CUR, DATE, TIME, NAME, MEMO, AMT, BASE_AMT, FX_RATE,
+    TRANSFER_ID, FINGERPRINT, SOURCE_FILE, SOURCE_SHEET, SOURCE_LINE,
 )
 from bill_aggregator.exceptions import BillAggConfigError
 
 
+# keys of the config which only affect exporting, see get_extract_config_digest()
+EXPORT_CONFIG_KEYS = ['export_to', 'export_config']
+
+date_schema = And(datetime.date, lambda d: not isinstance(d, datetime.datetime))
+
 config_schema = Schema({
     'bill_groups': list,    # bill_group_schema
     Optional('separate_by_currency'): bool,
+    Optional('auto_detect'): bool,
+    Optional('prefetch'): And(int, lambda n: n >= 0),    # prefetch window (files), 0 = off
+    Optional('memory_budget'): And(int, lambda n: n > 0),    # MB of rows in memory, then spilled
+    Optional('fixed_point_amounts'): bool,    # amounts as int minor units, instead of Decimal
+    Optional('currency_scales'): {str: And(int, lambda n: 0 <= n <= 18)},    # decimal places
+    Optional('provenance'): bool,    # fingerprint and source file / line of every row
+    Optional('since'): date_schema,    # only keep bills within [since, until]
+    Optional('until'): date_schema,
+    Optional('currency_conversion'): {
+        'base_currency': str,
+        'rate_file': str,    # relative to bills directory
+        Optional('decimal_places'): And(int, lambda n: n >= 0),
+    },
+    Optional('transfer_matching'): {
+        Optional('max_days'): And(int, lambda n: n >= 0),    # default: 3
+        Optional('action'): Or(*TransferAction.ALL),
+    },
     'export_to': str,
     'export_config': dict,    # one of export_config_schemas
 })
 
+manifest_schema = Schema([{    # batch mode, paths are relative to the manifest file
+    'config': str,
+    'dir': str,
+    Optional('name'): str,
+}])
+
 bill_group_schema = Schema({
     ACCT: str,
     Optional(CUR): str,
     'file_type': str,
+    Optional('file_pattern'): str,
     'file_config': dict,    # one of file_config_schemas
     Optional('final_memo'): [str],
+    Optional('shard'): And(int, lambda n: n >= 1),    # shard mode, default: by account hash
 })
 
 tabular_file_config_common = {  # Not a Schema(), don't validate on this
+    Optional('engine'): Or(*Engine.ALL),
+    Optional('on_row_error'): Or(*RowErrorAction.ALL),
     'has_header': bool,
     FIELDS: {
         DATE: {
             COL: Or(str, int, [Or(str, int)]),
             Optional('dayfirst'): bool,
             Optional('yearfirst'): bool,
+            Optional('locale'): Or(*DateLocale.ALL),    # language of month names, e.g. "fr"
         },
         Optional(TIME): {
             COL: Or(str, int),
@@ -55,9 +93,11 @@ file_config_schemas = {
     FileType.CSV: Schema({
         Optional('encoding'): str,
         Optional('delimiter'): str,
+        Optional('reader'): Or(*CsvReader.ALL),
         **tabular_file_config_common,
     }),
     FileType.XLS: Schema({
+        Optional('sheets'): Or('all', str, int, [Or(str, int)]),
         Optional('skiprows'): int,
         Optional('skipfooters'): int,
         **tabular_file_config_common,
@@ -86,16 +126,36 @@ amount_config_schemas = {
     })
 }
 
+export_config_common = {  # Not a Schema(), don't validate on this
+    'columns': [{
+        'header': str,
+        'data': dict,
+        Optional('style'): dict,
+    }],
+}
+
+xlsx_export_config_options = {  # Not a Schema(), don't validate on this
+    Optional('font_size'): int,
+    Optional('row_height'): int,
+    Optional('table_style'): str,
+    Optional('split_by'): Or(*SplitBy.ALL),
+    Optional('split_to'): Or(*SplitTo.ALL),
+    Optional('max_rows'): And(int, lambda n: n > 0),
+    Optional('cell_formats'): Or(*CellFormats.ALL),
+}
+
 export_config_schemas = {
     ExportType.XLSX: Schema({
-        Optional('font_size'): int,
-        Optional('row_height'): int,
-        Optional('table_style'): str,
-        'columns': [{
-            'header': str,
-            'data': dict,
-            Optional('style'): dict,
-        }],
+        **xlsx_export_config_options,
+        **export_config_common,
+    }),
+    ExportType.CSV: Schema({
+        Optional('encoding'): str,
+        Optional('delimiter'): str,
+        Optional('gzip'): bool,
+        # xlsx-only options are accepted, so that one export_config fits both
+        **xlsx_export_config_options,
+        **export_config_common,
     }),
 }
 
@@ -120,6 +180,19 @@ class ConfigValidator:
     @config_validation_wrapper
     def validate_general_config(cls, conf):
         config_schema.validate(conf)
+        since = conf.get('since', None)
+        until = conf.get('until', None)
+        if since is not None and until is not None and since > until:
+            raise BillAggConfigError(f'Config Error, since ({since}) is after until ({until})')
+        if 'memory_budget' in conf and 'transfer_matching' in conf:
+            raise BillAggConfigError(
+                'Config Error, transfer_matching needs all rows in memory, '
+                'it can\'t be used with memory_budget')
+
+    @classmethod
+    @config_validation_wrapper
+    def validate_manifest(cls, manifest):
+        manifest_schema.validate(manifest)
 
     @classmethod
     @config_validation_wrapper
@@ -154,6 +227,18 @@ class ConfigValidator:
 
         export_conf = conf['export_config']
         export_config_schemas[export_type].validate(export_conf)
+        for column_conf in export_conf['columns']:
+            field = column_conf['data'].get('field', None)
+            if field in [BASE_AMT, FX_RATE] and 'currency_conversion' not in conf:
+                raise BillAggConfigError(
+                    f'Config Error, column field "{field}" requires currency_conversion')
+            if field == TRANSFER_ID and 'transfer_matching' not in conf:
+                raise BillAggConfigError(
+                    f'Config Error, column field "{field}" requires transfer_matching')
+            if (field in [FINGERPRINT, SOURCE_FILE, SOURCE_SHEET, SOURCE_LINE]
+                    and not conf.get('provenance', False)):
+                raise BillAggConfigError(
+                    f'Config Error, column field "{field}" requires provenance')
 
     @classmethod
     @config_validation_wrapper
@@ -168,3 +253,10 @@ class ConfigValidator:
 def load_yaml_config(file=DEFAULT_CONFIG_FILE):
     with open(file, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
+
+
+def get_extract_config_digest(conf):
+    """Digest of the config except export settings (everything which affects extracted rows)."""
+    extract_conf = {key: value for key, value in conf.items() if key not in EXPORT_CONFIG_KEYS}
+    data = json.dumps(extract_conf, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
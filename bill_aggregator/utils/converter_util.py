@@ -0,0 +1,117 @@
+import json
+from functools import lru_cache
+
+from bill_aggregator.consts import (
+    AmountFormat, AmountType, COL, FORMAT, NAME, MEMO, AMT, AMT_TYPE,
+)
+from bill_aggregator.exceptions import BillAggConfigError
+from bill_aggregator.utils import amount_util
+
+
+CONVERTER_CACHE_SIZE = 256
+
+
+def get_row_converter(fields_conf, ext_fields_conf=None, amount_scale=None):
+    """Get convert(row, result), filling name, memo, amount, amount type and extra fields of a row.
+
+    Configs must be resolved (columns are numbers). The function is generated
+    from the config, with columns and options as constants, and cached by the
+    config, so files of the same bill group share it.
+    """
+    conf = {NAME: fields_conf[NAME], MEMO: fields_conf.get(MEMO, None), AMT: fields_conf[AMT]}
+    key = json.dumps([conf, ext_fields_conf or {}], default=str)
+    return _compile_row_converter(key, amount_scale)
+
+
+@lru_cache(maxsize=CONVERTER_CACHE_SIZE)
+def _compile_row_converter(key, amount_scale):
+    conf, ext_fields_conf = json.loads(key)
+    amounts = amount_util.get_amounts(amount_scale)
+    namespace = {
+        'parse': amounts.parse,
+        'signed': amounts.signed,
+        'is_negative': amounts.is_negative,
+        'ZERO': amounts.ZERO,
+    }
+
+    lines = ['def convert(row, result):']
+    lines.append(f'    result[{NAME!r}] = row[{conf[NAME][COL]!r}]')
+    if conf[MEMO] is not None:
+        lines.append(f'    result[{MEMO!r}] = row[{conf[MEMO][COL]!r}]')
+    else:
+        lines.append(f'    result[{MEMO!r}] = \'\'')
+    lines.extend(_amount_lines(conf[AMT], namespace))
+    for field_name, field_conf in ext_fields_conf.items():
+        lines.append(f'    result[{field_name!r}] = row[{field_conf[COL]!r}]')
+
+    code = compile('\n'.join(lines), f'<row converter {conf[AMT][FORMAT]}>', 'exec')
+    exec(code, namespace)    # pylint: disable=exec-used
+    return namespace['convert']
+
+
+def _amount_lines(amt_conf, namespace):
+    """Source lines converting the amount fields, for the amount format of amt_conf."""
+    amt_format = amt_conf[FORMAT]
+    if amt_format == AmountFormat.ONE_COLUMN_WITH_INDICATORS:
+        # first indicator with a matching value wins, values are looked up in a dict per indicator
+        lines = [f'    negative, amount = parse(row[{amt_conf[COL]!r}])',
+                 '    amount_type = None']
+        for idx, idc_conf in enumerate(amt_conf['indicators']):
+            namespace[f'INDICATOR_{idx}'] = {
+                idc_conf['outbound_value']: AmountType.OUT,
+                idc_conf['inbound_value']: AmountType.IN,    # inbound first on same values
+            }
+            lines.extend([
+                '    if amount_type is None:',
+                f'        amount_type = INDICATOR_{idx}.get(row[{idc_conf[COL]!r}], None)',
+            ])
+        lines.extend([
+            '    if amount_type is None:',
+            f'        amount_type = {AmountType.UNKNOWN!r}',
+            f'    elif amount_type == {AmountType.IN!r}:',
+            '        negative = False',
+            '    else:',
+            '        negative = True',
+            f'    result[{AMT!r}] = signed(amount, negative)',
+            f'    result[{AMT_TYPE!r}] = amount_type',
+        ])
+        return lines
+
+    if amt_format == AmountFormat.ONE_COLUMN_WITH_SIGN:
+        reverse_sign = bool(amt_conf.get('is_outbound_positive', False))
+        return [
+            f'    negative, amount = parse(row[{amt_conf[COL]!r}])',
+            f'    if {"not " if reverse_sign else ""}negative:',
+            f'        result[{AMT!r}] = signed(amount, True)',
+            f'        result[{AMT_TYPE!r}] = {AmountType.OUT!r}',
+            '    else:',
+            f'        result[{AMT!r}] = amount',
+            f'        result[{AMT_TYPE!r}] = {AmountType.IN!r}',
+        ]
+
+    if amt_format == AmountFormat.TWO_COLUMNS:
+        in_col = amt_conf['inbound'][COL]
+        out_col = amt_conf['outbound'][COL]
+        return [
+            f'    in_value = row[{in_col!r}]',
+            f'    out_value = row[{out_col!r}]',
+            '    amount_in = ZERO',
+            '    amount_out = ZERO',
+            '    if in_value:',
+            '        amount_in = parse(in_value)[1]',
+            '    if out_value:',
+            '        amount_out = parse(out_value)[1]',
+            '    amount = amount_in + signed(amount_out, True)',
+            '    if is_negative(amount):',
+            f'        amount_type = {AmountType.OUT!r}',
+            '    elif amount == 0 and out_value:',
+            '        # if outbound field exist, treat 0 as OUT (0 default to IN)',
+            f'        amount_type = {AmountType.OUT!r}',
+            '        amount = signed(amount, True)',
+            '    else:',
+            f'        amount_type = {AmountType.IN!r}',
+            f'    result[{AMT!r}] = amount',
+            f'    result[{AMT_TYPE!r}] = amount_type',
+        ]
+
+    raise BillAggConfigError(f'Config Error, invalid amount format: {amt_format}')
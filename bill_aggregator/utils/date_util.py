@@ -0,0 +1,116 @@
+import re
+from functools import lru_cache
+
+from bill_aggregator.consts import DateLocale
+
+
+DATE_CACHE_SIZE = 65536
+MONTH_ABBRS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+# day ordinals before a (translated) month name: 1er janvier, 1. Januar, 1º de enero
+ORDINAL_PATTERN = re.compile(rf'\b(\d{{1,2}})(?:er|\.|º|°)(?=\s*(?:{"|".join(MONTH_ABBRS)})\b)')
+
+# names of every month (full names, abbreviations and spellings without accents)
+LOCALE_MONTHS = {
+    DateLocale.FR: [
+        ['janvier', 'janv', 'jan'], ['février', 'fevrier', 'févr', 'fevr', 'fév', 'fev'],
+        ['mars'], ['avril', 'avr'], ['mai'], ['juin'], ['juillet', 'juil'],
+        ['août', 'aout', 'aoû'], ['septembre', 'sept', 'sep'], ['octobre', 'oct'],
+        ['novembre', 'nov'], ['décembre', 'decembre', 'déc', 'dec'],
+    ],
+    DateLocale.DE: [
+        ['januar', 'jänner', 'jan', 'jän'], ['februar', 'feber', 'feb'],
+        ['märz', 'maerz', 'marz', 'mär', 'mrz'], ['april', 'apr'], ['mai'], ['juni', 'jun'],
+        ['juli', 'jul'], ['august', 'aug'], ['september', 'sept', 'sep'], ['oktober', 'okt'],
+        ['november', 'nov'], ['dezember', 'dez'],
+    ],
+    DateLocale.ES: [
+        ['enero', 'ene'], ['febrero', 'feb'], ['marzo', 'mar'], ['abril', 'abr'], ['mayo', 'may'],
+        ['junio', 'jun'], ['julio', 'jul'], ['agosto', 'ago'],
+        ['septiembre', 'setiembre', 'sept', 'sep', 'set'], ['octubre', 'oct'], ['noviembre', 'nov'],
+        ['diciembre', 'dic'],
+    ],
+    DateLocale.IT: [
+        ['gennaio', 'gen'], ['febbraio', 'feb'], ['marzo', 'mar'], ['aprile', 'apr'],
+        ['maggio', 'mag'], ['giugno', 'giu'], ['luglio', 'lug'], ['agosto', 'ago'],
+        ['settembre', 'set'], ['ottobre', 'ott'], ['novembre', 'nov'], ['dicembre', 'dic'],
+    ],
+    DateLocale.NL: [
+        ['januari', 'jan'], ['februari', 'feb'], ['maart', 'mrt', 'mar'], ['april', 'apr'], ['mei'],
+        ['juni', 'jun'], ['juli', 'jul'], ['augustus', 'aug'], ['september', 'sept', 'sep'],
+        ['oktober', 'okt'], ['november', 'nov'], ['december', 'dec'],
+    ],
+    DateLocale.PT: [
+        ['janeiro', 'jan'], ['fevereiro', 'fev'], ['março', 'marco', 'mar'], ['abril', 'abr'],
+        ['maio', 'mai'], ['junho', 'jun'], ['julho', 'jul'], ['agosto', 'ago'], ['setembro', 'set'],
+        ['outubro', 'out'], ['novembro', 'nov'], ['dezembro', 'dez'],
+    ],
+}
+
+# words which are dropped: weekday names and abbreviations, fillers (e.g. "3 de enero de 2023")
+LOCALE_IGNORED_WORDS = {
+    DateLocale.FR: [
+        'lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche',
+        'lun', 'mar', 'mer', 'jeu', 'ven', 'sam', 'dim', 'le',
+    ],
+    DateLocale.DE: [
+        'montag', 'dienstag', 'mittwoch', 'donnerstag', 'freitag', 'samstag', 'sonnabend',
+        'sonntag', 'mo', 'di', 'mi', 'do', 'fr', 'sa', 'so', 'den',
+    ],
+    DateLocale.ES: [
+        'lunes', 'martes', 'miércoles', 'miercoles', 'jueves', 'viernes', 'sábado', 'sabado',
+        'domingo', 'lun', 'mié', 'mie', 'jue', 'vie', 'sáb', 'sab', 'dom', 'de', 'del',
+    ],
+    DateLocale.IT: [
+        'lunedì', 'lunedi', 'martedì', 'martedi', 'mercoledì', 'mercoledi', 'giovedì',
+        'giovedi', 'venerdì', 'venerdi', 'sabato', 'domenica',
+        'lun', 'mer', 'gio', 'ven', 'sab', 'dom',
+    ],
+    DateLocale.NL: [
+        'maandag', 'dinsdag', 'woensdag', 'donderdag', 'vrijdag', 'zaterdag', 'zondag',
+        'ma', 'di', 'wo', 'do', 'vr', 'za', 'zo',
+    ],
+    DateLocale.PT: [
+        'segunda-feira', 'terça-feira', 'terca-feira', 'quarta-feira', 'quinta-feira',
+        'sexta-feira', 'sábado', 'sabado', 'domingo',
+        'seg', 'ter', 'qua', 'qui', 'sex', 'sáb', 'sab', 'dom', 'de',
+    ],
+}
+
+
+class LocaleTokens:
+    """Compiled token table of a locale: month names to English abbreviations, weekdays dropped."""
+
+    def __init__(self, locale):
+        self.replacements = {}    # {lowercase token: replacement}
+        for month_abbr, names in zip(MONTH_ABBRS, LOCALE_MONTHS[locale]):
+            for name in names:
+                self.replacements[name] = month_abbr
+        for word in LOCALE_IGNORED_WORDS[locale]:
+            self.replacements.setdefault(word, '')    # month names win (e.g. "mar" in es)
+
+        # longest first, so that full names are matched before their abbreviations
+        words = '|'.join(re.escape(w) for w in sorted(self.replacements, key=len, reverse=True))
+        self.word_pattern = re.compile(rf'\b(?:{words})\b\.?', re.IGNORECASE)
+
+    def _replace(self, match):
+        return self.replacements[match.group(0).rstrip('.').lower()]
+
+    def normalize(self, dt_str):
+        dt_str = self.word_pattern.sub(self._replace, dt_str)
+        dt_str = ORDINAL_PATTERN.sub(r'\1', dt_str)
+        return ' '.join(dt_str.split()).strip(' ,')
+
+
+@lru_cache(maxsize=None)
+def get_locale_tokens(locale):
+    return LocaleTokens(locale)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def normalize_date(dt_str, locale):
+    """Translate month names of locale in a date string into English ("3 févr." -> "3 Feb").
+
+    Weekday names are dropped, the result is left to the usual parsing
+    (dateutil, or a strptime format inferred by the columnar engine).
+    """
+    return get_locale_tokens(locale).normalize(dt_str)
@@ -0,0 +1,181 @@
+import copy
+import csv
+import functools
+import pathlib
+
+import yaml
+
+from bill_aggregator.consts import (
+    FileType, FILE_EXTENSIONS, FIELDS, EXT_FIELDS, COL, ACCT,
+)
+from bill_aggregator.utils.archive_util import ArchivedFile, read_bytes
+from bill_aggregator.utils.lazy_import import lazy_import
+
+
+xlrd = lazy_import('xlrd')
+charset_normalizer = lazy_import('charset_normalizer')
+
+TEMPLATES_DIR = pathlib.Path(__file__).absolute().parent.parent.parent / 'config_templates'
+DETECT_MAX_ROWS = 50    # header is searched within the first rows
+DETECT_MAX_BYTES = 64 * 1024
+DEFAULT_DELIMITER = ','
+
+# priorities when several bill groups match the same file
+PRIORITY_BILL_GROUP = 1
+PRIORITY_TEMPLATE = 0
+
+
+def get_file_type(file):
+    suffix = file.suffix.lower()
+    return next((t for t, exts in FILE_EXTENSIONS.items() if suffix in exts), None)
+
+
+def get_referenced_column_names(bill_group_conf):
+    """Get all column names (str) referenced by a bill group config."""
+    def _collect(conf):
+        if isinstance(conf, dict):
+            for key, value in conf.items():
+                if key == COL:
+                    values = value if isinstance(value, list) else [value]
+                    names.update(v for v in values if isinstance(v, str))
+                else:
+                    _collect(value)
+        elif isinstance(conf, list):
+            for value in conf:
+                _collect(value)
+
+    names = set()
+    file_conf = bill_group_conf['file_config']
+    _collect(file_conf[FIELDS])
+    _collect(file_conf.get(EXT_FIELDS, {}))
+    return frozenset(names)
+
+
+@functools.lru_cache(maxsize=None)
+def load_templates(templates_dir):
+    """Load bill group configs from all templates (cached, they are shipped read-only)."""
+    bill_group_confs = []
+    for template_file in sorted(templates_dir.glob('*.yaml')):
+        with open(template_file, 'r', encoding='utf-8') as f:
+            bill_group_confs.extend(yaml.safe_load(f) or [])
+    return bill_group_confs
+
+
+def read_candidate_rows(file, file_type, delimiters):
+    """Read the first rows of a bill file, return {delimiter: [row, ...]}.
+
+    Fields are stripped. For xls files, the delimiter is None.
+    """
+    if file_type == FileType.XLS:
+        if isinstance(file, ArchivedFile):
+            workbook = xlrd.open_workbook(file_contents=read_bytes(file), on_demand=True)
+        else:
+            workbook = xlrd.open_workbook(file, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+            rows = [[str(v).strip() for v in sheet.row_values(i)]
+                    for i in range(min(sheet.nrows, DETECT_MAX_ROWS))]
+        finally:
+            workbook.release_resources()
+        return {None: rows}
+
+    with file.open('rb') as f:
+        content = f.read(DETECT_MAX_BYTES)
+    result = charset_normalizer.from_bytes(content).best()
+    if not result:
+        return {}
+    lines = str(result).splitlines()[:DETECT_MAX_ROWS]
+    return {
+        delimiter: [[f.strip() for f in row] for row in csv.reader(lines, delimiter=delimiter)]
+        for delimiter in delimiters
+    }
+
+
+class BillGroupIndex:
+    """Hash index for detecting the bill group of a file by its header row.
+
+    Two kinds of fingerprints are indexed:
+    - exact: (file_type, delimiter, column count, header row) of files
+      already extracted by a bill group in this run.
+    - by columns: the set of column names referenced by a bill group (or a
+      template), stored under one "anchor" column name, so that a header row
+      only needs one lookup per field instead of trying every template.
+
+    Headerless bill groups (columns referenced by number) can't be detected.
+    """
+
+    def __init__(self):
+        self.exact = {}    # {(file_type, delimiter, column_count, header): bill_group_conf}
+        self.by_columns = {}    # {(file_type, delimiter, anchor): [(names, priority, conf)]}
+        self.delimiters = {FileType.CSV: {DEFAULT_DELIMITER}, FileType.XLS: {None}}
+        self.templates = []    # bill group configs of templates, in template order
+
+    def _get_delimiter(self, bill_group_conf):
+        if bill_group_conf['file_type'] == FileType.XLS:
+            return None
+        return bill_group_conf['file_config'].get('delimiter', DEFAULT_DELIMITER)
+
+    def add_bill_group(self, bill_group_conf, priority=PRIORITY_BILL_GROUP):
+        if not bill_group_conf['file_config'].get('has_header', False):
+            return
+        names = get_referenced_column_names(bill_group_conf)
+        if not names:
+            return
+        file_type = bill_group_conf['file_type']
+        delimiter = self._get_delimiter(bill_group_conf)
+        self.delimiters.setdefault(file_type, set()).add(delimiter)
+        key = (file_type, delimiter, min(names))
+        self.by_columns.setdefault(key, []).append((names, priority, bill_group_conf))
+
+    def add_templates(self, templates_dir=TEMPLATES_DIR):
+        for bill_group_conf in copy.deepcopy(load_templates(templates_dir)):
+            self.templates.append(bill_group_conf)
+            self.add_bill_group(bill_group_conf, priority=PRIORITY_TEMPLATE)
+
+    def add_header(self, file_type, delimiter, column_count, header_row, bill_group_conf):
+        """Remember the header of a file that was extracted by bill_group_conf."""
+        key = (file_type, delimiter, column_count, tuple(header_row))
+        self.exact.setdefault(key, bill_group_conf)
+
+    def lookup(self, file):
+        """Detect bill group config for file, return None if not found or ambiguous.
+
+        Files which can't be read or parsed are not detected either.
+        """
+        file_type = get_file_type(file)
+        if file_type is None:
+            return None
+        try:
+            candidate_rows = read_candidate_rows(file, file_type, self.delimiters[file_type])
+        except Exception:    # pylint: disable=broad-except
+            # any file may be unmatched (e.g. a corrupt xls), xlrd raises all kinds of errors
+            return None
+
+        # exact header fingerprint
+        for delimiter, rows in candidate_rows.items():
+            for row in rows:
+                conf = self.exact.get((file_type, delimiter, len(row), tuple(row)), None)
+                if conf is not None:
+                    return conf
+
+        # referenced column names
+        matches = []
+        for delimiter, rows in candidate_rows.items():
+            for row in rows:
+                header = set(row)
+                for name in header:
+                    key = (file_type, delimiter, name)
+                    for names, priority, conf in self.by_columns.get(key, []):
+                        if names <= header:
+                            matches.append(((priority, len(names)), conf))
+            if matches:
+                break
+        if not matches:
+            return None
+        matches.sort(key=lambda m: m[0], reverse=True)
+        best_rank, best_conf = matches[0]
+        others = [conf for rank, conf in matches[1:]
+                  if rank == best_rank and conf[ACCT] != best_conf[ACCT]]
+        if others:
+            return None    # ambiguous
+        return best_conf
@@ -0,0 +1,66 @@
+import re
+
+
+# Excel date/time tokens, longest first (month/minute "m" is resolved by context)
+EXCEL_DT_TOKEN_RE = re.compile(
+    r'"[^"]*"|\\.|\[[^\]]*\]|AM/PM|A/P|yyyy|yy|mmmmm|mmmm|mmm|mm|m|dddd|ddd|dd|d|hh|h|ss|s|.',
+    re.IGNORECASE)
+
+EXCEL_DT_TOKEN_MAP = {
+    'yyyy': '%Y',
+    'yy': '%y',
+    'mmmmm': '%b',
+    'mmmm': '%B',
+    'mmm': '%b',
+    'dddd': '%A',
+    'ddd': '%a',
+    'dd': '%d',
+    'd': '%d',
+    'ss': '%S',
+    's': '%S',
+    'am/pm': '%p',
+    'a/p': '%p',
+}
+
+
+def excel_format_to_strftime(number_format):
+    """Translate an Excel date/time number_format into a strftime format.
+
+    Input:
+        'yyyy-mm-dd'    ->  '%Y-%m-%d'
+        'hh:mm'         ->  '%H:%M'
+        'd mmm yyyy'    ->  '%d %b %Y'
+        'h:mm AM/PM'    ->  '%I:%M %p'
+
+    strftime has no portable un-padded directives, so single letter tokens
+    (e.g. "d", "m", "h") are rendered zero-padded.
+    """
+    tokens = EXCEL_DT_TOKEN_RE.findall(number_format)
+    lower_tokens = [t.lower() for t in tokens]
+    twelve_hour = 'am/pm' in lower_tokens or 'a/p' in lower_tokens
+
+    result = []
+    for idx, token in enumerate(tokens):
+        lower = lower_tokens[idx]
+        if token.startswith('"'):
+            result.append(token[1:-1].replace('%', '%%'))
+        elif token.startswith('\\'):
+            result.append(token[1:].replace('%', '%%'))
+        elif token.startswith('['):
+            continue    # colors / elapsed time / locale codes are not supported
+        elif lower in ('m', 'mm'):
+            # minutes if right after hours or right before seconds, month otherwise
+            prev_tokens = [t for t in lower_tokens[:idx] if t.isalpha()]
+            next_tokens = [t for t in lower_tokens[idx+1:] if t.isalpha()]
+            is_minute = ((prev_tokens and prev_tokens[-1] in ('h', 'hh'))
+                         or (next_tokens and next_tokens[0] in ('s', 'ss')))
+            result.append('%M' if is_minute else '%m')
+        elif lower in ('h', 'hh'):
+            result.append('%I' if twelve_hour else '%H')
+        elif lower in EXCEL_DT_TOKEN_MAP:
+            result.append(EXCEL_DT_TOKEN_MAP[lower])
+        elif token == '%':
+            result.append('%%')
+        else:
+            result.append(token)
+    return ''.join(result)
@@ -0,0 +1,69 @@
+import bisect
+import csv
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from bill_aggregator.exceptions import BillAggConfigError
+
+
+RATE_FILE_COLUMNS = ['date', 'currency', 'rate']
+
+
+class FxRateTable:
+    """Local FX rate table, for converting amounts into a base currency.
+
+    Rate file is a csv file with header "date,currency,rate", where rate is
+    the price of 1 unit of currency in base currency. Rates are kept in one
+    sorted array per currency, an amount is converted with the rate of the
+    nearest date on or before its own date (lookups are cached).
+    """
+
+    def __init__(self, base_currency):
+        self.base_currency = base_currency
+        self.dates = {}    # {currency: [date, ...]} (sorted)
+        self.rates = {}    # {currency: [rate, ...]}
+        self.cache = {}    # {(currency, date): rate or None}
+
+    def load(self, file):
+        if not file.is_file():
+            raise BillAggConfigError(f'Config Error, no such FX rate file: {file}')
+
+        entries = {}    # {currency: {date: rate}}, later lines take precedence
+        with open(file, 'r', encoding='utf-8-sig', newline='') as f:
+            csvreader = csv.reader(f)
+            header = [h.strip().lower() for h in next(csvreader, [])]
+            if header != RATE_FILE_COLUMNS:
+                raise BillAggConfigError(
+                    f'Config Error, FX rate file must have header: {",".join(RATE_FILE_COLUMNS)}')
+            for line_no, row in enumerate(csvreader, start=2):
+                if not any(f.strip() for f in row):
+                    continue
+                try:
+                    date_str, currency, rate_str = (f.strip() for f in row)
+                    date = datetime.date.fromisoformat(date_str)
+                    rate = Decimal(rate_str)
+                except (ValueError, InvalidOperation) as exc:
+                    raise BillAggConfigError(
+                        f'Config Error, invalid FX rate in line {line_no}: {row}') from exc
+                entries.setdefault(currency, {})[date] = rate
+
+        for currency, rates in entries.items():
+            dates = sorted(rates)
+            self.dates[currency] = dates
+            self.rates[currency] = [rates[d] for d in dates]
+        self.cache = {}
+
+    def get_rate(self, currency, date):
+        """Get rate of currency on date (or the nearest prior date), None if unknown."""
+        if currency == self.base_currency:
+            return Decimal(1)
+        key = (currency, date)
+        if key not in self.cache:
+            rate = None
+            dates = self.dates.get(currency, None)
+            if dates:
+                idx = bisect.bisect_right(dates, date) - 1
+                if idx >= 0:
+                    rate = self.rates[currency][idx]
+            self.cache[key] = rate
+        return self.cache[key]
@@ -0,0 +1,35 @@
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy, the real module is imported on first attribute access.
+
+    Thread-safe (unlike importlib.util.LazyLoader), lazy modules may be first
+    used from worker threads.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def _load(self):
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                self._lazy_module = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """Import a module lazily, it is actually loaded on first attribute access.
+
+    Used for heavy third-party modules (xlrd, xlsxwriter, dateutil...), so that
+    startup and config validation don't pay for extractors/exporters that are
+    never used in the run.
+    """
+    return LazyModule(name)
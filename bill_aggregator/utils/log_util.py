@@ -1,5 +1,8 @@
+import contextlib
+import contextvars
+
 from bill_aggregator.consts import (
-    LogLevel, ExtractLoggerScope, ExtractLoggerField, Color,
+    RESULTS_DIR, LogLevel, ExtractLoggerScope, ExtractLoggerField, Color,
 )
 from bill_aggregator.exceptions import BillAggBaseException
 from bill_aggregator.utils.string_util import Align, fit_string, wrap_string
@@ -17,103 +20,49 @@ class LogData:
         return True
 
 
-class ExtractLogger:
-    """Logger for Extracting data from bill files.
+class BaseLogSink:
+    """Receives the logs of a run, drops them (subclass it to collect logs).
 
-    self.data: [
-        {
-            'account': ...,
-            'messages': [...],
-            'files': [
-                {
-                    'file': ...,
-                    'rows': ...,
-                    'skip_rows': ...,
-                    'messages': [...],
-                    'ended': False,
-                },
-                ...  # list of file_data
-            ],
-            'ended': False,
-        },
-        ...  # list of group_data
-    ]
+    group_data is the log data of one bill group, see ExtractLogger.
     """
 
-    GRP_WD = 20
-    FILE_WD = 30
-    ROWS_WD = 5
-    MSG_WD = 60
-    LINE_FORMAT = '{grp_str}   {file_str}   {rows_str}   {msg_str}'
+    def bill_group_logged(self, group_data):
+        pass
 
-    def __init__(self):
-        self.header_printed = False
-        self.warn_count = 0
-        self.error_count = 0
+    def extracting_completed(self, warn_count, error_count):
+        pass
 
-        self._reset_data()
+    def transfers_matched(self, count):
+        pass
 
-    def _reset_data(self):
-        self.data = []
+    def shards_merged(self, shard_count, row_count, warn_count, error_count):
+        pass
 
-    def _new_group_data(self):
-        return {
-            'account': LogData(),
-            'messages': [],
-            'files': [],
-            'ended': False,
-        }
+    def snapshot_loaded(self, created, row_count):
+        pass
 
-    def _new_file_data(self):
-        return {
-            'file': LogData(),
-            'rows': LogData(),
-            'skip_rows': LogData(),
-            'messages': [],
-            'ended': False,
-        }
+    def exporting_started(self):
+        pass
 
-    def _last_or_new_group_data(self):
-        if len(self.data) == 0 or self.data[-1]['ended']:
-            self.data.append(self._new_group_data())
-        return self.data[-1]
-
-    def _last_or_new_file_data(self):
-        group_data = self._last_or_new_group_data()
-        if len(group_data['files']) == 0 or group_data['files'][-1]['ended']:
-            group_data['files'].append(self._new_file_data())
-        return group_data['files'][-1]
+    def file_exported(self, file, row_count):
+        pass
 
-    def _log_group_data(self, field, value, level):
-        assert field in ExtractLoggerField.GROUP_ALL
-        assert level in LogLevel.ALL
+    def exporting_completed(self):
+        pass
 
-        group_data = self._last_or_new_group_data()
-        if field == ExtractLoggerField.ACCT:
-            group_data['account'] = LogData(value=value, level=level)
-        elif field == ExtractLoggerField.MSG:
-            group_data['messages'].append(LogData(value=value, level=level))
 
-    def _log_file_data(self, field, value, level):
-        assert field in ExtractLoggerField.FILE_ALL
-        assert level in LogLevel.ALL
+class ConsoleLogSink(BaseLogSink):
+    """Print logs to the console, as tables."""
 
-        file_data = self._last_or_new_file_data()
-        if field == ExtractLoggerField.FILE:
-            file_data['file'] = LogData(value=value, level=level)
-        elif field == ExtractLoggerField.ROWS:
-            file_data['rows'] = LogData(value=value, level=level)
-        elif field == ExtractLoggerField.SKIP_ROWS:
-            file_data['skip_rows'] = LogData(value=value, level=level)
-        elif field == ExtractLoggerField.MSG:
-            file_data['messages'].append(LogData(value=value, level=level))
+    GRP_WD = 20
+    FILE_WD = 30
+    ROWS_WD = 5
+    MSG_WD = 60
+    DEST_WD = 30
+    LINE_FORMAT = '{grp_str}   {file_str}   {rows_str}   {msg_str}'
 
-    def log(self, scope, field, value, level=LogLevel.DEFAULT):
-        assert scope in ExtractLoggerScope.ALL
-        if scope == ExtractLoggerScope.GROUP:
-            self._log_group_data(field=field, value=value, level=level)
-        elif scope == ExtractLoggerScope.FILE:
-            self._log_file_data(field=field, value=value, level=level)
+    def __init__(self):
+        self.header_printed = False
 
     def print_header(self):
         grp_str = fit_string("Bill Group", self.GRP_WD)
@@ -176,7 +125,7 @@ class ExtractLogger:
                 msg_str=f'{msg_color}{msg_str}{Color.ENDC}',
             ))
 
-    def print_group_data(self, group_data):
+    def bill_group_logged(self, group_data):
         g_line = 0
 
         for file_data in group_data['files']:
@@ -207,6 +156,160 @@ class ExtractLogger:
             self.print_line(account=group_data['account'])
             g_line += 1
 
+    def extracting_completed(self, warn_count, error_count):
+        message = 'Extracting completed.'
+
+        warn_msg = f'{warn_count} warning{"" if warn_count == 1 else "s"}'
+        error_msg = f'{error_count} error{"" if error_count == 1 else "s"}'
+        warn_msg = f'{Color.WARN}{warn_msg}{Color.ENDC}'
+        error_msg = f'{Color.ERROR}{error_msg}{Color.ENDC}'
+        if warn_count and error_count:
+            message += f' ({warn_msg}, {error_msg})'
+        elif warn_count:
+            message += f' ({warn_msg})'
+        elif error_count:
+            message += f' ({error_msg})'
+        print(message)
+
+    def transfers_matched(self, count):
+        print(f'Matched {count} inter-account transfers.')
+
+    def shards_merged(self, shard_count, row_count, warn_count, error_count):
+        message = f'Merged {shard_count} shards: {row_count} items.'
+        if warn_count or error_count:
+            color = Color.ERROR if error_count else Color.WARN
+            message += (f' ({color}{warn_count} warning{"" if warn_count == 1 else "s"}, '
+                        f'{error_count} error{"" if error_count == 1 else "s"} in shards'
+                        f'{Color.ENDC})')
+        print(message)
+
+    def snapshot_loaded(self, created, row_count):
+        print(f'Loaded snapshot of {created}: {row_count} items.')
+
+    def exporting_started(self):
+        print()
+        dest_str = fit_string('Export destination', width=self.DEST_WD)
+        rows_str = fit_string('Items', width=self.ROWS_WD, align=Align.RIGHT)
+        print(f'{Color.HEADER}{dest_str}   {rows_str}{Color.ENDC}')
+
+    def file_exported(self, file, row_count):
+        dest_str = '<bill_dir>/' + RESULTS_DIR + file.name
+        dest_str = fit_string(dest_str, width=self.DEST_WD)
+        rows_str = fit_string(str(row_count), width=self.ROWS_WD, align=Align.RIGHT)
+        print(f'{Color.OKCYAN}{dest_str}{Color.ENDC}   {Color.OKGREEN}{rows_str}{Color.ENDC}')
+
+    def exporting_completed(self):
+        print('Exporting completed.')
+
+
+class ExtractLogger:
+    """Logger for Extracting data from bill files.
+
+    self.data: [
+        {
+            'account': ...,
+            'messages': [...],
+            'files': [
+                {
+                    'file': ...,
+                    'rows': ...,
+                    'skip_rows': ...,
+                    'messages': [...],
+                    'ended': False,
+                },
+                ...  # list of file_data
+            ],
+            'ended': False,
+        },
+        ...  # list of group_data
+    ]
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else ConsoleLogSink()
+        self.warn_count = 0
+        self.error_count = 0
+
+        self._reset_data()
+
+    def _reset_data(self):
+        self.data = []
+
+    def reset(self):
+        """Clear all data and counts, without sending anything to the sink."""
+        self.warn_count = 0
+        self.error_count = 0
+        self._reset_data()
+
+    def current_file_data(self):
+        return self._last_or_new_file_data()
+
+    def pop_file_logs(self):
+        """Remove logs of the last bill file, return (skip_rows, messages)."""
+        if len(self.data) == 0 or len(self.data[-1]['files']) == 0:
+            return None, []
+        file_data = self.data[-1]['files'].pop()
+        return file_data['skip_rows'].value, file_data['messages']
+
+    def _new_group_data(self):
+        return {
+            'account': LogData(),
+            'messages': [],
+            'files': [],
+            'ended': False,
+        }
+
+    def _new_file_data(self):
+        return {
+            'file': LogData(),
+            'rows': LogData(),
+            'skip_rows': LogData(),
+            'messages': [],
+            'ended': False,
+        }
+
+    def _last_or_new_group_data(self):
+        if len(self.data) == 0 or self.data[-1]['ended']:
+            self.data.append(self._new_group_data())
+        return self.data[-1]
+
+    def _last_or_new_file_data(self):
+        group_data = self._last_or_new_group_data()
+        if len(group_data['files']) == 0 or group_data['files'][-1]['ended']:
+            group_data['files'].append(self._new_file_data())
+        return group_data['files'][-1]
+
+    def _log_group_data(self, field, value, level):
+        assert field in ExtractLoggerField.GROUP_ALL
+        assert level in LogLevel.ALL
+
+        group_data = self._last_or_new_group_data()
+        if field == ExtractLoggerField.ACCT:
+            group_data['account'] = LogData(value=value, level=level)
+        elif field == ExtractLoggerField.MSG:
+            group_data['messages'].append(LogData(value=value, level=level))
+
+    def _log_file_data(self, field, value, level):
+        assert field in ExtractLoggerField.FILE_ALL
+        assert level in LogLevel.ALL
+
+        file_data = self._last_or_new_file_data()
+        if field == ExtractLoggerField.FILE:
+            file_data['file'] = LogData(value=value, level=level)
+        elif field == ExtractLoggerField.ROWS:
+            file_data['rows'] = LogData(value=value, level=level)
+        elif field == ExtractLoggerField.SKIP_ROWS:
+            file_data['skip_rows'] = LogData(value=value, level=level)
+        elif field == ExtractLoggerField.MSG:
+            file_data['messages'].append(LogData(value=value, level=level))
+
+    def log(self, scope, field, value, level=LogLevel.DEFAULT):
+        assert scope in ExtractLoggerScope.ALL
+        if scope == ExtractLoggerScope.GROUP:
+            self._log_group_data(field=field, value=value, level=level)
+        elif scope == ExtractLoggerScope.FILE:
+            self._log_file_data(field=field, value=value, level=level)
+
     def sync_log_level_and_update_count(self, group_data):
         """Set log level from the highest level log, update warning/error count."""
         group_max = LogLevel.NONE
@@ -240,10 +343,10 @@ class ExtractLogger:
         return group_data
 
     def flush(self):
-        """Print and clear all data."""
+        """Send all data to the sink, then clear it."""
         for group_data in self.data:
             group_data = self.sync_log_level_and_update_count(group_data)
-            self.print_group_data(group_data)
+            self.sink.bill_group_logged(group_data)
 
         self._reset_data()
 
@@ -264,22 +367,37 @@ class ExtractLogger:
 
     def complete(self):
         self.flush()
-        message = 'Extracting completed.'
+        self.sink.extracting_completed(warn_count=self.warn_count, error_count=self.error_count)
 
-        warn_msg = f'{self.warn_count} warning{"" if self.warn_count == 1 else "s"}'
-        error_msg = f'{self.error_count} error{"" if self.error_count == 1 else "s"}'
-        warn_msg = f'{Color.WARN}{warn_msg}{Color.ENDC}'
-        error_msg = f'{Color.ERROR}{error_msg}{Color.ENDC}'
-        if self.warn_count and self.error_count:
-            message += f' ({warn_msg}, {error_msg})'
-        elif self.warn_count:
-            message += f' ({warn_msg})'
-        elif self.error_count:
-            message += f' ({error_msg})'
-        print(message)
+
+_current_extract_logger = contextvars.ContextVar('extract_logger', default=None)
+_default_extract_logger = ExtractLogger()    # used outside of any run (e.g. in worker processes)
+
+
+def get_extract_logger():
+    """Get the ExtractLogger of the current run (see use_extract_logger)."""
+    logger = _current_extract_logger.get()
+    return logger if logger is not None else _default_extract_logger
+
+
+@contextlib.contextmanager
+def use_extract_logger(logger):
+    """Route extract_logger to logger within this block (per thread / task)."""
+    token = _current_extract_logger.set(logger)
+    try:
+        yield logger
+    finally:
+        _current_extract_logger.reset(token)
+
+
+class ExtractLoggerProxy:
+    """Forward everything to the ExtractLogger of the current run."""
+
+    def __getattr__(self, attr):
+        return getattr(get_extract_logger(), attr)
 
 
-extract_logger = ExtractLogger()
+extract_logger = ExtractLoggerProxy()
 
 
 class ExtractLoggerContextManager:
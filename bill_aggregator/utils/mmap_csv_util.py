@@ -0,0 +1,148 @@
+import codecs
+import csv
+from functools import lru_cache
+
+from bill_aggregator.exceptions import BillAggException
+
+
+QUOTECHAR = b'"'
+NEWLINE = b'\n'
+CARRIAGE_RETURN = b'\r'
+# stateful or ASCII-based encodings of non-ASCII text, ASCII bytes are not always ASCII characters
+UNSAFE_CODEC_PREFIXES = ('utf-16', 'utf-32', 'utf-7', 'iso2022', 'hz')
+
+
+def get_byte_level_encoding(encoding):
+    """Check encoding can be split at byte level, return (codec name, BOM).
+
+    Record and field boundaries are located in the raw bytes, so newline,
+    quote and delimiter must be single ASCII bytes. Some multi-byte codecs
+    (gbk, gb18030, big5, shift_jis...) also use ASCII bytes as the second
+    byte of a character, see is_trail_byte().
+    """
+    codec = codecs.lookup(encoding)
+    bom = b''
+    name = codec.name
+    if name == 'utf-8-sig':
+        bom = codecs.BOM_UTF8
+        name = 'utf-8'
+    if '\n",;\t|'.encode(name) != b'\n",;\t|':
+        return None, None
+    if name.startswith(UNSAFE_CODEC_PREFIXES):
+        return None, None
+    return name, bom
+
+
+@lru_cache(maxsize=None)
+def is_trail_byte(encoding, char):
+    """Check an ASCII char can be the second byte of a multi-byte character of encoding.
+
+    e.g. "|" in gbk ("億" is b"\\x83|"), such chars can't be located in the raw bytes.
+    Always False for utf-8 and single-byte codecs.
+    """
+    byte = char.encode(encoding)
+    for lead in range(0x80, 0x100):
+        try:
+            if len((bytes([lead]) + byte).decode(encoding)) == 1:
+                return True
+        except UnicodeDecodeError:
+            pass
+    return False
+
+
+def find_quoted_record_end(buf, pos, delimiter):
+    """Get the offset of the newline ending a record with quotes at pos (or len(buf)).
+
+    Same rules as the csv module: a quote only opens a quoted field at the
+    start of a field, "" is an escape inside it, other quotes are data.
+    """
+    size = len(buf)
+    line_end = -1
+    field_start = pos
+    while True:
+        if buf[field_start:field_start+1] == QUOTECHAR:
+            # quoted field, up to the next quote which is not an escape
+            i = field_start
+            while True:
+                i = buf.find(QUOTECHAR, i + 1)
+                if i == -1:
+                    return size
+                if buf[i+1:i+2] != QUOTECHAR:
+                    break
+                i += 1
+            i += 1
+        else:
+            i = field_start
+        # outside quoted fields, find the next quote at the start of a field (others are data)
+        if line_end < i:
+            line_end = buf.find(NEWLINE, i)
+            if line_end == -1:
+                line_end = size
+        while True:
+            i = buf.find(QUOTECHAR, i, line_end)
+            if i == -1:
+                return line_end
+            if buf[i-1:i] == delimiter:
+                break
+            i += 1
+        field_start = i
+
+
+def iter_record_offsets(buf, delimiter, start=0):
+    """Yield (start, end) byte offsets of every csv record in buf.
+
+    Line terminators are excluded, a newline inside a quoted field does not
+    end the record (see find_quoted_record_end()).
+    """
+    size = len(buf)
+    pos = start
+    while pos < size:
+        end = buf.find(NEWLINE, pos)
+        if end == -1:
+            end = size
+        if buf.find(QUOTECHAR, pos, end) != -1:
+            end = find_quoted_record_end(buf, pos, delimiter)
+
+        record_end = end
+        if record_end > pos and buf[record_end-1:record_end] == CARRIAGE_RETURN:
+            record_end -= 1
+        yield pos, record_end
+        pos = end + 1
+
+
+def parse_quoted_record(record, delimiter, encoding):
+    """Parse one record containing quotes with the csv module."""
+    text = record.decode(encoding).replace('\r\n', '\n')
+    try:
+        rows = list(csv.reader([text], delimiter=delimiter))
+    except csv.Error as exc:
+        raise BillAggException(f'Invalid csv record: {text!r} ({exc}), use reader "text"') from exc
+    if len(rows) > 1:    # e.g. a lone "\r" outside quotes
+        raise BillAggException(f'Invalid csv record: {text!r}, use reader "text"')
+    return rows[0] if rows else []
+
+
+def scan_record(record, delimiter, encoding):
+    """Count fields of a record, return (field_count, parsed fields or None).
+
+    Records without quotes are only counted, records with quotes are parsed
+    right away (they must be decoded anyway), so they are never parsed twice.
+    """
+    if QUOTECHAR in record:
+        fields = parse_quoted_record(record, delimiter, encoding)
+        return len(fields), fields
+    if not record:
+        return 0, None
+    return record.count(delimiter.encode(encoding)) + 1, None
+
+
+def split_record(record, delimiter, encoding, used_columns, width):
+    """Split a record without quotes, decoding only fields in used_columns.
+
+    The row is truncated to width, unused fields are empty strings.
+    """
+    fields = record.split(delimiter.encode(encoding))
+    row = [''] * width
+    for col in used_columns:
+        row[col] = fields[col].decode(encoding)
+    return row
@@ -0,0 +1,124 @@
+import bisect
+import threading
+
+from bill_aggregator.utils.lazy_import import lazy_import
+
+
+asyncio = lazy_import('asyncio')
+charset_normalizer = lazy_import('charset_normalizer')
+
+
+class PrefetchedFile:
+    """Content of a bill file, read ahead of extraction."""
+
+    def __init__(self, file, content, charset_match=None):
+        self.file = file
+        self.content = content
+        self.charset_match = charset_match
+
+
+def read_bill_file(file, detect_encoding=False):
+    with file.open('rb') as f:    # pathlib.Path or ArchivedFile
+        content = f.read()
+    charset_match = None
+    if detect_encoding:
+        charset_match = charset_normalizer.from_bytes(content).best()
+    return PrefetchedFile(file=file, content=content, charset_match=charset_match)
+
+
+class InMemoryFiles:
+    """Bill files whose content is already in memory (e.g. uploaded), same get() as FilePrefetcher.
+
+    contents: {file: bytes}
+    """
+
+    def __init__(self, contents):
+        self.files = {file: PrefetchedFile(file=file, content=content)
+                      for file, content in contents.items()}
+
+    def get(self, file):
+        return self.files[file]
+
+
+class FilePrefetcher:
+    """Read upcoming bill files concurrently, while the current one is parsed.
+
+    An asyncio event loop runs in a background thread and dispatches file
+    reads (and charset sniffing) to worker threads, at most `window` files
+    ahead of the consumer. Files must be requested with get() in the same
+    order as `jobs`, files which are never requested are simply skipped.
+    A file may appear in several jobs (e.g. in two bill groups), every get()
+    takes its next job after the ones already consumed.
+
+    jobs: [(file, detect_encoding), ...]
+    """
+
+    def __init__(self, jobs, window):
+        assert window >= 1
+        self.jobs = list(jobs)
+        self.window = window
+        self.job_indices = {}    # {file: [job_idx, ...]}
+        for idx, (file, _) in enumerate(self.jobs):
+            self.job_indices.setdefault(file, []).append(idx)
+
+        self.next_idx = 0
+        self.consumed_idx = 0    # jobs before it are consumed (or skipped)
+        self.tasks = {}    # {job_idx: task}
+        self.loop = None
+        self.thread = None
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._schedule(), self.loop).result()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        asyncio.run_coroutine_threadsafe(self._cancel_all(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _schedule(self):
+        while self.next_idx < len(self.jobs) and len(self.tasks) < self.window:
+            file, detect_encoding = self.jobs[self.next_idx]
+            self.tasks[self.next_idx] = asyncio.ensure_future(
+                asyncio.to_thread(read_bill_file, file, detect_encoding))
+            self.next_idx += 1
+
+    async def _cancel_all(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks = {}
+
+    def _next_job_index(self, file):
+        indices = self.job_indices.get(file, [])
+        pos = bisect.bisect_left(indices, self.consumed_idx)
+        return indices[pos] if pos < len(indices) else None
+
+    async def _get(self, file):
+        idx = self._next_job_index(file)
+        if idx is None:    # not a job, or all of its jobs are consumed
+            return await asyncio.to_thread(read_bill_file, file)
+
+        # drop files that were skipped by the consumer
+        for stale_idx in [i for i in self.tasks if i < idx]:
+            self.tasks.pop(stale_idx).cancel()
+        self.consumed_idx = idx + 1
+        if idx >= self.next_idx:
+            self.next_idx = idx
+        await self._schedule()
+
+        task = self.tasks.pop(idx, None)
+        try:
+            if task is None:
+                return await asyncio.to_thread(read_bill_file, *self.jobs[idx])
+            return await task
+        finally:
+            await self._schedule()
+
+    def get(self, file):
+        """Get PrefetchedFile for file, blocks only if it is not read yet."""
+        return asyncio.run_coroutine_threadsafe(self._get(file), self.loop).result()
@@ -0,0 +1,122 @@
+import datetime
+import hashlib
+import sqlite3
+from decimal import Decimal
+
+from bill_aggregator.consts import (
+    ACCT, DATE, TIME, NAME, MEMO, AMT, FINGERPRINT, SOURCE_FILE, SOURCE_LINE,
+)
+
+
+FINGERPRINT_SIZE = 8    # bytes of the blake2b digest, 16 hex digits
+FIELD_SEPARATOR = '\x1f'
+DB_TIMEOUT = 60    # seconds to wait for the lock of other runs (e.g. other shards)
+
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    UNIQUE (file, sheet)
+);
+CREATE TABLE IF NOT EXISTS provenance (
+    fingerprint TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    line INTEGER,
+    date TEXT NOT NULL,
+    last_run TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def canonical_amount(amount, amount_scale=None):
+    """Amount as a plain decimal string, the same for Decimal and int minor units (e.g. "-12.3")."""
+    if amount_scale is not None:
+        amount = Decimal(amount).scaleb(-amount_scale)
+    if amount == 0:
+        return '0'    # no sign or exponent of zero
+    return format(amount.normalize(), 'f')
+
+
+def get_fingerprint(account, row, occurrence=0, amount_scale=None):
+    """Stable id of a transaction: hash of account, date, time, amount, name and raw memo.
+
+    occurrence tells identical transactions of a bill file apart (0 for the first one),
+    so the fingerprint doesn't depend on file names, line numbers or other rows.
+    """
+    time = row[TIME]
+    values = [
+        account, row[DATE].isoformat(), '' if time is None else time.isoformat(),
+        canonical_amount(row[AMT], amount_scale), row[NAME] or '', row[MEMO] or '', str(occurrence),
+    ]
+    data = FIELD_SEPARATOR.join(values).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=FINGERPRINT_SIZE).hexdigest()
+
+
+def add_fingerprints(account, rows, amount_scale=None):
+    """Set FINGERPRINT of extracted rows of a bill file (before final_memo)."""
+    occurrences = {}
+    for row in rows:
+        key = (row[DATE], row[TIME], row[AMT], row[NAME], row[MEMO])
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        row[FINGERPRINT] = get_fingerprint(account, row, occurrence, amount_scale)
+
+
+class ProvenanceIndex:
+    """Fingerprint -> provenance (account, file, sheet, line, date) of transactions, in sqlite.
+
+    The index is kept across runs, a transaction seen again (e.g. in an
+    overlapping statement) points to the file of the latest run.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.run = datetime.datetime.now().isoformat(timespec='seconds')
+        self.file_ids = {}    # {(file, sheet): id in the files table}
+        file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(file, timeout=DB_TIMEOUT)
+        self.conn.executescript(DB_SCHEMA)
+
+    def _get_file_id(self, file, sheet):
+        key = (file, sheet or '')
+        if key not in self.file_ids:
+            self.conn.execute('INSERT OR IGNORE INTO files (file, sheet) VALUES (?, ?)', key)
+            self.file_ids[key] = self.conn.execute(
+                'SELECT id FROM files WHERE file = ? AND sheet = ?', key).fetchone()[0]
+        return self.file_ids[key]
+
+    def add(self, rows, source_files):
+        """Add rows (with FINGERPRINT, SOURCE_FILE and SOURCE_LINE) in one transaction."""
+        with self.conn:
+            records = [
+                (row[FINGERPRINT], row[ACCT], self._get_file_id(*source_files[row[SOURCE_FILE]]),
+                 row[SOURCE_LINE], row[DATE].isoformat(), self.run)
+                for row in rows
+            ]
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO provenance '
+                '(fingerprint, account, file_id, line, date, last_run) '
+                'VALUES (?, ?, ?, ?, ?, ?)', records)
+
+    def lookup(self, fingerprint):
+        """Get provenance of a fingerprint as a dict, None if it's not in the index."""
+        record = self.conn.execute(
+            'SELECT p.account, f.file, f.sheet, p.line, p.date, p.last_run '
+            'FROM provenance p JOIN files f ON f.id = p.file_id WHERE p.fingerprint = ?',
+            (fingerprint.lower(),)).fetchone()
+        if record is None:
+            return None
+        account, file, sheet, line, date, last_run = record
+        return {'account': account, 'file': file, 'sheet': sheet or None, 'line': line,
+                'date': date, 'last_run': last_run}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
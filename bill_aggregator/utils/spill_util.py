@@ -0,0 +1,130 @@
+import datetime
+import heapq
+import marshal
+import sys
+import tempfile
+from decimal import Decimal
+
+from bill_aggregator.consts import DATE, TIME, AMT, BASE_AMT, FX_RATE
+
+
+SPILL_CHUNK_ROWS = 1024    # rows per marshal record, also the read-ahead of every run
+SIZE_SAMPLE_ROWS = 100
+READ_BUFFER_SIZE = 256 * 1024
+
+
+def _encode_time(t):
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 1000000 + t.microsecond
+
+
+def _decode_time(n):
+    n, microsecond = divmod(n, 1000000)
+    n, second = divmod(n, 60)
+    hour, minute = divmod(n, 60)
+    return datetime.time(hour, minute, second, microsecond)
+
+
+def _encode_decimal(d):
+    if d is None or isinstance(d, int):    # int: minor units (fixed_point_amounts)
+        return d
+    return str(d)    # str() keeps exponent and sign of zero
+
+
+def _decode_decimal(s):
+    return Decimal(s) if isinstance(s, str) else s
+
+
+# non-primitive fields of result rows, other fields are str (or None)
+FIELD_CODECS = {
+    DATE: (datetime.date.toordinal, datetime.date.fromordinal),
+    TIME: (_encode_time, _decode_time),
+    AMT: (_encode_decimal, _decode_decimal),
+    BASE_AMT: (_encode_decimal, _decode_decimal),
+    FX_RATE: (_encode_decimal, _decode_decimal),
+}
+
+
+def estimate_rows_size(rows):
+    """Estimate memory used by result rows (dicts of fields), from a sample."""
+    if not rows:
+        return 0
+    sample = rows[:SIZE_SAMPLE_ROWS]
+    size = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+               for row in sample)
+    return size * len(rows) // len(sample)
+
+
+class SpilledRuns:
+    """Sorted runs of result rows spilled to disk, merged back with a k-way merge.
+
+    A run file is a sequence of marshal records, each one a chunk of rows
+    encoded as tuples: (schema id, value, ...), where a schema is the tuple of
+    field names of a row (rows of different bill groups may have different
+    fields). Dates, times and decimals are encoded as primitives, see
+    FIELD_CODECS. Files live in a temporary directory, removed by cleanup().
+    """
+
+    def __init__(self):
+        self.tmpdir = None
+        self.runs = {}    # {aggregation: [file, ...]}, in spill order
+        self.run_count = 0
+
+    def spill(self, aggregation, rows):
+        """Write rows (already sorted) into a new run of aggregation."""
+        if self.tmpdir is None:
+            self.tmpdir = tempfile.TemporaryDirectory(prefix='bill_aggregator_')
+        self.run_count += 1
+        file = f'{self.tmpdir.name}/run_{self.run_count}.bin'
+
+        schemas = {}    # {schema: id}
+        with open(file, 'wb') as f:
+            for start in range(0, len(rows), SPILL_CHUNK_ROWS):
+                new_schemas = []
+                records = []
+                for row in rows[start:start+SPILL_CHUNK_ROWS]:
+                    schema = tuple(row)
+                    if schema not in schemas:
+                        schemas[schema] = len(schemas)
+                        new_schemas.append(schema)
+                    record = [schemas[schema]]
+                    for field, value in row.items():
+                        codec = FIELD_CODECS.get(field, None)
+                        record.append(value if codec is None else codec[0](value))
+                    records.append(tuple(record))
+                marshal.dump((new_schemas, records), f)
+        self.runs.setdefault(aggregation, []).append(file)
+
+    @staticmethod
+    def read_run(file):
+        """Yield rows of a run file, one chunk in memory at a time."""
+        schemas = []
+        with open(file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            while True:
+                try:
+                    new_schemas, records = marshal.load(f)
+                except EOFError:
+                    return
+                for schema in new_schemas:
+                    decoders = [FIELD_CODECS[field][1] if field in FIELD_CODECS else None
+                                for field in schema]
+                    schemas.append((schema, decoders))
+                for record in records:
+                    schema, decoders = schemas[record[0]]
+                    yield {
+                        field: value if decoder is None else decoder(value)
+                        for field, decoder, value in zip(schema, decoders, record[1:])
+                    }
+
+    def merge(self, aggregation, rows, key):
+        """Merge spilled runs of aggregation with rows (sorted, kept in memory).
+
+        Stable: on same key, rows of earlier runs come first, rows in memory last.
+        """
+        runs = [self.read_run(file) for file in self.runs.get(aggregation, [])]
+        return heapq.merge(*runs, rows, key=key)
+
+    def cleanup(self):
+        if self.tmpdir is not None:
+            self.tmpdir.cleanup()
+            self.tmpdir = None
+        self.runs = {}
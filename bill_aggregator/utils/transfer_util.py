@@ -0,0 +1,103 @@
+import bisect
+import datetime
+
+from bill_aggregator.consts import AmountType, ACCT, CUR, DATE, AMT, AMT_TYPE
+
+
+class _Outflows:
+    """Date-sorted outflows of one account, skipping matched ones in amortized O(1)."""
+
+    def __init__(self, entries):
+        self.entries = sorted(entries)    # [(date, idx), ...]
+        # next/previous unmatched position, compressed while looking up
+        self.next = list(range(len(self.entries) + 1))
+        self.prev = list(range(len(self.entries) + 1))    # shifted by one, 0 means none
+        self.remaining = len(self.entries)
+
+    @staticmethod
+    def _find(links, pos):
+        root = pos
+        while links[root] != root:
+            root = links[root]
+        while links[pos] != root:
+            links[pos], pos = root, links[pos]
+        return root
+
+    def nearest(self, date, window):
+        """Return the position of the nearest unmatched outflow within window, or None.
+
+        On same distance the earlier outflow wins, on same date the first one.
+        """
+        split = bisect.bisect_right(self.entries, (date, float('inf')))
+        candidates = []
+        before = self._find(self.prev, split) - 1
+        if before >= 0 and self.entries[before][0] >= date - window:
+            first = bisect.bisect_left(self.entries, (self.entries[before][0], -1))
+            candidates.append(self._find(self.next, first))
+        after = self._find(self.next, split)
+        if after < len(self.entries) and self.entries[after][0] <= date + window:
+            candidates.append(after)
+        return min(candidates, key=lambda pos: (abs(self.entries[pos][0] - date), pos),
+                   default=None)
+
+    def pop(self, pos):
+        self.next[pos] = pos + 1
+        self.prev[pos + 1] = pos
+        self.remaining -= 1
+        return self.entries[pos]
+
+
+def match_transfers(rows, max_days):
+    """Find transfers between accounts, return [(outflow idx, inflow idx), ...].
+
+    Outflows are indexed by (currency, absolute amount), then by account, each
+    holding a date-sorted list. Inflows are visited by date, and matched with the
+    nearest-dated unmatched outflow of another account within max_days
+    (on same distance, the earlier outflow), found by bisect in each account.
+
+    Matched outflows are skipped by path-compressed links, so this takes
+    O(n log n + n * a) for n items, a being the most accounts sharing one
+    (currency, amount) (accounts with no unmatched outflows left are dropped).
+    """
+    window = datetime.timedelta(days=max_days)
+
+    entries = {}    # {(currency, abs amount): {account: [(date, idx), ...]}}
+    inflows = []    # [(date, idx), ...]
+    for idx, row in enumerate(rows):
+        if row[AMT] == 0:
+            continue
+        if row[AMT_TYPE] == AmountType.OUT:
+            by_account = entries.setdefault((row[CUR], abs(row[AMT])), {})
+            by_account.setdefault(row[ACCT], []).append((row[DATE], idx))
+        elif row[AMT_TYPE] == AmountType.IN:
+            inflows.append((row[DATE], idx))
+    outflows = {
+        key: {account: _Outflows(dated) for account, dated in by_account.items()}
+        for key, by_account in entries.items()
+    }
+    inflows.sort()
+
+    pairs = []
+    for date, in_idx in inflows:
+        in_row = rows[in_idx]
+        by_account = outflows.get((in_row[CUR], abs(in_row[AMT])), None)
+        if not by_account:
+            continue
+        best, best_key = None, None
+        for account, account_outflows in by_account.items():
+            if account == in_row[ACCT]:
+                continue
+            pos = account_outflows.nearest(date, window)
+            if pos is None:
+                continue
+            out_date, out_idx = account_outflows.entries[pos]
+            key = (abs(out_date - date), out_date, out_idx)
+            if best_key is None or key < best_key:
+                best, best_key = (account, pos), key
+        if best is not None:
+            account, pos = best
+            account_outflows = by_account[account]
+            pairs.append((account_outflows.pop(pos)[1], in_idx))
+            if not account_outflows.remaining:
+                del by_account[account]
+    return pairs
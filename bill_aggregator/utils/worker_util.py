@@ -0,0 +1,16 @@
+import importlib
+import signal
+
+
+# Modules worth loading once per worker process, instead of on the first job
+WARM_UP_MODULES = [
+    'bill_aggregator.aggregator', 'bill_aggregator.utils.prefetch_util',
+    'xlrd', 'xlsxwriter', 'dateutil.parser', 'charset_normalizer',
+]
+
+
+def warm_up_worker():
+    """Prepare a long-lived worker process (of a serve / batch pool)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # Ctrl+C is handled by the main process
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
@@ -1,12 +1,38 @@
 #!/usr/bin/env python3
 import argparse
+import datetime
 import pathlib
 import sys
 
 from bill_aggregator import consts
-from bill_aggregator.exceptions import BillAggConfigError
+from bill_aggregator.exceptions import BillAggConfigError, BillAggException
+from bill_aggregator.shard import parse_shard
 from bill_aggregator.utils import config_util
-from bill_aggregator.aggregator import BillAggregator
+
+
+def lookup_fingerprints(workdir, fingerprints):
+    index_file = workdir / consts.RESULTS_DIR / consts.PROVENANCE_FILE
+    if not index_file.is_file():
+        print(f'{consts.Color.ERROR}No provenance index found: {index_file}, '
+              f'run with "provenance: true" first{consts.Color.ENDC}')
+        sys.exit(1)
+    # pylint: disable=import-outside-toplevel
+    from bill_aggregator.utils.provenance_util import ProvenanceIndex
+    missing = False
+    with ProvenanceIndex(index_file) as index:
+        for fingerprint in fingerprints:
+            record = index.lookup(fingerprint)
+            if record is None:
+                print(f'{fingerprint}: {consts.Color.WARN}not found{consts.Color.ENDC}')
+                missing = True
+                continue
+            source = record['file']
+            if record['sheet'] is not None:
+                source += f' [{record["sheet"]}]'
+            print(f'{fingerprint}: {record["account"]}, {record["date"]}, {source}, '
+                  f'line {record["line"]} (last seen {record["last_run"]})')
+    if missing:
+        sys.exit(1)
 
 
 def main():
@@ -20,14 +46,110 @@ def main():
         '-d', '--dir',
         required=False,
         help=f'bills directory (default: {consts.DEFAULT_WORKDIR})')
+    parser.add_argument(
+        '--since',
+        required=False,
+        type=datetime.date.fromisoformat,
+        help='only keep bills on or after this date (YYYY-MM-DD), overrides config')
+    parser.add_argument(
+        '--until',
+        required=False,
+        type=datetime.date.fromisoformat,
+        help='only keep bills on or before this date (YYYY-MM-DD), overrides config')
+    parser.add_argument(
+        '--validate',
+        action='store_true',
+        help='only validate the config file, then exit')
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='serve a local HTTP endpoint for uploaded bill files, instead of reading a directory')
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='host to serve on (default: 127.0.0.1)')
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8765,
+        help='port to serve on (default: 8765)')
+    parser.add_argument(
+        '--batch',
+        required=False,
+        metavar='MANIFEST',
+        help='YAML manifest of (config, dir) pairs, aggregate all of them in one run')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        required=False,
+        help='worker processes for serving / batch (default: number of CPUs)')
+    parser.add_argument(
+        '--shard',
+        required=False,
+        type=parse_shard,
+        metavar='I/N',
+        help='only extract bill groups of shard I (of N), and write a partial result file')
+    parser.add_argument(
+        '--partial',
+        required=False,
+        metavar='FILE',
+        help='partial result file of --shard '
+             '(default: <bills_directory>/results/PARTIAL_<I>_of_<N>.zip)')
+    parser.add_argument(
+        '--merge',
+        nargs='+',
+        required=False,
+        metavar='PARTIAL',
+        help='merge partial result files of all shards, and export them into the bills directory')
+    parser.add_argument(
+        '--export-only',
+        action='store_true',
+        help='only export results of the last run again (e.g. after changing export_config), '
+             'without extracting bills')
+    parser.add_argument(
+        '--lookup',
+        nargs='+',
+        required=False,
+        metavar='FINGERPRINT',
+        help='print the source file and line of transaction fingerprints (runs with provenance), '
+             'then exit')
     args = parser.parse_args()
 
+    if args.batch:
+        manifest_file = pathlib.Path(args.batch).absolute()
+        if not manifest_file.is_file():
+            print(f'{consts.Color.ERROR}No such file: {args.batch}{consts.Color.ENDC}')
+            sys.exit(1)
+        from bill_aggregator.batch import run_batch    # pylint: disable=import-outside-toplevel
+        all_stats = run_batch(manifest_file, workers=args.workers)
+        if any(stats.error or stats.error_count for stats in all_stats):
+            sys.exit(1)
+        return
+
+    if args.lookup:
+        workdir = pathlib.Path(args.dir or consts.DEFAULT_WORKDIR).absolute()
+        lookup_fingerprints(workdir, args.lookup)
+        return
+
     orig_fp = args.conf or consts.DEFAULT_CONFIG_FILE
     config_file = pathlib.Path(orig_fp).absolute()
     if not config_file.is_file():
         print(f'{consts.Color.ERROR}No such file: {orig_fp}{consts.Color.ENDC}')
         sys.exit(1)
 
+    if args.validate:
+        conf = config_util.load_yaml_config(file=config_file)
+        config_util.ConfigValidator.validate_all_config(conf=conf)
+        return
+
+    if args.serve:
+        conf = config_util.load_yaml_config(file=config_file)
+        config_util.ConfigValidator.validate_all_config(conf=conf)
+        from bill_aggregator.server import serve    # pylint: disable=import-outside-toplevel
+        workdir = pathlib.Path(args.dir or consts.DEFAULT_WORKDIR).absolute()    # for rate_file
+        serve(conf=conf, workdir=workdir, host=args.host, port=args.port, workers=args.workers)
+        return
+
     orig_dp = args.dir or consts.DEFAULT_WORKDIR
     workdir = pathlib.Path(orig_dp).absolute()
     if not workdir.is_dir():
@@ -36,12 +158,49 @@ def main():
 
     # load and validate config file
     conf = config_util.load_yaml_config(file=config_file)
+    if args.since:
+        conf['since'] = args.since
+    if args.until:
+        conf['until'] = args.until
     config_util.ConfigValidator.validate_general_config(conf=conf)
 
-    # actual work begins here
-    aggregator = BillAggregator(conf=conf, workdir=workdir, conf_file=config_file)
+    if args.merge:
+        # pylint: disable=import-outside-toplevel
+        from bill_aggregator.shard import merge_partials
+        files = [pathlib.Path(f).absolute() for f in args.merge]
+        try:
+            merge_partials(conf=conf, workdir=workdir, files=files)
+        except BillAggException as exc:    # bad partial files
+            print(f'{consts.Color.ERROR}{exc.message}{consts.Color.ENDC}')
+            sys.exit(1)
+        return
+
+    # actual work begins here (extractors/exporters are only loaded from here on)
+    # pylint: disable=import-outside-toplevel
+    from bill_aggregator.aggregator import BillAggregator
+    from bill_aggregator.snapshot import load_snapshot, write_snapshot
+    aggregator = BillAggregator(conf=conf, workdir=workdir, conf_file=config_file, shard=args.shard)
+    snapshot_file = workdir / consts.RESULTS_DIR / consts.SNAPSHOT_FILE
+    if args.export_only:
+        try:
+            load_snapshot(aggregator, snapshot_file)
+        except BillAggException as exc:
+            print(f'{consts.Color.ERROR}{exc.message}{consts.Color.ENDC}')
+            sys.exit(1)
+        aggregator.export_bills()
+        return
+
     aggregator.extract_bills()
     aggregator.aggregate_bills()
+    if args.shard:
+        from bill_aggregator.shard import write_partial    # pylint: disable=import-outside-toplevel
+        index, count = args.shard
+        partial_file = pathlib.Path(args.partial).absolute() if args.partial else (
+            workdir / consts.RESULTS_DIR / consts.PARTIAL_FILE.format(index=index, count=count))
+        write_partial(aggregator, partial_file)
+        print(f'Partial results of shard {index}/{count} written to {partial_file}')
+        return
+    write_snapshot(aggregator, snapshot_file)
     aggregator.export_bills()
 
 
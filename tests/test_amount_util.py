@@ -0,0 +1,97 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from bill_aggregator.consts import AmountType, CUR, AMT, AMT_TYPE, BASE_AMT
+from bill_aggregator.exceptions import BillAggException
+from bill_aggregator.utils.amount_util import (
+    convert_digits_to_minor_units, convert_minor_units, format_minor_units, CurrencyScales,
+)
+
+
+SCALES = [0, 2, 3]
+RATES = [Decimal('1'), Decimal('1.3517'), Decimal('0.00912'), Decimal('4.4005'), Decimal('0.5'),
+         Decimal('1.125'), Decimal('137.25'), Decimal('0.000001')]
+
+
+def decimal_convert(units, scale, rate, to_scale):
+    """Current Decimal results: amount * rate, quantized (see BillAggregator._convert_currency)."""
+    amount = Decimal(units).scaleb(-scale)
+    return (amount * rate).quantize(Decimal(1).scaleb(-to_scale))
+
+
+def random_digits(rng, fraction_digits):
+    digits = str(rng.randint(0, 10 ** rng.randint(0, 12)))
+    if fraction_digits:
+        digits += '.' + ''.join(rng.choice('0123456789') for _ in range(fraction_digits))
+    return digits
+
+
+@pytest.mark.parametrize('scale', SCALES)
+def test_digits_to_minor_units(scale):
+    rng = random.Random(scale)
+    for _ in range(2000):
+        digits = random_digits(rng, rng.randint(0, scale))
+        assert convert_digits_to_minor_units(digits, scale) == Decimal(digits).scaleb(scale)
+
+
+@pytest.mark.parametrize('digits, scale, units', [
+    ('0', 2, 0), ('0.00', 2, 0), ('12.3', 2, 1230), ('12.30', 2, 1230), ('12.300', 2, 1230),
+    ('1000', 0, 1000), ('1000.0', 0, 1000), ('1.234', 3, 1234), ('.5', 3, 500), ('7.', 2, 700),
+])
+def test_digits_to_minor_units_edges(digits, scale, units):
+    assert convert_digits_to_minor_units(digits, scale) == units
+
+
+@pytest.mark.parametrize('digits, scale', [('1.5', 0), ('1.234', 2), ('0.0001', 3), ('0.125', 2)])
+def test_digits_to_minor_units_never_rounds(digits, scale):
+    with pytest.raises(BillAggException):
+        convert_digits_to_minor_units(digits, scale)
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('to_scale', SCALES)
+def test_convert_minor_units_random(scale, to_scale):
+    rng = random.Random(scale * 10 + to_scale)
+    for _ in range(2000):
+        units = rng.randint(-10 ** 12, 10 ** 12)
+        rate = rng.choice(RATES + [Decimal(rng.randint(1, 10 ** 6)).scaleb(-rng.randint(0, 6))])
+        expected = decimal_convert(units, scale, rate, to_scale)
+        assert convert_minor_units(units, scale, rate, to_scale) == expected.scaleb(to_scale)
+
+
+@pytest.mark.parametrize('units, scale, rate, to_scale', [
+    # half to even ties, positive and negative
+    (125, 3, Decimal('1'), 2), (135, 3, Decimal('1'), 2), (-125, 3, Decimal('1'), 2),
+    (-135, 3, Decimal('1'), 2), (5, 0, Decimal('0.5'), 0), (15, 0, Decimal('0.5'), 0),
+    (-5, 0, Decimal('0.5'), 0), (-15, 0, Decimal('0.5'), 0), (1, 2, Decimal('0.5'), 2),
+    (3, 2, Decimal('0.5'), 2), (1, 2, Decimal('1.125'), 3), (-1, 2, Decimal('1.125'), 3),
+    # just off a tie, zero, large amounts
+    (1251, 4, Decimal('1'), 2), (-1249, 4, Decimal('1'), 2), (0, 2, Decimal('1.3517'), 2),
+    (999999999999, 2, Decimal('1.3517'), 2), (-999999999999, 3, Decimal('0.00912'), 0),
+])
+def test_convert_minor_units_edges(units, scale, rate, to_scale):
+    expected = decimal_convert(units, scale, rate, to_scale)
+    assert convert_minor_units(units, scale, rate, to_scale) == expected.scaleb(to_scale)
+
+
+@pytest.mark.parametrize('units, scale, negative, text', [
+    (-12345, 2, False, '-123.45'), (5, 2, False, '0.05'), (0, 2, True, '-0.00'),
+    (1000, 0, False, '1000'), (-1, 3, False, '-0.001'),
+])
+def test_format_minor_units(units, scale, negative, text):
+    assert format_minor_units(units, scale, negative=negative) == text
+
+
+@pytest.mark.parametrize('currency, amount_type, units, base_units, amount, base_amount', [
+    ('USD', AmountType.OUT, -200000, -270340, '-2000.00', '-2703.40'),
+    ('JPY', AmountType.IN, 1500, None, '1500', None),
+    ('KWD', AmountType.OUT, 0, 0, '-0.000', '-0.00'),
+])
+def test_to_decimal_amounts(currency, amount_type, units, base_units, amount, base_amount):
+    row = {CUR: currency, AMT: units, AMT_TYPE: amount_type, BASE_AMT: base_units}
+    result = CurrencyScales().to_decimal_amounts(row)
+    assert str(result[AMT]) == amount
+    assert (None if result[BASE_AMT] is None else str(result[BASE_AMT])) == base_amount
+    assert (row[AMT], row[BASE_AMT]) == (units, base_units)
@@ -0,0 +1,52 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from bill_aggregator.consts import AmountFormat, AMT, AMT_TYPE, NAME, MEMO, COL, FORMAT
+from bill_aggregator.utils.converter_util import get_row_converter
+
+
+AMOUNT_CONFS = {
+    AmountFormat.ONE_COLUMN_WITH_INDICATORS: {
+        FORMAT: AmountFormat.ONE_COLUMN_WITH_INDICATORS, COL: 2,
+        'indicators': [{COL: 3, 'inbound_value': 'in', 'outbound_value': 'out'}],
+    },
+    AmountFormat.ONE_COLUMN_WITH_SIGN: {
+        FORMAT: AmountFormat.ONE_COLUMN_WITH_SIGN, COL: 2, 'is_outbound_positive': True,
+    },
+    AmountFormat.TWO_COLUMNS: {
+        FORMAT: AmountFormat.TWO_COLUMNS, 'inbound': {COL: 4}, 'outbound': {COL: 5},
+    },
+}
+
+
+def random_amount(rng, scale):
+    value = Decimal(rng.randint(0, 10 ** 8)).scaleb(-rng.randint(0, scale))
+    text = rng.choice(['{}', '-{}', '({})', '${}', '{} ', '-{:,}', '{:,}'])
+    return text.format(value)
+
+
+def random_row(rng, scale):
+    return [
+        'name', 'memo', random_amount(rng, scale), rng.choice(['in', 'out', '?']),
+        rng.choice(['', '0', random_amount(rng, scale).strip('-()')]),
+        rng.choice(['', '0', random_amount(rng, scale).strip('-()')]),
+    ]
+
+
+@pytest.mark.parametrize('amt_format', AmountFormat.ALL)
+@pytest.mark.parametrize('scale', [0, 2, 3])
+def test_fixed_point_matches_decimal(amt_format, scale):
+    fields_conf = {NAME: {COL: 0}, MEMO: {COL: 1}, AMT: AMOUNT_CONFS[amt_format]}
+    convert_decimal = get_row_converter(fields_conf)
+    convert_fixed = get_row_converter(fields_conf, amount_scale=scale)
+    rng = random.Random(f'{amt_format}{scale}')
+    for _ in range(3000):
+        row = random_row(rng, scale)
+        expected, result = {}, {}
+        convert_decimal(row, expected)
+        convert_fixed(row, result)
+        assert result[AMT_TYPE] == expected[AMT_TYPE], row
+        assert Decimal(result[AMT]).scaleb(-scale) == expected[AMT], row
+        assert (result[NAME], result[MEMO]) == (expected[NAME], expected[MEMO])
@@ -0,0 +1,122 @@
+import copy
+import csv
+import pathlib
+import random
+
+import pytest
+import yaml
+
+from bill_aggregator.consts import AmountFormat, FileType, DATE, TIME, NAME, MEMO, AMT, COL, FORMAT
+from bill_aggregator.extractors import ExtractorClsMapping, ColumnarExtractorClsMapping
+from bill_aggregator.utils.detect_util import TEMPLATES_DIR, load_templates
+
+
+EXAMPLES_DIR = pathlib.Path(__file__).absolute().parent.parent / 'examples'
+with open(EXAMPLES_DIR / 'config.yaml', 'r', encoding='utf-8') as _f:
+    EXAMPLE_BILL_GROUPS = yaml.safe_load(_f)['bill_groups']
+TEMPLATE_BILL_GROUPS = load_templates(TEMPLATES_DIR)
+
+
+def extract(mapping, bill_group_conf, file, amount_scale):
+    extractor = mapping[bill_group_conf['file_type']](
+        file=file, file_conf=copy.deepcopy(bill_group_conf['file_config']),
+        amount_scale=amount_scale)
+    extractor.extract_bills()
+    return extractor.results, extractor.quarantined
+
+
+def assert_same_results(bill_group_conf, file, amount_scale):
+    results, quarantined = extract(ExtractorClsMapping, bill_group_conf, file, amount_scale)
+    columnar_results, columnar_quarantined = extract(
+        ColumnarExtractorClsMapping, bill_group_conf, file, amount_scale)
+    assert results
+    assert columnar_results == results
+    # same field order and amount representation (e.g. Decimal('1.50') vs Decimal('1.5'))
+    assert [list(row.items()) for row in columnar_results] == [list(row.items()) for row in results]
+    assert [repr(row[AMT]) for row in columnar_results] == [repr(row[AMT]) for row in results]
+    assert columnar_quarantined == quarantined
+
+
+def get_column_roles(fields_conf, extra_fields_conf):
+    """Return {column: role} of all columns referenced by a bill group."""
+    roles = {}
+
+    def _add(column, role):
+        for col in column if isinstance(column, list) else [column]:
+            roles.setdefault(col, role)
+
+    for field in [DATE, TIME, NAME, MEMO]:
+        if field in fields_conf:
+            _add(fields_conf[field][COL], field)
+    amount_conf = fields_conf[AMT]
+    if amount_conf[FORMAT] == AmountFormat.TWO_COLUMNS:
+        _add(amount_conf['inbound'][COL], 'inbound')
+        _add(amount_conf['outbound'][COL], 'outbound')
+    else:
+        _add(amount_conf[COL], AMT)
+    for indicator in amount_conf.get('indicators', []):
+        _add(indicator[COL], ('indicator', indicator['inbound_value'], indicator['outbound_value']))
+    for extra_conf in extra_fields_conf.values():
+        _add(extra_conf[COL], 'text')
+    return roles
+
+
+def random_value(rng, role, inbound):
+    amount = f'{rng.randint(0, 100000) / 100:,.2f}'
+    if role == DATE:
+        return f'2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+    if role == TIME:
+        return f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00'
+    if role == AMT:
+        return rng.choice([amount, '-' + amount])
+    if role in ['inbound', 'outbound']:
+        return amount if (role == 'inbound') == inbound else rng.choice(['', '0.00'])
+    if isinstance(role, tuple):
+        _, inbound_value, outbound_value = role
+        return rng.choice([inbound_value if inbound else outbound_value, ''])
+    return rng.choice(['', 'Store #12', 'e-Transfer', '"quoted", text'])
+
+
+def write_bill_file(file, bill_group_conf, rows=50):
+    """Write a bill file of random rows, with the columns of a bill group."""
+    rng = random.Random(file.name)
+    file_conf = bill_group_conf['file_config']
+    roles = get_column_roles(file_conf['fields'], file_conf.get('extra_fields', {}))
+    if file_conf.get('has_header', False):
+        header = list(roles) + ['Unused']
+    else:
+        header = list(range(max(roles) + 2))
+    table = [header] if file_conf.get('has_header', False) else []
+    for _ in range(rows):
+        inbound = rng.random() < 0.5
+        table.append([random_value(rng, roles.get(col, 'text'), inbound) for col in header])
+
+    if bill_group_conf['file_type'] == FileType.XLS:
+        xlwt = pytest.importorskip('xlwt')
+        workbook = xlwt.Workbook()
+        sheet = workbook.add_sheet('Sheet1')
+        table = ([['Statement']] * file_conf.get('skiprows', 0) + table
+                 + [['End']] * file_conf.get('skipfooters', 0))
+        for row_idx, row in enumerate(table):
+            for col_idx, value in enumerate(row):
+                sheet.write(row_idx, col_idx, value)
+        workbook.save(str(file))
+    else:
+        encoding = file_conf.get('encoding', None) or 'utf-8'
+        with open(file, 'w', encoding=encoding, newline='') as f:
+            csv.writer(f, delimiter=file_conf.get('delimiter', ',')).writerows(table)
+
+
+@pytest.mark.parametrize('amount_scale', [None, 2])
+@pytest.mark.parametrize('bill_group_conf', EXAMPLE_BILL_GROUPS, ids=lambda conf: conf['account'])
+def test_examples(bill_group_conf, amount_scale):
+    for file in sorted(EXAMPLES_DIR.glob(bill_group_conf['account'] + '*.csv')):
+        assert_same_results(bill_group_conf, file, amount_scale)
+
+
+@pytest.mark.parametrize('amount_scale', [None, 2])
+@pytest.mark.parametrize('bill_group_conf', TEMPLATE_BILL_GROUPS, ids=lambda conf: conf['account'])
+def test_templates(tmp_path, bill_group_conf, amount_scale):
+    file = tmp_path / f'bill.{bill_group_conf["file_type"]}'
+    write_bill_file(file, bill_group_conf)
+    assert_same_results(bill_group_conf, file, amount_scale)
@@ -0,0 +1,40 @@
+import pytest
+
+from bill_aggregator.extractors import CsvExtractor
+from bill_aggregator.utils import mmap_csv_util
+
+
+FILE_CONF = {
+    'encoding': 'utf-8', 'has_header': True, 'fields': {
+        'date': {'column': 'Date'}, 'name': {'column': 'Name'},
+        'amount': {'format': 'OneColumnWithSign', 'column': 'Amount'},
+    },
+}
+
+
+def extract(file, **extra):
+    extractor = CsvExtractor(file=file, file_conf={**FILE_CONF, **extra})
+    extractor.extract_bills()
+    return extractor.results
+
+
+@pytest.mark.parametrize('content', [
+    # a quote inside an unquoted field is data, it doesn't open a quoted field
+    'Date,Name,Amount\n2023-01-01,TV 5" screen,10\n2023-01-02,cable,-2\n2023-01-03,other,3\n',
+    'Date,Name,Amount\n2023-01-01,a "b" c,1\n2023-01-02, "spaced",2\n2023-01-03,x"",3\n',
+    # quoted fields, with newlines, escaped quotes and data after the closing quote
+    'Date,Name,Amount\r\n2023-01-01,"multi\r\nline ""q""",1\r\n2023-01-02,"a"b,"2"\r\n',
+    'Date,Name,Amount\n2023-01-01,"TV 5"" screen",10\n2023-01-02,"x,y",-2',
+])
+def test_mmap_reader_matches_text_reader(tmp_path, content):
+    file = tmp_path / 'bill.csv'
+    file.write_bytes(content.encode('utf-8'))
+    expected = extract(file)
+    assert len(expected) >= 2
+    assert extract(file, reader='mmap') == expected
+
+
+def test_record_offsets():
+    buf = b'a,b"c,d\n"e\nf",g\nh'
+    records = [buf[s:e] for s, e in mmap_csv_util.iter_record_offsets(buf, b',')]
+    assert records == [b'a,b"c,d', b'"e\nf",g', b'h']
@@ -0,0 +1,52 @@
+import datetime
+import random
+from decimal import Decimal
+
+import pytest
+
+from bill_aggregator.consts import AmountType, ACCT, CUR, DATE, AMT, AMT_TYPE
+from bill_aggregator.utils.transfer_util import match_transfers
+
+
+def brute_force_match(rows, max_days):
+    """Scan every unmatched outflow for each inflow (by date), the nearest-dated one wins."""
+    window = datetime.timedelta(days=max_days)
+    outflows = sorted((row[DATE], idx) for idx, row in enumerate(rows)
+                      if row[AMT] != 0 and row[AMT_TYPE] == AmountType.OUT)
+    inflows = sorted((row[DATE], idx) for idx, row in enumerate(rows)
+                     if row[AMT] != 0 and row[AMT_TYPE] == AmountType.IN)
+    pairs = []
+    for date, in_idx in inflows:
+        in_row = rows[in_idx]
+        candidates = [
+            (abs(out_date - date), out_date, out_idx) for out_date, out_idx in outflows
+            if rows[out_idx][ACCT] != in_row[ACCT] and rows[out_idx][CUR] == in_row[CUR]
+            and abs(rows[out_idx][AMT]) == abs(in_row[AMT]) and abs(out_date - date) <= window
+        ]
+        if candidates:
+            _, out_date, out_idx = min(candidates)
+            outflows.remove((out_date, out_idx))
+            pairs.append((out_idx, in_idx))
+    return pairs
+
+
+def random_rows(rng, count):
+    accounts = [f'Account {i}' for i in range(rng.randint(1, 5))]
+    rows = []
+    for _ in range(count):
+        amount_type = rng.choice([AmountType.IN, AmountType.OUT, AmountType.UNKNOWN])
+        amount = Decimal(rng.randint(0, 4))
+        rows.append({
+            ACCT: rng.choice(accounts), CUR: rng.choice(['CAD', 'USD']),
+            DATE: datetime.date(2023, 1, 1) + datetime.timedelta(days=rng.randint(0, 15)),
+            AMT: -amount if amount_type == AmountType.OUT else amount, AMT_TYPE: amount_type,
+        })
+    return rows
+
+
+@pytest.mark.parametrize('max_days', [0, 1, 3])
+def test_match_transfers_random(max_days):
+    rng = random.Random(max_days)
+    for _ in range(1000):
+        rows = random_rows(rng, rng.randint(0, 40))
+        assert match_transfers(rows, max_days) == brute_force_match(rows, max_days)